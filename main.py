@@ -11,7 +11,7 @@ async def query_loop(retrieval_system: EmbeddingRetrievalSystem):
         try:
             response = await retrieval_system.generate_response(query)
             print("\nResponse:")
-            print(response.Result())
+            print(response)
         except Exception as e:
             print(f"Error processing query: {str(e)}")
 
@@ -1,9 +1,13 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import asyncio
 import os
+import queue
 from src.config import Config
 from src.retrieval_system import EmbeddingRetrievalSystem
+from src.worker import BackgroundWorker
+
+# How often the Tk thread picks up progress and results from the worker
+POLL_MS = 100
 
 class RetrievalSystemApp:
     def __init__(self, master):
@@ -14,12 +18,18 @@ class RetrievalSystemApp:
 
         self.config = Config("config/config.yaml")
         self.retrieval_system = EmbeddingRetrievalSystem(self.config)
+        # Searches, ingests and rebuilds run on the worker's event loop; Tk is
+        # only touched from this thread, which polls the worker's updates
+        self.worker = BackgroundWorker()
+        self.updates = queue.Queue()
+        self.operation = None
 
         self.style = ttk.Style()
         self.style.theme_use('clam')
         self.configure_styles()
 
         self.create_widgets()
+        self.master.after(POLL_MS, self.poll_updates)
 
     def configure_styles(self):
         self.style.configure('TButton', padding=5, font=('Helvetica', 10))
@@ -42,7 +52,15 @@ class RetrievalSystemApp:
         self.status_bar = ttk.Label(self.main_frame, text="Ready", relief=tk.SUNKEN, anchor=tk.W)
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
 
-        ttk.Button(self.main_frame, text="Rebuild Index", command=self.rebuild_index).pack(pady=10)
+        operation_frame = ttk.Frame(self.main_frame)
+        operation_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=5)
+        ttk.Button(operation_frame, text="Rebuild Index", command=self.rebuild_index).pack(side=tk.LEFT, padx=5)
+        self.progress_bar = ttk.Progressbar(operation_frame, orient="horizontal", length=300, mode="determinate", maximum=100)
+        self.progress_bar.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=5)
+        self.progress_label = ttk.Label(operation_frame, text="")
+        self.progress_label.pack(side=tk.LEFT, padx=5)
+        self.cancel_button = ttk.Button(operation_frame, text="Cancel", command=self.cancel_operation, state="disabled")
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
 
     def create_query_tab(self):
         query_frame = ttk.Frame(self.notebook, padding="10")
@@ -87,9 +105,6 @@ class RetrievalSystemApp:
         self.add_docs_label = ttk.Label(add_docs_frame, text="")
         self.add_docs_label.pack(pady=10)
 
-        self.progress_bar = ttk.Progressbar(add_docs_frame, orient="horizontal", length=300, mode="indeterminate")
-        self.progress_bar.pack(pady=10)
-
     def create_view_docs_tab(self):
         view_docs_frame = ttk.Frame(self.notebook, padding="10")
         self.notebook.add(view_docs_frame, text="View Documents")
@@ -107,15 +122,87 @@ class RetrievalSystemApp:
 
         ttk.Button(view_docs_frame, text="Refresh", command=self.refresh_documents).pack(pady=10)
 
+    def submit(self, coro, on_done):
+        """
+        Run coro on the worker; on_done(future) is called on the Tk thread when it finishes.
+        """
+        future = self.worker.submit(coro)
+        future.add_done_callback(lambda f: self.updates.put((on_done, f)))
+        return future
+
+    def report_progress(self, progress):
+        # Called on the worker thread; only the Tk thread may update widgets
+        self.updates.put((self.show_progress, progress))
+
+    def poll_updates(self):
+        while True:
+            try:
+                handler, value = self.updates.get_nowait()
+            except queue.Empty:
+                break
+            handler(value)
+        self.master.after(POLL_MS, self.poll_updates)
+
+    def show_progress(self, progress):
+        if self.operation is None:
+            return
+        fraction = progress.fraction
+        if fraction is not None:
+            self.progress_bar['value'] = fraction * 100
+        if progress.files_total is not None:
+            counts = f"{progress.files_done}/{progress.files_total} files, {progress.chunks_done} chunks"
+        else:
+            counts = f"{progress.chunks_done}/{progress.chunks_total} chunks"
+        self.progress_label.config(text=f"{counts}, {progress.rate:.0f} chunks/s")
+
+    def start_operation(self, coro, status, on_done):
+        """
+        Start a long operation with progress and cancellation; one runs at a time.
+        """
+        if self.operation is not None:
+            coro.close()
+            messagebox.showwarning("Busy", "Wait for the current operation to finish or cancel it.")
+            return
+        self.status_bar.config(text=status)
+        self.progress_bar['value'] = 0
+        self.progress_label.config(text="")
+        self.cancel_button.config(state="normal")
+
+        def finish(future):
+            self.operation = None
+            self.cancel_button.config(state="disabled")
+            if future.cancelled():
+                self.status_bar.config(text="Cancelled")
+            elif future.exception() is not None:
+                self.status_bar.config(text="Failed")
+                messagebox.showerror("Error", str(future.exception()))
+            else:
+                self.progress_bar['value'] = 100
+                on_done(future.result())
+
+        self.operation = self.submit(coro, finish)
+
+    def cancel_operation(self):
+        if self.operation is not None:
+            self.status_bar.config(text="Cancelling...")
+            self.operation.request_cancel()
+
     def run_query(self):
         query = self.query_entry.get()
         k = int(self.k_entry.get())
         if query:
             self.status_bar.config(text="Searching...")
-            self.master.update_idletasks()
-            response = asyncio.run(self.retrieval_system.generate_response(query, k))
-            self.update_query_result(response)
-            self.status_bar.config(text="Search completed")
+
+            def show(future):
+                if future.exception() is not None:
+                    self.status_bar.config(text="Search failed")
+                    messagebox.showerror("Error", str(future.exception()))
+                    return
+                self.update_query_result(future.result())
+                self.status_bar.config(text="Search completed")
+
+            # Searches also run during an ingest or rebuild
+            self.submit(self.retrieval_system.generate_response(query, k), show)
         else:
             messagebox.showwarning("Empty Query", "Please enter a query.")
 
@@ -129,32 +216,34 @@ class RetrievalSystemApp:
     def add_documents(self):
         directory = filedialog.askdirectory()
         if directory:
-            self.progress_bar.start()
-            self.add_docs_label.config(text="Adding documents...")
-            self.master.update_idletasks()
-            asyncio.run(self.retrieval_system.add_documents(directory))
-            self.progress_bar.stop()
-            self.add_docs_label.config(text=f"Documents added from {directory}")
-            self.refresh_documents()
-            self.status_bar.config(text="Documents added successfully")
+            def done(_):
+                self.add_docs_label.config(text=f"Documents added from {directory}")
+                self.refresh_documents()
+                self.status_bar.config(text="Documents added successfully")
+
+            self.start_operation(
+                self.retrieval_system.add_documents(directory, self.report_progress), "Adding documents...", done
+            )
         else:
             self.add_docs_label.config(text="No directory selected")
 
     def refresh_documents(self):
         self.docs_tree.delete(*self.docs_tree.get_children())
-        documents = self.retrieval_system.db.get_all_documents()
+        documents = self.retrieval_system.db.reader().get_all_documents()
         for doc in documents:
             self.docs_tree.insert("", "end", values=(doc['filename'], doc.get('filepath', 'N/A')))
         self.status_bar.config(text="Document list refreshed")
 
     def rebuild_index(self):
-        self.status_bar.config(text="Rebuilding index...")
-        self.master.update_idletasks()
-        asyncio.run(self.retrieval_system.rebuild_index())
-        messagebox.showinfo("Index Rebuilt", "The index has been successfully rebuilt from the database.")
-        self.status_bar.config(text="Index rebuilt successfully")
+        def done(_):
+            messagebox.showinfo("Index Rebuilt", "The index has been successfully rebuilt from the database.")
+            self.status_bar.config(text="Index rebuilt successfully")
+
+        self.start_operation(self.retrieval_system.rebuild_index(self.report_progress), "Rebuilding index...", done)
 
     def on_closing(self):
+        # Cancels a running ingest or rebuild, which saves what it has written
+        self.worker.stop()
         self.retrieval_system.close()
         self.master.destroy()
 
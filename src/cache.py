@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings keyed by (model name, normalized query).
+    Entries older than ttl seconds are treated as misses. With a path set, the
+    cache is written as an .npz file by save() and reloaded on construction.
+    """
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None, path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, model_name: str, query: str) -> Optional[np.ndarray]:
+        key = (model_name, query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[0]):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, model_name: str, query: str, embedding: np.ndarray):
+        if self.max_size <= 0:
+            return
+        key = (model_name, query)
+        with self._lock:
+            self._entries[key] = (time.time(), np.asarray(embedding, dtype=np.float32))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def save(self):
+        """
+        Persist live entries in LRU order. Entries whose dimension differs from
+        the most recent one (a previous model) are dropped.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            entries = [(key, value) for key, value in self._entries.items() if not self._expired(value[0])]
+        if entries:
+            dim = entries[-1][1][1].shape[-1]
+            entries = [(key, value) for key, value in entries if value[1].shape[-1] == dim]
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                models=np.array([key[0] for key, _ in entries], dtype=str),
+                queries=np.array([key[1] for key, _ in entries], dtype=str),
+                created_at=np.array([value[0] for _, value in entries], dtype=np.float64),
+                embeddings=np.vstack([value[1] for _, value in entries]) if entries else np.empty((0, 0), dtype=np.float32),
+            )
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        with np.load(self.path) as data:
+            for model_name, query, created_at, embedding in zip(
+                data['models'], data['queries'], data['created_at'], data['embeddings']
+            ):
+                if not self._expired(float(created_at)):
+                    self._entries[(str(model_name), str(query))] = (float(created_at), embedding)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        print(f"Loaded {len(self._entries)} cached query embeddings from {self.path}")
+
+class DocumentTextCache:
+    """
+    Bounded LRU cache of decompressed document texts, keyed by (document id,
+    content hash). Document ids are never reused (AUTOINCREMENT), so an entry
+    cannot serve a deleted document's text to a newer one. Shared by a
+    Database and its read-only views.
+    """
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[int, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Tuple[int, str]) -> Optional[str]:
+        with self._lock:
+            text = self._entries.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, key: Tuple[int, str], text: str):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,104 @@
+import re
+from typing import Callable, List, Optional, Tuple
+
+# A sentence ends at ., ! or ? followed by whitespace; the punctuation stays with it
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence for sentence in _SENTENCE_END.split(text.strip()) if sentence]
+
+class SentenceChunker:
+    """
+    Groups every sentences_per_chunk sentences into a chunk. Lengths are in
+    characters, which is enough to order chunks for batching without loading
+    a tokenizer.
+    """
+    def __init__(self, sentences_per_chunk: int):
+        self.sentences_per_chunk = sentences_per_chunk
+
+    def split(self, text: str) -> Tuple[List[str], List[int]]:
+        sentences = split_sentences(text)
+        n = self.sentences_per_chunk
+        chunks = [' '.join(sentences[i:i + n]) for i in range(0, len(sentences), n)]
+        return chunks, [len(chunk) for chunk in chunks]
+
+class TokenChunker:
+    """
+    Packs whole sentences into chunks of at most max_tokens tokens, as counted
+    by count_tokens (a batch of texts -> token counts), so nothing is cut off at
+    the model's max sequence length. A sentence over the budget is split at
+    word boundaries. Each chunk after the first starts with the trailing
+    sentences of the previous one, up to overlap tokens of them.
+    """
+    def __init__(self, count_tokens: Callable[[List[str]], List[int]], max_tokens: int, overlap: int = 0):
+        if max_tokens < 1:
+            raise ValueError(f"max_tokens must be positive, got {max_tokens}")
+        if not 0 <= overlap < max_tokens:
+            raise ValueError(f"overlap must be in [0, max_tokens), got {overlap}")
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+
+    def _pieces(self, text: str) -> List[Tuple[str, int]]:
+        sentences = split_sentences(text)
+        pieces = []
+        for sentence, tokens in zip(sentences, self.count_tokens(sentences) if sentences else []):
+            if tokens <= self.max_tokens:
+                pieces.append((sentence, tokens))
+                continue
+            words = sentence.split()
+            current, current_tokens = [], 0
+            for word, word_tokens in zip(words, self.count_tokens(words)):
+                if current and current_tokens + word_tokens > self.max_tokens:
+                    pieces.append((' '.join(current), current_tokens))
+                    current, current_tokens = [], 0
+                current.append(word)
+                current_tokens += word_tokens
+            if current:
+                pieces.append((' '.join(current), current_tokens))
+        return pieces
+
+    def split(self, text: str) -> Tuple[List[str], List[int]]:
+        """
+        Returns:
+        Tuple[List[str], List[int]]: The chunks and their token counts.
+        """
+        chunks, lengths = [], []
+        current, current_tokens = [], 0
+        for piece, tokens in self._pieces(text):
+            if current and current_tokens + tokens > self.max_tokens:
+                chunks.append(' '.join(p for p, _ in current))
+                lengths.append(current_tokens)
+                carried, carried_tokens = [], 0
+                for p, t in reversed(current):
+                    if carried_tokens + t > self.overlap or carried_tokens + t + tokens > self.max_tokens:
+                        break
+                    carried.insert(0, (p, t))
+                    carried_tokens += t
+                current, current_tokens = carried, carried_tokens
+            current.append((piece, tokens))
+            current_tokens += tokens
+        if current:
+            chunks.append(' '.join(p for p, _ in current))
+            lengths.append(current_tokens)
+        return chunks, lengths
+
+def count_words(texts: List[str]) -> List[int]:
+    return [len(text.split()) for text in texts]
+
+def chunk_spans(text: str, chunks: List[str]) -> List[Optional[Tuple[int, int]]]:
+    """
+    (start, end) of each chunk in text, so that text[start:end] == chunk, found
+    left to right. A chunk whose whitespace the chunker normalized is not a
+    substring of text and gets None.
+    """
+    spans, position = [], 0
+    for chunk in chunks:
+        start = text.find(chunk, position)
+        if start < 0:
+            spans.append(None)
+            continue
+        spans.append((start, start + len(chunk)))
+        # Overlapping chunks start inside the previous one
+        position = start + 1
+    return spans
@@ -5,8 +5,95 @@ class Config:
             self.config = yaml.safe_load(file)
         self.model_name = self.config['model_name']
         self.chunk_size = self.config['chunk_size']
+        # Token-aware chunking: whole sentences are packed into chunks of at most
+        # chunk_tokens model tokens (capped at the model's max sequence length),
+        # each repeating up to chunk_overlap tokens of the previous chunk's last
+        # sentences. Unset, chunks are chunk_size sentences.
+        self.chunk_tokens = self.config.get('chunk_tokens')
+        self.chunk_overlap = self.config.get('chunk_overlap', 0)
         self.batch_size = self.config['batch_size']
         self.documents_path = self.config['documents_path']
         self.db_path = self.config['db_path']
         self.index_path = self.config['index_path']
-        self.processed_files_path = self.config['processed_files_path']
\ No newline at end of file
+        self.processed_files_path = self.config['processed_files_path']
+        # Number of documents between index/processed-file checkpoints during
+        # add_documents; 0 persists only once at the end of the run.
+        self.checkpoint_interval = self.config.get('checkpoint_interval', 0)
+        # FAISS index structure and tuning (see indexing.DEFAULT_INDEX_PARAMS)
+        self.index_params = self.config.get('index', {'type': 'flat'})
+        # Query embedding cache: size 0 disables it, ttl in seconds (None never
+        # expires), path persists it across restarts (None keeps it in memory)
+        self.query_cache_size = self.config.get('query_cache_size', 1024)
+        self.query_cache_ttl = self.config.get('query_cache_ttl')
+        self.query_cache_path = self.config.get('query_cache_path')
+        # Ingest pipeline: reader/chunker threads and the depth of the bounded
+        # queues between the read, encode and write stages
+        self.ingest_workers = self.config.get('ingest_workers', 4)
+        self.ingest_queue_size = self.config.get('ingest_queue_size', 64)
+        # Rows fetched per batch while streaming embeddings into a rebuilt index
+        self.rebuild_batch_size = self.config.get('rebuild_batch_size', 4096)
+        # Optional memory-mapped copy of every embedding next to the database;
+        # None keeps embeddings only in SQLite. Its dtype follows embedding_precision
+        # unless vector_store_dtype is set.
+        self.vector_store_path = self.config.get('vector_store_path')
+        # Precision of stored embeddings (SQLite BLOBs, vector store and index
+        # codes): float32, float16 or int8
+        self.embedding_precision = self.config.get('embedding_precision', 'float32')
+        self.vector_store_dtype = self.config.get('vector_store_dtype', self.embedding_precision)
+        # Query service (src/server.py): listen address and micro-batching limits
+        self.server_host = self.config.get('server_host', '127.0.0.1')
+        self.server_port = self.config.get('server_port', 8000)
+        self.max_batch_size = self.config.get('max_batch_size', 64)
+        self.max_batch_wait_ms = self.config.get('max_batch_wait_ms', 5)
+        # Where ingest encoding runs: 'thread' shares the loaded model across
+        # encode_workers threads, 'process' loads one model per worker process.
+        # torch_threads caps each model's intra-op threads (None leaves torch's default).
+        self.encode_executor = self.config.get('encode_executor', 'thread')
+        self.encode_workers = self.config.get('encode_workers', 1)
+        self.torch_threads = self.config.get('torch_threads')
+        # Startup: embedding_dim lets a new index be created before the model has
+        # loaded (None asks the model), preload_model loads the model in the
+        # background instead of on the first encode, and index_mmap maps a saved
+        # index read-only instead of reading it into memory
+        self.embedding_dim = self.config.get('embedding_dim')
+        self.preload_model = self.config.get('preload_model', True)
+        self.index_mmap = self.config.get('index_mmap', True)
+        # Metrics (src/metrics.py): metrics_path receives a JSON snapshot every
+        # metrics_interval seconds and on close (None keeps them in memory only;
+        # the query server also exposes them at GET /metrics)
+        self.metrics_path = self.config.get('metrics_path')
+        self.metrics_interval = self.config.get('metrics_interval', 60)
+        # Filtered search: ID sets up to this size are scored exactly from their
+        # own embeddings; larger ones are filtered inside the FAISS scan
+        self.filter_exact_max = self.config.get('filter_exact_max', 256)
+        # Index only the first chunk of each distinct text, so copies of a
+        # passage across documents do not crowd out other results
+        self.dedup_index = self.config.get('dedup_index', True)
+        # Ingest sorts the chunks of this many encode batches by length before
+        # batching them, so each batch pads to similar lengths; 1 keeps file order
+        self.encode_sort_batches = self.config.get('encode_sort_batches', 8)
+        # Concurrent searches: threads running index searches and SQLite lookups,
+        # each with its own read-only connection (WAL lets them read while ingest
+        # writes). sqlite_pragmas override the defaults in src/database.py.
+        self.search_workers = self.config.get('search_workers', 4)
+        self.sqlite_pragmas = self.config.get('sqlite_pragmas', {})
+        # Watch mode (EmbeddingRetrievalSystem.watch, server --watch): changes
+        # are ingested once none has arrived for watch_debounce seconds.
+        # watch_backend is auto (inotify on Linux, else polling), inotify or
+        # poll; polling rescans the tree every watch_poll_interval seconds.
+        self.watch_debounce = self.config.get('watch_debounce', 1.0)
+        self.watch_poll_interval = self.config.get('watch_poll_interval', 2.0)
+        self.watch_backend = self.config.get('watch_backend', 'auto')
+        # Compact text storage: documents are stored zlib-compressed and chunks
+        # as offsets into them, with the last document_cache_size documents
+        # kept decompressed for hydration. Rows written without it stay
+        # readable (Database.compress_stored_text converts them).
+        self.compress_text = self.config.get('compress_text', False)
+        self.document_cache_size = self.config.get('document_cache_size', 256)
+        # Read-only serving (server --read-only / --workers): the index stays
+        # memory-mapped and the database is opened read-only, while another
+        # process ingests. Every index_reload_interval seconds a search checks
+        # the index's generation file and reopens the index once the writer
+        # has compacted it.
+        self.read_only = self.config.get('read_only', False)
+        self.index_reload_interval = self.config.get('index_reload_interval', 1.0)
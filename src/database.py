@@ -1,72 +1,707 @@
+import hashlib
+import json
+import os
+import queue
 import sqlite3
-from typing import List, Dict
+import threading
+import time
+import urllib.request
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .cache import DocumentTextCache
+from .chunking import chunk_spans
+from .quantization import decode_embeddings
+
+# WAL lets readers run alongside the writer; with it, synchronous=NORMAL only
+# syncs at checkpoints and a crash still cannot corrupt the database.
+# cache_size is in KiB when negative and applies per connection.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -65536,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+
+# zlib's default level: most of the ratio of level 9 on prose at a fraction of the time
+TEXT_COMPRESSION_LEVEL = 6
+
+def content_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+def _apply_pragmas(conn: sqlite3.Connection, pragmas: Dict):
+    for name, value in pragmas.items():
+        conn.execute(f'PRAGMA {name} = {value}')
 
 class Database:
-    def __init__(self, db_path: str):
-        self.conn = sqlite3.connect(db_path)
+    """
+    SQLite store of documents, chunks and their embeddings.
+
+    Every method runs on one writer connection, serialized by a lock, so
+    ingest and maintenance may call in from any thread. reader() returns a
+    view offering the same read methods over a pool of up to read_pool_size
+    read-only connections: in WAL mode these run alongside the writer and each
+    other and see the last committed state, so searches never queue behind an
+    ingest transaction. An in-memory database cannot be shared between
+    connections, and its reader() is the writer itself.
+
+    With compress_text, documents are stored zlib-compressed and chunks as
+    (span_start, span_end) offsets into their document instead of a second
+    copy of the text; reads decompress and slice, keeping the last
+    document_cache_size documents decompressed. Rows written either way can
+    be read either way.
+
+    With read_only, every connection is opened read-only on an existing
+    database, for processes that serve queries while another one writes.
+    """
+    def __init__(self, db_path: str, embedding_dim: int = None, read_pool_size: int = 4, pragmas: Dict = None,
+                 compress_text: bool = False, document_cache_size: int = 256, read_only: bool = False):
+        # Needed to tell reduced-precision BLOBs apart; without it BLOBs are read as float32
+        self.embedding_dim = embedding_dim
+        self.db_path = db_path
+        self.read_only = read_only
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        if read_only:
+            self.conn = self._connect_read_only()
+        else:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            _apply_pragmas(self.conn, self.pragmas)
         self.cursor = self.conn.cursor()
+        self._lock = threading.RLock()
+        self._read_pool_size = read_pool_size
+        self._read_pool = queue.LifoQueue()
+        self._readers = []
+        self._reader_view = None
+        self.compress_text = compress_text
+        self._documents = DocumentTextCache(document_cache_size)
+        if not read_only:
+            self._create_tables()
+
+    @contextmanager
+    def _cursor(self):
+        with self._lock:
+            yield self.cursor
+
+    @contextmanager
+    def _connection(self):
+        with self._lock:
+            yield self.conn
+
+    def reader(self) -> 'Database':
+        """
+        Read-only view of this database for concurrent readers such as searches.
+        """
+        if self.db_path == ':memory:' or self._read_pool_size < 1:
+            return self
+        if self._reader_view is None:
+            self._reader_view = _ReadView(self)
+        return self._reader_view
+
+    @contextmanager
+    def _read_connection(self):
+        try:
+            conn = self._read_pool.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if len(self._readers) < self._read_pool_size:
+                    conn = self._connect_read_only()
+                    self._readers.append(conn)
+            if conn is None:
+                conn = self._read_pool.get()
+        try:
+            yield conn
+        finally:
+            self._read_pool.put(conn)
+
+    def _connect_read_only(self) -> sqlite3.Connection:
+        if not os.path.exists(self.db_path):
+            raise FileNotFoundError(f"No database found at {self.db_path}")
+        uri = f"file:{urllib.request.pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        # journal_mode belongs to the file and is set by the writer
+        _apply_pragmas(conn, {k: v for k, v in self.pragmas.items() if k != 'journal_mode'})
+        return conn
 
     def _create_tables(self):
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS documents (
-                id INTEGER PRIMARY KEY,
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
                 filename TEXT,
-                content TEXT
+                content TEXT,
+                created_at REAL,
+                content_hash TEXT
             )
         ''')
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS chunks (
-                id INTEGER PRIMARY KEY,
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
                 document_id INTEGER,
                 content TEXT,
                 embedding BLOB,
+                content_hash TEXT,
                 FOREIGN KEY (document_id) REFERENCES documents (id)
             )
         ''')
+        # Columns added after the first release. Existing rows keep NULL: their
+        # documents never match a date filter, and their chunks are neither
+        # reused nor deduplicated until re-ingested.
+        self._add_missing_columns('documents', {'created_at': 'REAL', 'content_hash': 'TEXT', 'content_z': 'BLOB'})
+        self._add_missing_columns('chunks', {'content_hash': 'TEXT', 'span_start': 'INTEGER', 'span_end': 'INTEGER'})
+        self._use_autoincrement_ids()
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunks_content_hash ON chunks (content_hash)')
+        # Replacing or deleting a document looks its chunks up by document and
+        # the document by filename; without these both are full table scans
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunks_document_id ON chunks (document_id)')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_documents_filename ON documents (filename)')
+        # chunk_changes counts the transactions that added or deleted chunks;
+        # indexed_changes is its value at the last index save (see chunk_changes()),
+        # and stale_vectors the vectors that index held for deleted chunks
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS index_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                chunk_changes INTEGER NOT NULL DEFAULT 0,
+                indexed_changes INTEGER NOT NULL DEFAULT 0,
+                stale_vectors INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        self._add_missing_columns('index_state', {'stale_vectors': 'INTEGER NOT NULL DEFAULT 0'})
+        self.cursor.execute('INSERT OR IGNORE INTO index_state (id) VALUES (1)')
         self.conn.commit()
 
-    def add_document(self, filename: str, content: str) -> int:
-        self.cursor.execute(
-            'INSERT INTO documents (filename, content) VALUES (?, ?)',
-            (filename, content)
-        )
+    def _use_autoincrement_ids(self):
+        # Chunk ids key the index's vectors. Without AUTOINCREMENT SQLite gives
+        # the next chunk the highest deleted id, and an index still holding the
+        # deleted chunk's vector (a read-only worker's until the next
+        # compaction) would return it for the new chunk's text. Document ids
+        # key the document text cache, which would likewise slice a new
+        # document's spans from a deleted one's text. Tables created before
+        # are copied into ones that never reuse ids.
+        self._migrate_to_autoincrement('documents', {
+            'filename': 'TEXT', 'content': 'TEXT', 'created_at': 'REAL', 'content_hash': 'TEXT', 'content_z': 'BLOB',
+        })
+        self._migrate_to_autoincrement('chunks', {
+            'document_id': 'INTEGER', 'content': 'TEXT', 'embedding': 'BLOB', 'content_hash': 'TEXT',
+            'span_start': 'INTEGER', 'span_end': 'INTEGER',
+        }, 'FOREIGN KEY (document_id) REFERENCES documents (id)')
+
+    def _migrate_to_autoincrement(self, table: str, columns: Dict[str, str], constraints: str = None):
+        sql = self.cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+        if 'AUTOINCREMENT' in sql.upper():
+            return
+        definitions = ['id INTEGER PRIMARY KEY AUTOINCREMENT'] + [f'{name} {kind}' for name, kind in columns.items()]
+        if constraints:
+            definitions.append(constraints)
+        names = ', '.join(['id', *columns])
+        self.cursor.execute('BEGIN')
+        self.cursor.execute(f'CREATE TABLE {table}_autoincrement ({", ".join(definitions)})')
+        self.cursor.execute(f'INSERT INTO {table}_autoincrement ({names}) SELECT {names} FROM {table}')
+        self.cursor.execute(f'DROP TABLE {table}')
+        self.cursor.execute(f'ALTER TABLE {table}_autoincrement RENAME TO {table}')
         self.conn.commit()
-        return self.cursor.lastrowid
+        print(f"Migrated the {table} table of {self.db_path} to ids that are never reused")
+
+    def _add_missing_columns(self, table: str, columns: Dict[str, str]):
+        existing = {row[1] for row in self.cursor.execute(f'PRAGMA table_info({table})')}
+        for name, column_type in columns.items():
+            if name not in existing:
+                self.cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+
+    def add_document(self, filename: str, content: str, commit: bool = True, complete: bool = True) -> int:
+        """
+        Insert a document row. With complete=False its content hash stays unset
+        until mark_complete(), so a document whose chunks are written over
+        several transactions is not taken for unchanged if they are interrupted.
+        """
+        compressed = zlib.compress(content.encode('utf-8'), TEXT_COMPRESSION_LEVEL) if self.compress_text else None
+        with self._cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO documents (filename, content, content_z, created_at, content_hash) VALUES (?, ?, ?, ?, ?)',
+                (filename, None if self.compress_text else content, compressed, time.time(),
+                 content_hash(content) if complete else None)
+            )
+            if commit:
+                self.conn.commit()
+            return cursor.lastrowid
+
+    def mark_complete(self, document_id: int, text_hash: str, commit: bool = True):
+        """
+        Record the content hash of a document added with complete=False, once
+        its last chunk is written.
+        """
+        with self._cursor() as cursor:
+            cursor.execute('UPDATE documents SET content_hash = ? WHERE id = ?', (text_hash, document_id))
+            if commit:
+                self.conn.commit()
 
     def add_chunk(self, document_id: int, content: str, embedding: bytes):
-        self.cursor.execute(
-            'INSERT INTO chunks (document_id, content, embedding) VALUES (?, ?, ?)',
-            (document_id, content, embedding)
-        )
-        self.conn.commit()
+        with self._cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO chunks (document_id, content, embedding, content_hash) VALUES (?, ?, ?, ?)',
+                (document_id, content, embedding, content_hash(content))
+            )
+            self._count_change(cursor)
+            self.conn.commit()
+
+    def add_chunks(self, document_id: int, contents: List[str], embeddings: List[bytes], commit: bool = True,
+                   spans: List[Optional[Tuple[int, int]]] = None) -> List[int]:
+        """
+        Insert a batch of chunks for one document with a single executemany.
+
+        Args:
+        document_id (int): Parent document row id.
+        contents (List[str]): Chunk texts.
+        embeddings (List[bytes]): Serialized embeddings, parallel to contents.
+        commit (bool): Commit immediately. Pass False to group several batches
+            (e.g. a whole document) into one transaction and call commit() after.
+        spans (List, optional): (start, end) of each chunk in the document text
+            (see chunking.chunk_spans). With compress_text, a chunk with a span
+            is stored as the span alone.
+
+        Returns:
+        List[int]: Row ids of the inserted chunks, in input order.
+        """
+        with self._cursor() as cursor:
+            if not (self.compress_text and spans):
+                spans = [None] * len(contents)
+            cursor.executemany(
+                'INSERT INTO chunks (document_id, content, embedding, content_hash, span_start, span_end) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    (document_id, None if span else content, embedding, content_hash(content), *(span or (None, None)))
+                    for content, embedding, span in zip(contents, embeddings, spans)
+                ]
+            )
+            # executemany does not report row ids; the batch is the newest rows of
+            # this document within the open transaction.
+            cursor.execute(
+                'SELECT id FROM chunks WHERE document_id = ? ORDER BY id DESC LIMIT ?',
+                (document_id, len(contents))
+            )
+            ids = [row[0] for row in cursor.fetchall()][::-1]
+            self._count_change(cursor)
+            if commit:
+                self.conn.commit()
+            return ids
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+
+    def _count_change(self, cursor: sqlite3.Cursor):
+        cursor.execute('UPDATE index_state SET chunk_changes = chunk_changes + 1')
+
+    def chunk_changes(self) -> Tuple[int, int]:
+        """
+        (chunk_changes, indexed_changes): the first moves with every write that
+        adds or deletes chunks, in the same transaction; the second is what the
+        first was when the index was last saved (mark_indexed). They differ
+        when chunks changed after the last index save, e.g. before a crash.
+        """
+        with self._cursor() as cursor:
+            cursor.execute('SELECT chunk_changes, indexed_changes FROM index_state')
+            return cursor.fetchone()
+
+    def mark_indexed(self, changes: int, stale_vectors: int = 0):
+        """
+        Record a saved index: the chunk_changes it reflects, and how many of its
+        vectors belong to deleted chunks (index types that cannot remove keep
+        them until a rebuild).
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                'UPDATE index_state SET indexed_changes = ?, stale_vectors = ?', (changes, stale_vectors)
+            )
+            self.conn.commit()
+
+    def stale_vectors(self) -> int:
+        with self._cursor() as cursor:
+            cursor.execute('SELECT stale_vectors FROM index_state')
+            return cursor.fetchone()[0]
+
+    def delete_document(self, filename: str, commit: bool = True) -> List[int]:
+        """
+        Delete every stored copy of a document and its chunks.
+
+        Returns:
+        List[int]: Row ids of the deleted chunks, for removal from the index.
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                'SELECT chunks.id FROM chunks JOIN documents ON chunks.document_id = documents.id '
+                'WHERE documents.filename = ?',
+                (filename,)
+            )
+            chunk_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute(
+                'DELETE FROM chunks WHERE document_id IN (SELECT id FROM documents WHERE filename = ?)',
+                (filename,)
+            )
+            cursor.execute('DELETE FROM documents WHERE filename = ?', (filename,))
+            if chunk_ids:
+                self._count_change(cursor)
+            if commit:
+                self.conn.commit()
+            return chunk_ids
+
+    def get_document_hash(self, filename: str) -> Optional[str]:
+        with self._cursor() as cursor:
+            cursor.execute(
+                'SELECT content_hash FROM documents WHERE filename = ? ORDER BY id DESC LIMIT 1', (filename,)
+            )
+            row = cursor.fetchone()
+            return row[0] if row else None
 
     def document_exists(self, filename: str) -> bool:
-        query = "SELECT COUNT(*) FROM documents WHERE filename = ?"
-        self.cursor.execute(query, (filename,))
-        return self.cursor.fetchone()[0] > 0
+        with self._cursor() as cursor:
+            query = "SELECT COUNT(*) FROM documents WHERE filename = ?"
+            cursor.execute(query, (filename,))
+            return cursor.fetchone()[0] > 0
 
     def get_document(self, document_id: int) -> Dict[str, str]:
-        self.cursor.execute('SELECT filename, content FROM documents WHERE id = ?', (document_id,))
-        result = self.cursor.fetchone()
-        return {'filename': result[0], 'content': result[1]} if result else None
+        with self._cursor() as cursor:
+            cursor.execute('SELECT filename, content_hash, content, content_z FROM documents WHERE id = ?', (document_id,))
+            result = cursor.fetchone()
+            if not result:
+                return None
+            text = result[2] if result[2] is not None else self._document_text((document_id, result[1]), result[3])
+            return {'filename': result[0], 'content': text}
     
     def get_all_documents(self) -> Dict[str, str]:
-        self.cursor.execute('SELECT id, filename FROM documents')
-        return [{'id': row[0], 'filename': row[1]} for row in self.cursor.fetchall()]
+        with self._cursor() as cursor:
+            cursor.execute('SELECT id, filename FROM documents')
+            return [{'id': row[0], 'filename': row[1]} for row in cursor.fetchall()]
 
     def get_chunk(self, chunk_id: int) -> Dict[str, str]:
-        self.cursor.execute('SELECT content FROM chunks WHERE id = ?', (chunk_id,))
-        result = self.cursor.fetchone()
-        return {'content': result[0]} if result else None
+        with self._cursor() as cursor:
+            cursor.execute(f'SELECT {_CHUNK_TEXT_COLUMNS} FROM chunks {_CHUNK_DOCUMENT_JOIN} WHERE chunks.id = ?', (chunk_id,))
+            rows = cursor.fetchall()
+            return {'content': self._chunk_texts(rows)[0]} if rows else None
+
+    def get_chunks(self, chunk_ids: List[int]) -> List[Dict]:
+        """
+        Fetch many chunks, with their document filename, in one query. The ids
+        are bound as a single JSON array, so the lookup is not limited by
+        SQLite's host-parameter cap.
+
+        Returns:
+        List[Dict]: id, content and filename per chunk, in the order of chunk_ids;
+            ids with no stored chunk are skipped.
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                f'SELECT {_CHUNK_TEXT_COLUMNS}, chunks.id, documents.filename '
+                'FROM json_each(?) AS ids '
+                'JOIN chunks ON chunks.id = ids.value '
+                f'{_CHUNK_DOCUMENT_JOIN} '
+                'ORDER BY ids.key',
+                (json.dumps([int(chunk_id) for chunk_id in chunk_ids]),)
+            )
+            rows = cursor.fetchall()
+            texts = self._chunk_texts(rows)
+            return [{'id': row[6], 'content': text, 'filename': row[7]} for row, text in zip(rows, texts)]
 
     def get_all_chunks(self) -> List[Dict[str, str]]:
-        self.cursor.execute('SELECT id, content FROM chunks')
-        return [{'id': row[0], 'content': row[1]} for row in self.cursor.fetchall()]
+        with self._cursor() as cursor:
+            cursor.execute(f'SELECT {_CHUNK_TEXT_COLUMNS}, chunks.id FROM chunks {_CHUNK_DOCUMENT_JOIN}')
+            rows = cursor.fetchall()
+            return [{'id': row[6], 'content': text} for row, text in zip(rows, self._chunk_texts(rows))]
     
     def get_all_chunks_with_embeddings(self) -> List[Dict]:
-        query = "SELECT id, content, embedding FROM chunks"
-        self.cursor.execute(query)
-        return [{"id": row[0], "content": row[1], "embedding": row[2]} for row in self.cursor.fetchall()]
+        with self._cursor() as cursor:
+            query = f"SELECT {_CHUNK_TEXT_COLUMNS}, chunks.id, chunks.embedding FROM chunks {_CHUNK_DOCUMENT_JOIN}"
+            cursor.execute(query)
+            rows = cursor.fetchall()
+            return [
+                {"id": row[6], "content": text, "embedding": row[7]}
+                for row, text in zip(rows, self._chunk_texts(rows))
+            ]
+
+    def _chunk_texts(self, rows: List[tuple]) -> List[str]:
+        # rows start with _CHUNK_TEXT_COLUMNS; a chunk stored as a span is
+        # sliced from its document's text
+        documents = {}
+        texts = []
+        for content, doc_id, doc_hash, start, end, compressed in (row[:6] for row in rows):
+            if content is None:
+                key = (doc_id, doc_hash)
+                document = documents.get(key) or self._document_text(key, compressed)
+                documents[key] = document
+                content = document[start:end]
+            texts.append(content)
+        return texts
+
+    def _document_text(self, key: Tuple[int, str], compressed: bytes) -> str:
+        text = self._documents.get(key)
+        if text is None:
+            text = zlib.decompress(compressed).decode('utf-8')
+            self._documents.put(key, text)
+        return text
+
+    def document_cache_stats(self) -> Dict[str, float]:
+        return self._documents.stats()
+
+    def compress_stored_text(self, batch_size: int = 256) -> int:
+        """
+        Rewrite documents stored as plain text, and their chunks, in the
+        compressed form, batch_size documents per transaction. Run VACUUM
+        afterwards to hand the freed pages back to the filesystem.
+
+        Returns:
+        int: Number of documents converted.
+        """
+        converted = 0
+        with self._cursor() as cursor:
+            while True:
+                cursor.execute('SELECT id, content FROM documents WHERE content IS NOT NULL LIMIT ?', (batch_size,))
+                documents = cursor.fetchall()
+                if not documents:
+                    break
+                for doc_id, content in documents:
+                    cursor.execute(
+                        'SELECT id, content FROM chunks WHERE document_id = ? AND content IS NOT NULL ORDER BY id', (doc_id,)
+                    )
+                    chunks = cursor.fetchall()
+                    spans = chunk_spans(content, [chunk for _, chunk in chunks])
+                    cursor.executemany(
+                        'UPDATE chunks SET content = NULL, span_start = ?, span_end = ? WHERE id = ?',
+                        [(span[0], span[1], chunk_id) for (chunk_id, _), span in zip(chunks, spans) if span]
+                    )
+                    cursor.execute(
+                        'UPDATE documents SET content = NULL, content_z = ? WHERE id = ?',
+                        (zlib.compress(content.encode('utf-8'), TEXT_COMPRESSION_LEVEL), doc_id)
+                    )
+                self.conn.commit()
+                converted += len(documents)
+        return converted
+
+    def iter_embedding_batches(self, batch_size: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Stream chunk ids and embeddings without loading the table, selecting
+        only the id and embedding columns.
+
+        Yields:
+        Tuple[np.ndarray, np.ndarray]: int64 ids and a contiguous float32 matrix
+            decoded from the joined BLOBs (zero-copy when stored as float32),
+            one pair per batch.
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, embedding FROM chunks ORDER BY id')
+            try:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+                    yield ids, decode_embeddings([row[1] for row in rows], self.embedding_dim)
+            finally:
+                cursor.close()
+
+    def get_embeddings(self, chunk_ids: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Fetch the embeddings of specific chunks in one query.
+
+        Returns:
+        Tuple[np.ndarray, np.ndarray]: ids found, ascending, and their float32 matrix.
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                'SELECT id, embedding FROM chunks WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id',
+                (json.dumps([int(chunk_id) for chunk_id in chunk_ids]),)
+            )
+            rows = cursor.fetchall()
+            ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            return ids, decode_embeddings([row[1] for row in rows], self.embedding_dim)
+
+    def filter_chunk_ids(self, document_ids: Optional[List[int]] = None, filename: Optional[str] = None,
+                         ingested_after: Optional[float] = None, ingested_before: Optional[float] = None) -> np.ndarray:
+        """
+        Ids of the chunks whose document matches every given condition.
+
+        Args:
+        document_ids (List[int], optional): Allowed document row ids.
+        filename (str, optional): SQLite GLOB pattern on the filename (case-sensitive).
+        ingested_after (float, optional): Unix time; documents ingested at or after it.
+        ingested_before (float, optional): Unix time; documents ingested before it.
+
+        Returns:
+        np.ndarray: Matching chunk ids, ascending.
+        """
+        with self._cursor() as cursor:
+            conditions, params = [], []
+            if document_ids is not None:
+                conditions.append('documents.id IN (SELECT value FROM json_each(?))')
+                params.append(json.dumps([int(document_id) for document_id in document_ids]))
+            if filename is not None:
+                conditions.append('documents.filename GLOB ?')
+                params.append(filename)
+            if ingested_after is not None:
+                conditions.append('documents.created_at >= ?')
+                params.append(ingested_after)
+            if ingested_before is not None:
+                conditions.append('documents.created_at < ?')
+                params.append(ingested_before)
+            where = ' AND '.join(conditions) or '1'
+            cursor.execute(
+                f'SELECT chunks.id FROM chunks JOIN documents ON documents.id = chunks.document_id WHERE {where} ORDER BY chunks.id',
+                params
+            )
+            return np.fromiter((row[0] for row in cursor), dtype=np.int64)
+
+    def get_embeddings_by_hash(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Stored embedding of any chunk with each content hash, for reuse instead
+        of encoding the same text again. Hashes with no stored chunk are absent.
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                'SELECT content_hash, MIN(embedding) FROM chunks '
+                'WHERE content_hash IN (SELECT value FROM json_each(?)) GROUP BY content_hash',
+                (json.dumps(list(hashes)),)
+            )
+            rows = cursor.fetchall()
+            embeddings = decode_embeddings([row[1] for row in rows], self.embedding_dim)
+            return {row[0]: embedding for row, embedding in zip(rows, embeddings)}
+
+    def get_chunk_hashes(self, filename: str) -> Dict[str, int]:
+        """
+        Smallest chunk id per content hash among the chunks of a document.
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                'SELECT chunks.content_hash, MIN(chunks.id) FROM chunks JOIN documents ON chunks.document_id = documents.id '
+                'WHERE documents.filename = ? AND chunks.content_hash IS NOT NULL GROUP BY chunks.content_hash',
+                (filename,)
+            )
+            return dict(cursor.fetchall())
+
+    def first_chunk_ids(self, hashes: List[str]) -> Dict[str, int]:
+        """
+        Smallest chunk id per content hash, over the whole table.
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                'SELECT content_hash, MIN(id) FROM chunks '
+                'WHERE content_hash IN (SELECT value FROM json_each(?)) GROUP BY content_hash',
+                (json.dumps(list(hashes)),)
+            )
+            return dict(cursor.fetchall())
+
+    def representative_ids(self, chunk_ids: List[int] = None) -> np.ndarray:
+        """
+        The chunk ids that are the first (smallest id) with their content hash,
+        out of chunk_ids or, by default, the whole table. Chunks without a hash
+        each stand for themselves.
+
+        Returns:
+        np.ndarray: Representative ids, ascending.
+        """
+        with self._cursor() as cursor:
+            first_of_hash = (
+                'NOT EXISTS (SELECT 1 FROM chunks AS earlier '
+                'WHERE earlier.content_hash = chunks.content_hash AND earlier.id < chunks.id)'
+            )
+            if chunk_ids is None:
+                cursor.execute(f'SELECT id FROM chunks WHERE {first_of_hash} ORDER BY id')
+            else:
+                cursor.execute(
+                    f'SELECT id FROM chunks WHERE id IN (SELECT value FROM json_each(?)) AND {first_of_hash} ORDER BY id',
+                    (json.dumps([int(chunk_id) for chunk_id in chunk_ids]),)
+                )
+            return np.fromiter((row[0] for row in cursor), dtype=np.int64)
+
+    def representatives_of(self, chunk_ids: List[int]) -> np.ndarray:
+        """
+        The representative (see representative_ids) of each chunk in chunk_ids,
+        in the same order. Unknown ids stand for themselves.
+        """
+        with self._cursor() as cursor:
+            cursor.execute(
+                'SELECT chunks.id, (SELECT MIN(first.id) FROM chunks AS first '
+                'WHERE first.content_hash = chunks.content_hash) FROM chunks '
+                'WHERE chunks.id IN (SELECT value FROM json_each(?))',
+                (json.dumps([int(chunk_id) for chunk_id in chunk_ids]),)
+            )
+            representative = {chunk_id: first for chunk_id, first in cursor.fetchall() if first is not None}
+            return np.array([representative.get(int(chunk_id), chunk_id) for chunk_id in chunk_ids], dtype=np.int64)
+
+    def get_chunk_ids(self) -> np.ndarray:
+        with self._cursor() as cursor:
+            cursor.execute('SELECT id FROM chunks ORDER BY id')
+            return np.fromiter((row[0] for row in cursor), dtype=np.int64)
+
+    def count_chunks(self) -> int:
+        with self._cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM chunks')
+            return cursor.fetchone()[0]
+
+    def count_representatives(self) -> int:
+        """
+        Number of representative_ids(): distinct content hashes plus chunks without one.
+        """
+        with self._cursor() as cursor:
+            cursor.execute('SELECT COUNT(DISTINCT content_hash) + TOTAL(content_hash IS NULL) FROM chunks')
+            return int(cursor.fetchone()[0])
+
+    def sample_embeddings(self, sample_size: int) -> List[bytes]:
+        """
+        Return up to sample_size embeddings chosen uniformly at random, for index training.
+        """
+        with self._cursor() as cursor:
+            cursor.execute('SELECT embedding FROM chunks ORDER BY RANDOM() LIMIT ?', (sample_size,))
+            return [row[0] for row in cursor.fetchall()]
+
+    def close(self):
+        with self._lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+            self.conn.close()
+
+# Everything _chunk_texts needs, first in each chunk query. The compressed
+# document comes along with each span chunk, saving a second query on a cache miss
+_CHUNK_TEXT_COLUMNS = (
+    'chunks.content, chunks.document_id, documents.content_hash, chunks.span_start, chunks.span_end, '
+    'CASE WHEN chunks.content IS NULL THEN documents.content_z END'
+)
+_CHUNK_DOCUMENT_JOIN = 'LEFT JOIN documents ON documents.id = chunks.document_id'
+
+class _ReadView(Database):
+    """
+    Database.reader(): the read methods of a Database, each on a connection
+    borrowed from its read-only pool. Writes fail with sqlite3.OperationalError.
+    """
+    def __init__(self, db: Database):
+        self.embedding_dim = db.embedding_dim
+        self.db_path = db.db_path
+        self.compress_text = db.compress_text
+        self._documents = db._documents
+        self._db = db
+
+    @contextmanager
+    def _cursor(self):
+        with self._db._read_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def _connection(self):
+        with self._db._read_connection() as conn:
+            yield conn
+
+    def reader(self) -> Database:
+        return self
+
+    def commit(self):
+        pass
 
     def close(self):
-        self.conn.close()
\ No newline at end of file
+        pass
\ No newline at end of file
@@ -1,10 +1,125 @@
-from sentence_transformers import SentenceTransformer
+import asyncio
+import multiprocessing
+import threading
 import numpy as np
-from typing import List
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
+
+from .chunking import count_words
 
 class Embedder:
-    def __init__(self, model_name: str):
-        self.model = SentenceTransformer(model_name)
+    """
+    SentenceTransformer wrapper that loads the model on first use, or in the
+    background after warmup(). sentence_transformers (and torch) are only
+    imported at that point, which keeps startup fast.
+    """
+    def __init__(self, model_name: str, dimension: Optional[int] = None):
+        self.model_name = model_name
+        self._dimension = dimension
+        self._model = None
+        self._lock = threading.Lock()
+        # Fast tokenizers raise "Already borrowed" when called from two threads at once
+        self._tokenizer_lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def dimension(self) -> int:
+        return self._dimension or self.model.get_sentence_embedding_dimension()
+
+    @property
+    def max_seq_length(self) -> Optional[int]:
+        """
+        Tokens the model reads per text; longer texts are truncated.
+        """
+        return getattr(self.model, 'max_seq_length', None)
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """
+        Model tokens per text, without special tokens. Falls back to whitespace
+        words when the model exposes no tokenizer.
+        """
+        tokenizer = getattr(self.model, 'tokenizer', None)
+        if tokenizer is None or not texts:
+            return count_words(texts)
+        with self._tokenizer_lock:
+            return [len(ids) for ids in tokenizer(list(texts), add_special_tokens=False, verbose=False)['input_ids']]
+
+    def warmup(self) -> threading.Thread:
+        """
+        Load the model on a daemon thread; encode() waits for it if called first.
+        """
+        thread = threading.Thread(target=lambda: self.model, name="embedder-warmup", daemon=True)
+        thread.start()
+        return thread
 
     def encode(self, texts: List[str]):
-        return self.model.encode(texts, normalize_embeddings=True).astype(np.float32)
\ No newline at end of file
+        return self.model.encode(texts, normalize_embeddings=True).astype(np.float32)
+
+def set_torch_threads(torch_threads: Optional[int]):
+    if not torch_threads:
+        return
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(torch_threads)
+
+# Per-process model used by EncoderPool workers in process mode
+_worker_embedder = None
+
+def _init_worker(model_name: str, torch_threads: Optional[int]):
+    global _worker_embedder
+    set_torch_threads(torch_threads)
+    _worker_embedder = Embedder(model_name)
+
+def _encode_in_worker(texts: List[str]) -> np.ndarray:
+    return _worker_embedder.encode(texts)
+
+class EncoderPool:
+    """
+    Runs Embedder.encode off the event loop.
+
+    kind='thread' shares the in-process model across `workers` threads (the
+    forward pass releases the GIL); kind='process' starts `workers` spawned
+    processes that each load their own copy of the model. torch_threads caps
+    the intra-op threads of every model so pools do not oversubscribe cores.
+    """
+    def __init__(self, embedder: Embedder, model_name: str, kind: str = 'thread', workers: int = 1,
+                 torch_threads: Optional[int] = None):
+        self.embedder = embedder
+        self.kind = kind
+        if kind == 'thread':
+            # Applied when the first worker thread starts, so torch is not imported up front
+            self.executor = ThreadPoolExecutor(max_workers=workers, initializer=set_torch_threads, initargs=(torch_threads,))
+        elif kind == 'process':
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(model_name, torch_threads),
+            )
+        else:
+            raise ValueError(f"Unknown encode executor: {kind}")
+
+    def _encode_local(self, texts: List[str]) -> np.ndarray:
+        return self.embedder.encode(texts)
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        encode = self._encode_local if self.kind == 'thread' else _encode_in_worker
+        embeddings = await asyncio.get_running_loop().run_in_executor(self.executor, encode, texts)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
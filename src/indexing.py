@@ -1,36 +1,308 @@
 import faiss
+import glob
+import json
+import numpy as np
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+DEFAULT_INDEX_PARAMS = {
+    'type': 'flat',
+    'nlist': 1024,
+    'nprobe': 16,
+    'hnsw_m': 32,
+    'ef_construction': 200,
+    'ef_search': 64,
+    'pq_m': 64,
+    'pq_nbits': 8,
+    'train_sample_size': 100000,
+    'precision': 'float32',
+    'shards': 1,
+    'max_segments': 8,
+    'segment_ratio': 0.25,
+}
+
+# Scalar-quantizer codec per embedding precision, for the non-PQ index types
+PRECISION_CODECS = {
+    'float32': 'Flat',
+    'float16': 'SQfp16',
+    'int8': 'SQ8',
+}
 
 class FAISSIndex:
-    def __init__(self, dim: int, index_path: str = None):
+    """
+    Inner-product index whose vectors are keyed by their `chunks.id` row id,
+    so search results map straight back to SQLite regardless of deletions.
+
+    The index structure is chosen by `params['type']`:
+    flat (exact), ivf, hnsw, pq, ivfpq or opq. All but flat and hnsw need
+    train() before vectors can be added. `params['precision']` stores flat,
+    ivf and hnsw vectors as float16 or int8 scalar-quantized codes; int8
+    codes cover the fixed range [-1, 1] of normalized embeddings rather than
+    a range learned from what may be a first handful of vectors.
+
+    With `mmap=True` an existing index file is memory-mapped read-only instead
+    of read into memory, so startup does not pay for copying the vectors. The
+    mapping is swapped for an in-memory copy before the first add, remove or
+    train, since FAISS cannot modify a mapped index.
+
+    save() appends the changes since the last save as a delta segment
+    (`<index_path>.seg<k>.npz`, listed in `<index_path>.segments.json`)
+    instead of rewriting the whole file; loading replays the segments over the
+    base file. compact() folds them into a rewritten base file, which save()
+    does by itself after training, when saving to a new path, and once there
+    are `params['max_segments']` segments or they hold more than
+    `params['segment_ratio']` of the base's vectors.
+
+    Every compaction bumps the counter in `<index_path>.generation` (see
+    read_generation). With `read_only=True` an existing file is opened mapped
+    and left that way: segments are not replayed, and add, remove, train,
+    save and compact raise. Processes serving from the same file then share
+    its pages through the OS page cache, and reopen it when the generation
+    changes to pick up what was compacted in.
+    """
+    def __init__(self, dim: int = None, index_path: str = None, params: Dict = None, mmap: bool = False,
+                 read_only: bool = False):
+        self.params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+        self.mapped = False
+        self.index_path = index_path
+        self.read_only = read_only
+        # Cleared for the shards of a ShardedFAISSIndex, whose manifest carries the generation
+        self.publishes = True
+        self.compactions = 0
+        # Changes since the last save, as (ids, vectors) adds and (ids, None) removals
+        self._pending = []
+        self._segments = []
+        self._base_count = 0
+        # Set when the base file no longer matches what segments can be replayed onto
+        self._base_stale = True
         if index_path and os.path.exists(index_path):
-            self.index = self._deserialize_faiss_index(index_path)
+            self._base_stale = False
+            self.index = self._deserialize_faiss_index(index_path, mmap or read_only)
+            self._apply_search_params()
+            if read_only:
+                self._base_count = self.index.ntotal
+                if os.path.exists(self._segments_path()):
+                    print(f"Opened {index_path} read-only; changes in its segments are visible after the next compaction")
+            else:
+                self._replay_segments()
+        elif read_only:
+            raise FileNotFoundError(f"No index file found at {index_path}")
+        elif dim is None:
+            raise ValueError("A dimension is required to create a new index")
         else:
-            self.index = faiss.IndexFlatIP(dim)
-        self.index_path = index_path
+            self.index = self._build_index(dim)
+            self._apply_search_params()
 
-    def add(self, vectors):
-        self.index.add(vectors)
+    def _factory_string(self) -> str:
+        p = self.params
+        index_type = p['type']
+        pq = f"PQ{p['pq_m']}x{p['pq_nbits']}"
+        codec = PRECISION_CODECS[p['precision']]
+        if index_type == 'flat':
+            return f"IDMap,{codec}"
+        if index_type == 'ivf':
+            return f"IVF{p['nlist']},{codec}"
+        if index_type == 'hnsw':
+            return f"IDMap,HNSW{p['hnsw_m']}" + (f",{codec}" if codec != 'Flat' else "")
+        if index_type == 'pq':
+            return f"IDMap,{pq}"
+        if index_type == 'ivfpq':
+            return f"IVF{p['nlist']},{pq}"
+        if index_type == 'opq':
+            return f"OPQ{p['pq_m']},IVF{p['nlist']},{pq}"
+        raise ValueError(f"Unknown index type: {index_type}")
 
-    def search(self, query_vector, k):
+    def _build_index(self, dim: int):
+        # IVF indexes store ids natively; the others are wrapped in an IDMap.
+        # Not IDMap2: nothing here looks vectors up by id, and its id-to-position
+        # table is rebuilt in memory by every process that opens the file.
+        # Indexes saved as IDMap2 still load.
+        index = faiss.index_factory(dim, self._factory_string(), faiss.METRIC_INNER_PRODUCT)
+        if self.params['type'] == 'hnsw':
+            faiss.downcast_index(index.index).hnsw.efConstruction = self.params['ef_construction']
+        if self.params['precision'] == 'int8' and self.params['type'] in ('flat', 'hnsw'):
+            self._set_int8_range(index)
+        return index
+
+    @staticmethod
+    def _set_int8_range(index):
+        """
+        Mark the scalar quantizer trained on [-1, 1] in every dimension, the
+        range of normalized embeddings (as in quantization.py). IVF indexes
+        are trained anyway, on a full sample, and learn the range with it.
+        """
+        inner = faiss.downcast_index(index.index)
+        quantizer = faiss.downcast_index(inner.storage) if isinstance(inner, faiss.IndexHNSW) else inner
+        faiss.copy_array_to_vector(
+            np.concatenate([np.full(index.d, -1.0), np.full(index.d, 2.0)]).astype(np.float32), quantizer.sq.trained
+        )
+        for level in (quantizer, inner, index):
+            level.is_trained = True
+
+    def _apply_search_params(self):
+        self.set_search_params(nprobe=self.params['nprobe'], efSearch=self.params['ef_search'])
+
+    def set_search_params(self, **search_params):
+        """
+        Set query-time knobs such as nprobe (IVF) or efSearch (HNSW).
+        Parameters that do not apply to the current index type are ignored.
+        """
+        parameter_space = faiss.ParameterSpace()
+        for name, value in search_params.items():
+            try:
+                parameter_space.set_index_parameter(self.index, name, value)
+            except RuntimeError:
+                pass
+
+    @property
+    def dim(self) -> int:
+        return self.index.d
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def is_trained(self) -> bool:
+        return self.index.is_trained
+
+    @property
+    def min_train_size(self) -> int:
+        """
+        Fewest training vectors FAISS accepts for the configured index type.
+        """
+        index_type = self.params['type']
+        if index_type == 'ivf':
+            return self.params['nlist']
+        if index_type == 'pq':
+            return 2 ** self.params['pq_nbits']
+        if index_type in ('ivfpq', 'opq'):
+            return max(self.params['nlist'], 2 ** self.params['pq_nbits'])
+        return 0
+
+    def train(self, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) < self.min_train_size:
+            raise ValueError(
+                f"{self.params['type']} index needs at least {self.min_train_size} training vectors, got {len(vectors)}"
+            )
+        self._ensure_writable()
+        self.index.train(vectors)
+        self._mark_base_stale()
+        print(f"Trained {self.params['type']} index on {len(vectors)} vectors")
+
+    def add(self, vectors, ids):
+        self._ensure_writable()
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        self.index.add_with_ids(vectors, ids)
+        self._record(ids, vectors)
+
+    def remove(self, ids) -> int:
+        """
+        Remove vectors by chunk id. Returns the number of vectors removed.
+        HNSW graphs cannot delete; their stale ids are dropped at hydration
+        time because the chunk rows no longer exist, until rebuild_index.
+        """
+        if len(ids) == 0:
+            return 0
+        self._ensure_writable()
+        ids = np.asarray(ids, dtype=np.int64)
+        try:
+            removed = self.index.remove_ids(ids)
+        except RuntimeError:
+            print(f"Index type does not support removal; {len(ids)} stale vectors remain until rebuild_index")
+            return 0
+        self._record(ids)
+        return removed
+
+    def ids(self) -> np.ndarray:
+        """
+        Every chunk id in the index.
+        """
+        if hasattr(self.index, 'id_map'):
+            return faiss.vector_to_array(self.index.id_map).astype(np.int64)
+        # IVF indexes keep the ids in their inverted lists
+        invlists = faiss.extract_index_ivf(self.index).invlists
+        ids = [
+            faiss.rev_swig_ptr(invlists.get_ids(i), invlists.list_size(i)).copy()
+            for i in range(invlists.nlist) if invlists.list_size(i)
+        ]
+        return np.concatenate(ids).astype(np.int64) if ids else np.empty(0, dtype=np.int64)
+
+    @property
+    def supports_id_filter(self) -> bool:
+        # IndexPQ rejects search parameters, and with them ID selectors
+        return self.params['type'] != 'pq'
+
+    @property
+    def supports_remove(self) -> bool:
+        # HNSW graphs cannot delete; see remove()
+        return self.params['type'] != 'hnsw'
+
+    def _search_parameters(self, allowed_ids: np.ndarray):
+        """
+        Search parameters restricting the scan to allowed_ids, carrying over
+        the index's current nprobe/efSearch, which FAISS would otherwise reset.
+        """
+        selector = faiss.IDSelectorBatch(np.ascontiguousarray(allowed_ids, dtype=np.int64))
+        index_type = self.params['type']
+        if index_type in ('ivf', 'ivfpq', 'opq'):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=faiss.extract_index_ivf(self.index).nprobe)
+        if index_type == 'hnsw':
+            hnsw = faiss.downcast_index(self.index.index).hnsw
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=hnsw.efSearch)
+        return faiss.SearchParameters(sel=selector)
+
+    def search(self, query_vector, k, allowed_ids=None):
+        """
+        Top-k search; with allowed_ids, only those chunk ids are candidates
+        (applied during the scan through an IDSelector).
+        """
+        if not self.index.is_trained:
+            nq = len(query_vector)
+            return np.full((nq, k), -np.inf, dtype=np.float32), np.full((nq, k), -1, dtype=np.int64)
+        if allowed_ids is not None:
+            if not self.supports_id_filter:
+                raise ValueError(f"{self.params['type']} index does not support filtered search")
+            return self.index.search(query_vector, k, params=self._search_parameters(allowed_ids))
         return self.index.search(query_vector, k)
-    
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError(f"Index at {self.index_path} was opened read-only")
+
+    def _ensure_writable(self):
+        self._check_writable()
+        # Writing through a read-only mapping aborts inside FAISS rather than raising
+        if self.mapped:
+            self.index = faiss.read_index(self.index_path)
+            self.mapped = False
+            self._apply_search_params()
+
     def _serialize_faiss_index(self):
         """
         Serialize the FAISS index to disk.
         """
         if self.index_path:
-            faiss.write_index(self.index, self.index_path)
+            # Written beside the target and renamed over it, so a reader that
+            # has the old file mapped keeps a valid mapping.
+            tmp_path = self.index_path + '.tmp'
+            faiss.write_index(self.index, tmp_path)
+            os.replace(tmp_path, self.index_path)
             print(f"Index serialized to {self.index_path}")
         else:
             raise ValueError("No index_path specified for serialization")
 
-    def _deserialize_faiss_index(self, file_path): 
+    def _deserialize_faiss_index(self, file_path, mmap: bool = False): 
         """
         Deserialize a FAISS index from disk.
         
         Args:
         file_path (str): Path where the index is saved.
+        mmap (bool): Map the file read-only instead of reading it into memory.
         
         Returns:
         faiss.Index: The deserialized FAISS index.
@@ -38,28 +310,463 @@ class FAISSIndex:
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"No index file found at {file_path}")
         
-        index = faiss.read_index(file_path)
+        if mmap:
+            index = faiss.read_index(file_path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        else:
+            index = faiss.read_index(file_path)
         print(f"Index deserialized from {file_path}")
+        self.mapped = mmap
+        if isinstance(index, faiss.IndexFlat):
+            index = self._migrate_positional_index(index)
+            self.mapped = False
+            self._base_stale = True
         return index
 
-    def save(self, index_path: str = None):
+    def _migrate_positional_index(self, index):
+        """
+        Wrap an index written before explicit ids were stored. Those indexes
+        relied on position i holding chunk row i + 1, so that mapping is made explicit.
+        """
+        vectors = index.reconstruct_n(0, index.ntotal)
+        migrated = faiss.IndexIDMap(faiss.IndexFlatIP(index.d))
+        migrated.add_with_ids(vectors, np.arange(1, index.ntotal + 1, dtype=np.int64))
+        print(f"Migrated positional index with {index.ntotal} vectors to explicit chunk ids")
+        return migrated
+
+    def _segments_path(self) -> str:
+        return self.index_path + '.segments.json'
+
+    def _mark_base_stale(self):
+        self._pending = []
+        self._base_stale = True
+
+    def _record(self, ids: np.ndarray, vectors: np.ndarray = None):
+        if self._base_stale:
+            return
+        self._pending.append((ids, vectors))
+        # Past this size the next save compacts anyway, so stop holding copies
+        if self.delta_size > self.params['segment_ratio'] * self._base_count:
+            self._mark_base_stale()
+
+    @property
+    def delta_size(self) -> int:
+        """
+        Vectors added or removed since the base file was written.
+        """
+        saved = sum(segment['added'] + segment['removed'] for segment in self._segments)
+        return saved + sum(len(ids) for ids, _ in self._pending)
+
+    @property
+    def num_segments(self) -> int:
+        return len(self._segments)
+
+    def _replay_segments(self):
+        """
+        Apply the delta segments saved since the base file was last written.
+        """
+        self._base_count = self.index.ntotal
+        if not os.path.exists(self._segments_path()):
+            return
+        with open(self._segments_path(), 'r') as f:
+            manifest = json.load(f)
+        segments = manifest['segments']
+        if self._base_count != manifest['base_count'] and self._base_count == segments[-1]['ntotal']:
+            # A compaction renamed the new base into place but stopped before
+            # deleting the segments it had folded in
+            self._base_stale = True
+            return
+        self._ensure_writable()
+        directory = os.path.dirname(self.index_path)
+        for segment in segments:
+            with np.load(os.path.join(directory, segment['file'])) as data:
+                removed, ids, vectors = data['removed'], data['ids'], data['vectors']
+            # Removing the added ids as well makes a replay over a base that
+            # already holds them harmless
+            stale = np.concatenate([removed, ids])
+            if len(stale):
+                try:
+                    self.index.remove_ids(stale)
+                except RuntimeError:
+                    pass
+            if len(ids):
+                self.index.add_with_ids(vectors, ids)
+        self._segments = segments
+        self._base_count = manifest['base_count']
+        print(f"Replayed {len(segments)} index segments from {self._segments_path()}")
+
+    def _net_delta(self):
+        """
+        Collapse the pending changes into the ids to remove and the (ids,
+        vectors) to add afterwards.
         """
-        Save the current index to disk.
+        added, removed = {}, []
+        for ids, vectors in self._pending:
+            if vectors is None:
+                removed.append(ids)
+                for chunk_id in ids.tolist():
+                    added.pop(chunk_id, None)
+            else:
+                for chunk_id, vector in zip(ids.tolist(), vectors):
+                    added[chunk_id] = vector
+        removed = np.unique(np.concatenate(removed)) if removed else np.empty(0, dtype=np.int64)
+        ids = np.fromiter(added, dtype=np.int64, count=len(added))
+        vectors = np.vstack(list(added.values())) if added else np.empty((0, self.dim), dtype=np.float32)
+        return removed, ids, vectors
+
+    def _write_segment(self):
+        removed, ids, vectors = self._net_delta()
+        name = f"{os.path.basename(self.index_path)}.seg{len(self._segments)}.npz"
+        path = os.path.join(os.path.dirname(self.index_path), name)
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, removed=removed, ids=ids, vectors=vectors)
+        os.replace(path + '.tmp', path)
+        segments = self._segments + [{'file': name, 'added': len(ids), 'removed': len(removed), 'ntotal': self.ntotal}]
+        # The segment only counts once the manifest listing it is renamed into place
+        tmp_path = self._segments_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'base_count': self._base_count, 'segments': segments}, f)
+        os.replace(tmp_path, self._segments_path())
+        self._segments = segments
+        self._pending = []
+        print(f"Index segment with {len(ids)} added and {len(removed)} removed vectors written to {path}")
+
+    def compact(self):
         """
-        if index_path: self.index_path = index_path
+        Rewrite the base index file with every change, delete the delta
+        segments and bump the generation.
+        """
+        self._check_writable()
         self._serialize_faiss_index()
+        # Segment files are only removed after the new base is in place; a
+        # crash in between is detected by _replay_segments
+        if os.path.exists(self._segments_path()):
+            os.remove(self._segments_path())
+        for path in glob.glob(glob.escape(self.index_path) + '.seg*.npz'):
+            os.remove(path)
+        self._segments = []
+        self._pending = []
+        self._base_count = self.ntotal
+        self._base_stale = False
+        self.compactions += 1
+        if self.publishes:
+            bump_generation(self.index_path)
+
+    def save(self, index_path: str = None):
+        """
+        Persist the changes since the last save: as a new delta segment, or by
+        compacting (see the class docstring). Nothing is written when nothing
+        changed, e.g. for a still-mapped index.
+        """
+        self._check_writable()
+        if index_path and index_path != self.index_path:
+            self.index_path = index_path
+            self._mark_base_stale()
+        if not self.index_path:
+            raise ValueError("No index_path specified for serialization")
+        if self._base_stale or len(self._segments) >= self.params['max_segments']:
+            self.compact()
+        elif self._pending:
+            self._write_segment()
 
     def load(self, file_path: str = None):
         """
-        Load an index from disk.
+        Load an index from disk, with its delta segments.
         
         Args:
         file_path (str, optional): Path to the index file. If not provided, uses the instance's index_path.
         """
         path = file_path or self.index_path
         if path:
+            self._check_writable()
+            self.index_path = path
+            self._segments, self._pending, self._base_stale = [], [], False
             self.index = self._deserialize_faiss_index(path)
-            if not file_path:
-                self.index_path = path
+            self._apply_search_params()
+            self._replay_segments()
         else:
-            raise ValueError("No file path provided for loading the index")
\ No newline at end of file
+            raise ValueError("No file path provided for loading the index")
+
+    def close(self):
+        """
+        Drop the index, unmapping its file. Unsaved changes are lost.
+        """
+        self.index = None
+
+class ShardedFAISSIndex:
+    """
+    FAISSIndex split into `params['shards']` shards, with chunk id modulo the
+    shard count picking a vector's shard, so removals route without a lookup.
+
+    Each shard is its own FAISSIndex file at `<index_path>.<i>`; `index_path`
+    itself holds a JSON manifest with the dimension and per-shard counts.
+    Shards are loaded (or memory-mapped) on first use, once even when
+    concurrent searches reach them together; searches fan out to every shard
+    on a thread pool (FAISS releases the GIL) and the per-shard
+    top-k lists are merged, and save() only saves the shards changed since
+    they were loaded, each appending its own delta segment. The manifest's
+    generation is bumped when any shard compacts; `read_only` applies to every
+    shard.
+    """
+    def __init__(self, dim: int = None, index_path: str = None, params: Dict = None, mmap: bool = False,
+                 read_only: bool = False):
+        self.params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+        self.index_path = index_path
+        self.mmap = mmap
+        self.read_only = read_only
+        self._search_params = {}
+        self._executor = None
+        # Searches run concurrently under the caller's read lock; this guards
+        # the lazy creation of shards and the executor between them
+        self._load_lock = threading.Lock()
+        if index_path and os.path.exists(index_path):
+            self._read_manifest(index_path)
+        elif read_only:
+            raise FileNotFoundError(f"No index file found at {index_path}")
+        elif dim is None:
+            raise ValueError("A dimension is required to create a new index")
+        else:
+            self._dim = dim
+            self.num_shards = self.params['shards']
+            self._counts = [0] * self.num_shards
+            self._shards: List[FAISSIndex] = [FAISSIndex(dim, params=self.params) for _ in range(self.num_shards)]
+            for shard in self._shards:
+                shard.publishes = False
+            self._dirty = [True] * self.num_shards
+
+    @staticmethod
+    def is_manifest(index_path: str) -> bool:
+        with open(index_path, 'rb') as f:
+            return f.read(1) == b'{'
+
+    def _read_manifest(self, index_path: str):
+        with open(index_path, 'r') as f:
+            manifest = json.load(f)
+        self._dim = manifest['dim']
+        self.num_shards = manifest['shards']
+        self._counts = manifest['counts']
+        self._shards = [None] * self.num_shards
+        self._dirty = [False] * self.num_shards
+        if self.num_shards != self.params['shards']:
+            print(f"Index at {index_path} has {self.num_shards} shards, config asks for {self.params['shards']}; run rebuild_index to reshard")
+        print(f"Index manifest read from {index_path}")
+
+    def _shard_path(self, i: int, index_path: str = None) -> str:
+        return f"{index_path or self.index_path}.{i}"
+
+    def _shard(self, i: int) -> FAISSIndex:
+        shard = self._shards[i]
+        if shard is not None:
+            return shard
+        with self._load_lock:
+            shard = self._shards[i]
+            if shard is None:
+                path = self._shard_path(i)
+                if os.path.exists(path):
+                    shard = FAISSIndex(self._dim, path, self.params, mmap=self.mmap, read_only=self.read_only)
+                else:
+                    shard = FAISSIndex(self._dim, params=self.params)
+                shard.publishes = False
+                if self._search_params:
+                    shard.set_search_params(**self._search_params)
+                self._shards[i] = shard
+        return shard
+
+    def _routes(self, ids: np.ndarray):
+        shard_of = ids % self.num_shards
+        for i in range(self.num_shards):
+            mask = shard_of == i
+            if mask.any():
+                yield i, mask
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    @property
+    def ntotal(self) -> int:
+        return sum(count if shard is None else shard.ntotal for shard, count in zip(self._shards, self._counts))
+
+    @property
+    def is_trained(self) -> bool:
+        return self._shard(0).is_trained
+
+    @property
+    def min_train_size(self) -> int:
+        return self._shard(0).min_train_size
+
+    @property
+    def mapped(self) -> bool:
+        return any(shard is not None and shard.mapped for shard in self._shards)
+
+    def set_search_params(self, **search_params):
+        self._search_params.update(search_params)
+        for shard in self._shards:
+            if shard is not None:
+                shard.set_search_params(**search_params)
+
+    def train(self, vectors):
+        """
+        Train the first shard and copy its empty trained structure to the others.
+        """
+        first = self._shard(0)
+        first.train(vectors)
+        for i in range(1, self.num_shards):
+            shard = self._shard(i)
+            shard._ensure_writable()
+            shard.index = faiss.clone_index(first.index)
+            shard.index.reset()
+            shard._mark_base_stale()
+            shard._apply_search_params()
+            if self._search_params:
+                shard.set_search_params(**self._search_params)
+        self._dirty = [True] * self.num_shards
+
+    def add(self, vectors, ids):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        for i, mask in self._routes(ids):
+            self._shard(i).add(vectors[mask], ids[mask])
+            self._dirty[i] = True
+
+    def remove(self, ids) -> int:
+        if len(ids) == 0:
+            return 0
+        ids = np.asarray(ids, dtype=np.int64)
+        removed = 0
+        for i, mask in self._routes(ids):
+            removed += self._shard(i).remove(ids[mask])
+            self._dirty[i] = True
+        return removed
+
+    @property
+    def supports_id_filter(self) -> bool:
+        return self.params['type'] != 'pq'
+
+    @property
+    def supports_remove(self) -> bool:
+        return self.params['type'] != 'hnsw'
+
+    def search(self, query_vector, k, allowed_ids=None):
+        if self._executor is None:
+            with self._load_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.num_shards, thread_name_prefix="index-shard")
+
+        def search_shard(i):
+            # Each shard only needs the allowed ids routed to it
+            shard_ids = None if allowed_ids is None else allowed_ids[allowed_ids % self.num_shards == i]
+            return self._shard(i).search(query_vector, k, shard_ids)
+
+        results = list(self._executor.map(search_shard, range(self.num_shards)))
+        scores = np.hstack([np.asarray(shard_scores) for shard_scores, _ in results])
+        ids = np.hstack([np.asarray(shard_ids) for _, shard_ids in results])
+        # Highest score first, ties by lower id; padding (-1 ids) carries the
+        # lowest possible score and sorts last
+        order = np.lexsort((ids, -scores), axis=-1)[:, :k]
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+    def save(self, index_path: str = None):
+        """
+        Write the shards changed since loading, then the manifest. Saving to a
+        new path writes every shard.
+        """
+        target = index_path or self.index_path
+        if not target:
+            raise ValueError("No index_path specified for serialization")
+        if self.read_only:
+            raise RuntimeError(f"Index at {self.index_path} was opened read-only")
+        moved = target != self.index_path
+        compacted = False
+        for i in range(self.num_shards):
+            if moved or self._dirty[i]:
+                shard = self._shard(i)
+                compactions = shard.compactions
+                shard.save(self._shard_path(i, target))
+                compacted |= shard.compactions != compactions
+                self._dirty[i] = False
+        self.index_path = target
+        self._write_manifest()
+        if compacted:
+            bump_generation(self.index_path)
+
+    def _write_manifest(self):
+        self._counts = [count if shard is None else shard.ntotal for shard, count in zip(self._shards, self._counts)]
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'dim': self._dim, 'shards': self.num_shards, 'counts': self._counts}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def compact(self):
+        """
+        Fold every shard's delta segments into its base file.
+        """
+        if not self.index_path:
+            raise ValueError("No index_path specified for serialization")
+        if self.read_only:
+            raise RuntimeError(f"Index at {self.index_path} was opened read-only")
+        for i in range(self.num_shards):
+            shard = self._shard(i)
+            shard.index_path = self._shard_path(i)
+            shard.compact()
+            self._dirty[i] = False
+        self._write_manifest()
+        bump_generation(self.index_path)
+
+    @property
+    def num_segments(self) -> int:
+        return sum(shard.num_segments for shard in self._shards if shard is not None)
+
+    def ids(self) -> np.ndarray:
+        return np.concatenate([self._shard(i).ids() for i in range(self.num_shards)])
+
+    def load(self, file_path: str = None):
+        path = file_path or self.index_path
+        if not path:
+            raise ValueError("No file path provided for loading the index")
+        self.index_path = path
+        self._read_manifest(path)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        for shard in self._shards:
+            if shard is not None:
+                shard.close()
+
+def open_index(dim: int = None, index_path: str = None, params: Dict = None, mmap: bool = False,
+               read_only: bool = False):
+    """
+    FAISSIndex, or ShardedFAISSIndex when `params['shards']` > 1. An existing
+    file at index_path is opened in the layout it was saved in, whatever the
+    config says, until rebuild_index writes the configured one.
+    """
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    if index_path and os.path.exists(index_path):
+        sharded = ShardedFAISSIndex.is_manifest(index_path)
+    else:
+        sharded = params['shards'] > 1
+    return (ShardedFAISSIndex if sharded else FAISSIndex)(dim, index_path, params, mmap, read_only)
+
+def _generation_path(index_path: str) -> str:
+    return index_path + '.generation'
+
+def read_generation(index_path: str) -> int:
+    """
+    How many times the index at index_path has been compacted, 0 if never.
+    A reader that saw a different value has a stale base file mapped.
+    """
+    try:
+        with open(_generation_path(index_path), 'r') as f:
+            return int(f.read())
+    except FileNotFoundError:
+        return 0
+
+def bump_generation(index_path: str) -> int:
+    # Renamed into place after the base file it announces
+    generation = read_generation(index_path) + 1
+    tmp_path = _generation_path(index_path) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(str(generation))
+    os.replace(tmp_path, _generation_path(index_path))
+    return generation
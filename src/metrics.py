@@ -0,0 +1,190 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+# Upper bounds in seconds, from sub-millisecond query stages to multi-second index saves
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_HELP = {
+    'search_seconds': "Whole search_many call",
+    'filter_seconds': "Resolving search filters to chunk ids in SQLite",
+    'query_preprocess_seconds': "Query normalization per search_many call",
+    'query_encode_seconds': "Encoding of the query-cache misses per search_many call",
+    'index_search_seconds': "FAISS search per search_many call",
+    'hydrate_seconds': "Chunk lookup in SQLite per search_many call",
+    'queries_total': "Queries searched",
+    'ingest_read_seconds': "Reading and splitting one document",
+    'ingest_encode_seconds': "Encoding one ingest batch, including waiting for a worker",
+    'ingest_write_seconds': "Writing one encoded batch to SQLite, the vector store and the index",
+    'ingest_documents_total': "Documents ingested",
+    'ingest_chunks_total': "Chunks ingested",
+    'ingest_reused_chunks_total': "Ingested chunks whose stored embedding was reused instead of encoded",
+    'ingest_chunks_per_second': "Throughput of the last add_documents run",
+    'index_save_seconds': "Writing the index to disk: a delta segment or a compacted index file",
+    'index_segments': "Delta segments saved since the index file was last compacted",
+    'rebuild_seconds': "Whole rebuild_index call",
+}
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus layout: counts[i] holds the
+    observations <= buckets[i], and the last slot holds all of them (+Inf).
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.counts[-1] += 1
+
+    def percentile(self, p: float) -> float:
+        """
+        Estimate of the p-th percentile, interpolated within its bucket and
+        clamped to the observed range.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = p / 100 * self.count
+        lower, below = 0.0, 0
+        for bound, cumulative in zip(self.buckets, self.counts):
+            if cumulative >= rank:
+                in_bucket = cumulative - below
+                estimate = lower + (bound - lower) * ((rank - below) / in_bucket if in_bucket else 1.0)
+                return min(max(estimate, self.min), self.max)
+            lower, below = bound, cumulative
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+class Metrics:
+    """
+    Thread-safe counters, gauges and latency histograms for one retrieval
+    system. Collectors are callables returning extra gauges (e.g. cache
+    stats) that are read at export time.
+
+    Exports as Prometheus text (to_prometheus) or as a JSON snapshot, written
+    on demand (dump_json) or every interval seconds (start_periodic_dump).
+    """
+    def __init__(self, prefix: str = 'retrieval_'):
+        self.prefix = prefix
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._collectors: List[Callable[[], Dict[str, float]]] = []
+        self._lock = threading.Lock()
+        self._dump_stop = None
+        self._dump_thread = None
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def add_collector(self, collector: Callable[[], Dict[str, float]]):
+        self._collectors.append(collector)
+
+    def _collected_gauges(self) -> Dict[str, float]:
+        gauges = dict(self.gauges)
+        for collector in self._collectors:
+            gauges.update(collector())
+        return gauges
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {name: histogram.summary() for name, histogram in self.histograms.items()}
+            gauges = self._collected_gauges()
+        return {'timestamp': time.time(), 'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+    def to_prometheus(self) -> str:
+        lines = []
+
+        def header(name, kind):
+            help_text = METRIC_HELP.get(name)
+            if help_text:
+                lines.append(f"# HELP {self.prefix}{name} {help_text}")
+            lines.append(f"# TYPE {self.prefix}{name} {kind}")
+
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                header(name, 'counter')
+                lines.append(f"{self.prefix}{name} {value}")
+            for name, value in sorted(self._collected_gauges().items()):
+                header(name, 'gauge')
+                lines.append(f"{self.prefix}{name} {value}")
+            for name, histogram in sorted(self.histograms.items()):
+                header(name, 'histogram')
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f'{self.prefix}{name}_bucket{{le="{bound}"}} {count}')
+                lines.append(f'{self.prefix}{name}_bucket{{le="+Inf"}} {histogram.counts[-1]}')
+                lines.append(f"{self.prefix}{name}_sum {histogram.sum}")
+                lines.append(f"{self.prefix}{name}_count {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def dump_json(self, path: str):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def start_periodic_dump(self, path: str, interval: float):
+        """
+        Rewrite the JSON snapshot at path every interval seconds on a daemon thread.
+        """
+        if self._dump_thread is not None:
+            return
+        self._dump_stop = threading.Event()
+
+        def run():
+            while not self._dump_stop.wait(interval):
+                self.dump_json(path)
+
+        self._dump_thread = threading.Thread(target=run, name="metrics-dump", daemon=True)
+        self._dump_thread.start()
+
+    def stop_periodic_dump(self):
+        if self._dump_thread is not None:
+            self._dump_stop.set()
+            self._dump_thread.join()
+            self._dump_thread = None
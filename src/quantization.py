@@ -0,0 +1,53 @@
+import numpy as np
+from typing import List
+
+# Normalized embeddings lie in [-1, 1]; int8 storage maps that range onto [-127, 127]
+INT8_SCALE = 127.0
+
+PRECISION_DTYPES = {
+    'float32': np.float32,
+    'float16': np.float16,
+    'int8': np.int8,
+}
+
+def quantize_embeddings(embeddings: np.ndarray, precision: str) -> np.ndarray:
+    """
+    Convert float32 embeddings to the storage dtype for precision.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if precision == 'int8':
+        return np.clip(np.rint(embeddings * INT8_SCALE), -127, 127).astype(np.int8)
+    return embeddings.astype(PRECISION_DTYPES[precision])
+
+def dequantize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Convert stored embeddings of any supported dtype back to float32.
+    """
+    if embeddings.dtype == np.int8:
+        return embeddings.astype(np.float32) / INT8_SCALE
+    return np.asarray(embeddings, dtype=np.float32)
+
+def encode_embeddings(embeddings: np.ndarray, precision: str = 'float32') -> List[bytes]:
+    """
+    Serialize embeddings to per-chunk BLOBs at the given precision.
+    """
+    return [row.tobytes() for row in quantize_embeddings(embeddings, precision)]
+
+def decode_embeddings(blobs: List[bytes], dim: int = None) -> np.ndarray:
+    """
+    Decode BLOBs into one float32 matrix. The precision of each BLOB follows
+    from its length, so a database written at several precisions stays readable.
+    Without dim every BLOB is taken to be float32.
+    """
+    if not blobs:
+        return np.empty((0, dim or 0), dtype=np.float32)
+    if dim is None or all(len(blob) == dim * 4 for blob in blobs):
+        return np.frombuffer(b''.join(blobs), dtype=np.float32).reshape(len(blobs), -1 if dim is None else dim)
+    matrix = np.empty((len(blobs), dim), dtype=np.float32)
+    sizes = np.fromiter((len(blob) for blob in blobs), dtype=np.int64, count=len(blobs))
+    for dtype in (np.float32, np.float16, np.int8):
+        rows = np.flatnonzero(sizes == dim * np.dtype(dtype).itemsize)
+        if len(rows):
+            stored = np.frombuffer(b''.join(blobs[i] for i in rows), dtype=dtype).reshape(len(rows), dim)
+            matrix[rows] = dequantize_embeddings(stored)
+    return matrix
@@ -1,41 +1,527 @@
+from .chunking import SentenceChunker, TokenChunker, chunk_spans
 from .config import Config
-from .database import Database
-from .embedding import Embedder
-from .indexing import FAISSIndex
+from .database import Database, content_hash
+from .embedding import Embedder, EncoderPool
+from .indexing import open_index, read_generation
+from .metrics import Metrics
+from .cache import QueryEmbeddingCache
+from .vector_store import VectorStore
+from .watcher import Changes, DirectoryWatcher, scan_documents
+from .quantization import decode_embeddings, encode_embeddings
+import asyncio
+import collections
+import datetime
+import itertools
+import operator
 import os
-from typing import Dict, List
-import nltk
-nltk.download('punkt')
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
 import numpy as np
 import json
 
 class EmbeddingRetrievalSystem:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, embedder: Embedder = None):
         self.config = config
-        self.db = Database(self.config.db_path)
-        self.embedder = Embedder(self.config.model_name)
-        self.index = FAISSIndex(self.embedder.model.get_sentence_embedding_dimension(), self.config.index_path)
+        # The model loads on first encode, or in the background with preload_model.
+        # An embedder can be passed in instead (e.g. the benchmark's stub).
+        self.embedder = embedder or Embedder(self.config.model_name, self.config.embedding_dim)
+        if self.config.preload_model and embedder is None:
+            self.embedder.warmup()
+        # Ingest encodes run on the configured pool; queries get their own
+        # in-process lane so they never queue behind a bulk ingest's batches.
+        self.ingest_encoder = EncoderPool(
+            self.embedder, self.config.model_name, self.config.encode_executor,
+            self.config.encode_workers, self.config.torch_threads
+        )
+        self.query_encoder = EncoderPool(self.embedder, self.config.model_name, 'thread', 1)
+        # Read before opening, so a compaction finishing in between is picked up by the next check
+        self.index_generation = read_generation(self.config.index_path) if self.config.index_path else 0
+        self._next_reload_check = time.monotonic() + self.config.index_reload_interval
+        self._reload_lock = threading.Lock()
+        self.index = self._open_index()
+        self.dim = self.index.dim
+        # Searches run on search_workers threads, each hydrating through its own
+        # read-only SQLite connection, while ingest writes on a single writer.
+        # The index lock lets searches share the index and excludes them only
+        # while it changes.
+        self.db = Database(
+            self.config.db_path, self.dim, self.config.search_workers, self.config.sqlite_pragmas,
+            self.config.compress_text, self.config.document_cache_size, self.config.read_only
+        )
+        self._index_lock = _ReadWriteLock()
+        self._search_executor = ThreadPoolExecutor(max_workers=self.config.search_workers, thread_name_prefix='search')
+        # A read-only system never writes embeddings, and leaves the store to the writer
+        self.vector_store = None if self.config.read_only else self._open_vector_store()
         self.processed_files = self._load_processed_files()
+        self.query_cache = QueryEmbeddingCache(self.config.query_cache_size, self.config.query_cache_ttl, self.config.query_cache_path)
+        self.metrics = Metrics()
+        self.metrics.add_collector(self._size_gauges)
+        if self.config.metrics_path:
+            self.metrics.start_periodic_dump(self.config.metrics_path, self.config.metrics_interval)
+        if not self.config.read_only:
+            self._check_index()
 
-    async def add_documents(self, directory: str):
-        for filename in os.listdir(directory):
-            if filename.endswith(".txt"):
-                file_path = os.path.join(directory, filename)
-                file_stat = os.stat(file_path)
-                file_mtime = file_stat.st_mtime
-
-                if filename in self.processed_files and self.processed_files[filename] == file_mtime:
-                    print(f"Skipping {filename} as it hasn't changed since last processing.")
-                    continue
-
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    content = file.read()
-                    await self._process_document(filename, content)
-                
-                self.processed_files[filename] = file_mtime
-        
+    def _size_gauges(self) -> Dict[str, float]:
+        cache = self.query_cache.stats()
+        return {
+            'index_vectors': self.index.ntotal,
+            'index_segments': self.index.num_segments,
+            'query_cache_entries': cache['size'],
+            'query_cache_hit_rate': cache['hit_rate'],
+            'document_cache_hit_rate': self.db.document_cache_stats()['hit_rate'],
+        }
+
+    def _index_params(self) -> Dict:
+        return {**self.config.index_params, 'precision': self.config.embedding_precision}
+
+    def _open_index(self):
+        # A saved index supplies its own dimension and is memory-mapped, so the
+        # model is only needed at startup for a brand-new setup without embedding_dim.
+        if self.config.read_only:
+            return open_index(self.config.embedding_dim, self.config.index_path, self._index_params(), mmap=True, read_only=True)
+        if self.config.index_path and os.path.exists(self.config.index_path):
+            return open_index(self.config.embedding_dim, self.config.index_path, self._index_params(), mmap=self.config.index_mmap)
+        return open_index(self.embedder.dimension, self.config.index_path, self._index_params())
+
+    def _open_vector_store(self):
+        if not self.config.vector_store_path:
+            return None
+        return VectorStore(self.config.vector_store_path, self.dim, self.config.vector_store_dtype)
+
+    def _sync_vector_store(self):
+        """
+        Bring the vector store in line with the chunks table: migrate an existing
+        database into an empty store, and copy over chunks committed without
+        reaching the store (e.g. a crash between the two writes). Runs before
+        add_documents and rebuild rather than at startup or per watch batch,
+        since it scans every chunk id.
+        """
+        store = self.vector_store
+        if store is None:
+            return
+        if len(store) == 0:
+            if self.db.count_chunks():
+                store.migrate_from_database(self.db, self.config.rebuild_batch_size)
+            return
+
+        live_ids = self.db.get_chunk_ids()
+        status = store.check_consistency(live_ids)
+        if status['missing']:
+            known = np.asarray(store.ids())[store.live_positions(live_ids)]
+            missing_ids, embeddings = self.db.get_embeddings(np.setdiff1d(live_ids, known).tolist())
+            store.append(missing_ids, embeddings)
+            print(f"Restored {len(missing_ids)} embeddings missing from the vector store")
+
+    def _check_writable(self):
+        if self.config.read_only:
+            raise RuntimeError("The retrieval system was opened read-only")
+
+    def _check_index(self):
+        """
+        Cross-check the index with the chunks table at startup. Chunks committed
+        after the last index save (e.g. before a crash) are added from their
+        stored embeddings, and vectors of chunks deleted since are removed.
+        Only chunk writes since the last save, or a count mismatch, pay for
+        comparing the ids; vectors an HNSW index could not remove are counted
+        as expected until rebuild_index.
+        """
+        if not self.index.is_trained:
+            return
+        changes, indexed_changes = self.db.chunk_changes()
+        expected = self._expected_index_count()
+        if self.index.ntotal == expected + self.db.stale_vectors() and changes == indexed_changes:
+            return
+        indexed = self.index.ids()
+        live = self._indexed_chunk_ids()
+        missing = np.setdiff1d(live, indexed)
+        extra = np.setdiff1d(indexed, live)
+        with self._index_lock.write():
+            removed = self.index.remove(extra)
+            if len(missing):
+                ids, embeddings = self.db.get_embeddings(missing.tolist())
+                self.index.add(embeddings, ids)
+        print(f"Index had {len(indexed)} vectors for {expected} chunks: added {len(missing)}, removed {removed}")
+        self._save_index()
+
+    def _expected_index_count(self) -> int:
+        return self.db.count_representatives() if self.config.dedup_index else self.db.count_chunks()
+
+    async def add_documents(self, directory: str, progress: Callable[['Progress'], None] = None):
+        """
+        Ingest the new and changed .txt files under directory, including its
+        subdirectories. Documents are named by their path relative to directory.
+
+        Args:
+        progress (Callable, optional): Called on the event loop with a Progress
+            after every written batch and skipped file.
+
+        Cancelling the call stops the ingest after the batch being written;
+        the documents written so far are saved and the next call resumes.
+        """
+        self._check_writable()
+        self._sync_vector_store()
+        await self._ingest_files(directory, scan_documents(directory), progress)
+
+    async def _ingest_files(self, directory: str, files, progress: Callable[['Progress'], None] = None):
+        # files yields (name, mtime) pairs, names relative to directory
+        pending = []
+        for filename, file_mtime in files:
+            if filename in self.processed_files and self.processed_files[filename] == file_mtime:
+                print(f"Skipping {filename} as it hasn't changed since last processing.")
+                continue
+            pending.append(_PendingDocument(filename, os.path.join(directory, filename), file_mtime))
+
+        try:
+            processed = await self._run_ingest_pipeline(pending, progress)
+        except asyncio.CancelledError:
+            self._checkpoint()
+            raise
+
+        if processed:
+            if self.index.is_trained:
+                self._save_index()
+            elif self.db.count_chunks() >= self.index.min_train_size:
+                await self.rebuild_index()
+            else:
+                print(f"Index not trained yet: {self.db.count_chunks()} of {self.index.min_train_size} chunks needed.")
+        self._save_processed_files()
+
+    async def watch(self, directory: str = None, progress: Callable[['Progress'], None] = None):
+        """
+        Keep the index in sync with directory (documents_path by default) until
+        cancelled: catch up with add_documents, then ingest the changes the
+        watcher reports, a debounced batch at a time, and remove the documents
+        of deleted files. A rename ingests the new name (reusing the stored
+        embeddings) and then removes the old one. The vector store is synced
+        once by the catch-up scan, not for every batch.
+        """
+        self._check_writable()
+        directory = directory or self.config.documents_path
+        watcher = DirectoryWatcher(
+            directory, self.config.watch_debounce, self.config.watch_poll_interval, self.config.watch_backend
+        )
+        # Started first, so changes made during the catch-up scan are not missed
+        watcher.start()
+        print(f"Watching {directory} ({watcher.backend})")
+        try:
+            await self.add_documents(directory, progress)
+            while True:
+                await self.apply_changes(directory, await watcher.next_batch(), progress)
+        finally:
+            watcher.stop()
+
+    async def apply_changes(self, directory: str, changes: Changes, progress: Callable[['Progress'], None] = None):
+        self._check_writable()
+        if changes.changed:
+            await self._ingest_files(directory, changes.changed.items(), progress)
+        removed = []
+        for path in changes.removed:
+            prefix = path + '/' if path else ''
+            removed.extend(
+                filename for filename in self.processed_files
+                if (filename == path or filename.startswith(prefix))
+                and not os.path.exists(os.path.join(directory, filename))
+            )
+        if removed:
+            self.remove_documents(removed)
+
+    def remove_documents(self, filenames: List[str]):
+        """
+        Delete documents by name from the database, the index and the processed
+        files, in one transaction.
+        """
+        self._check_writable()
+        for filename in filenames:
+            self._delete_document(filename)
+            self.processed_files.pop(filename, None)
+        self.db.commit()
+        print(f"Removed {len(filenames)} documents")
+        self._save_index()
+        self._save_processed_files()
+
+    async def _run_ingest_pipeline(self, documents: List['_PendingDocument'], progress: Callable[['Progress'], None] = None) -> int:
+        """
+        Ingest documents through three overlapping stages:
+        reader/chunker workers in a thread pool feed a bounded queue, a single
+        encoder stage collects cross-document windows of encode_sort_batches *
+        batch_size chunks, encodes each window in batches of batch_size sorted
+        by chunk length and keeps up to encode_workers windows in flight on the
+        ingest encoder pool, and a writer persists each encoded window, in
+        order, in one transaction.
+
+        Returns:
+        int: Number of documents fully written.
+        """
+        if not documents:
+            return 0
+        loop = asyncio.get_running_loop()
+        batch_size = self.config.batch_size
+        read_queue = asyncio.Queue(maxsize=self.config.ingest_queue_size)
+        write_queue = asyncio.Queue(maxsize=self.config.ingest_queue_size)
+        readers = ThreadPoolExecutor(max_workers=self.config.ingest_workers)
+        # Batches are written off the event loop, one at a time, in order
+        writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest-writer')
+        in_flight = collections.deque()
+        processed = 0
+        skipped = 0
+        chunks_written = 0
+        start = time.perf_counter()
+
+        def report():
+            if progress is not None:
+                progress(Progress('ingest', chunks_written, time.perf_counter() - start, processed + skipped, len(documents)))
+
+        async def read_one(document):
+            nonlocal skipped, processed
+            # Lookups go through the read pool so the loop never waits on the writer
+            known_hash = self.db.reader().get_document_hash(document.filename)
+            document.content, chunks, lengths, hashes, spans = await loop.run_in_executor(
+                readers, self._read_and_split, document.path, known_hash
+            )
+            if chunks is None:
+                # Touched but unchanged: only the recorded mtime moves
+                print(f"Skipping {document.filename} as its content hasn't changed.")
+                self.processed_files[document.filename] = document.mtime
+                document.content = None
+                skipped += 1
+                report()
+                return
+            if not chunks:
+                # Nothing to encode, but an emptied file still replaces its old version
+                await loop.run_in_executor(writer, self._write_empty_document, document)
+                self.processed_files[document.filename] = document.mtime
+                processed += 1
+                report()
+                return
+            # Chunks whose text is already stored (in any document) reuse its embedding
+            known = self.db.reader().get_embeddings_by_hash(hashes)
+            await read_queue.put((document, chunks, lengths, [known.get(chunk_hash) for chunk_hash in hashes], spans))
+
+        async def read_stage():
+            # ingest_workers readers share one iterator, and each waits for room
+            # in read_queue before reading its next file, so at most
+            # ingest_queue_size + ingest_workers documents are held in memory
+            remaining = iter(documents)
+
+            async def read_next():
+                for document in remaining:
+                    await read_one(document)
+
+            await asyncio.gather(*(read_next() for _ in range(self.config.ingest_workers)))
+            await read_queue.put(None)
+
+        async def write_oldest():
+            batch, encoding = in_flight.popleft()
+            await write_queue.put((batch, await encoding))
+
+        async def timed_encode(texts):
+            with self.metrics.timer('ingest_encode_seconds'):
+                return await self.ingest_encoder.encode(texts)
+
+        async def encode_missing(window):
+            # Batches of similar length pad little; embeddings go back in window order
+            rows = sorted((i for i, item in enumerate(window) if item[3] is None), key=lambda i: window[i][2])
+            batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+            encoded = await asyncio.gather(*(timed_encode([window[i][1] for i in batch]) for batch in batches))
+            embeddings = [item[3] for item in window]
+            for batch, batch_embeddings in zip(batches, encoded):
+                for i, embedding in zip(batch, batch_embeddings):
+                    embeddings[i] = embedding
+            return np.vstack(embeddings)
+
+        async def encode_window(window):
+            self.metrics.inc('ingest_reused_chunks_total', sum(item[3] is not None for item in window))
+            in_flight.append((window, asyncio.ensure_future(encode_missing(window))))
+            if len(in_flight) >= self.config.encode_workers:
+                await write_oldest()
+
+        async def encode_stage():
+            # A window closes at window_size chunks to encode; reused chunks ride
+            # along, up to max_window in total so a mostly unchanged corpus still
+            # writes in bounded transactions.
+            window_size = batch_size * max(1, self.config.encode_sort_batches)
+            max_window = window_size * 8
+            pending, to_encode = [], 0
+            while True:
+                item = await read_queue.get()
+                if item is None:
+                    break
+                document, chunks, lengths, reused, spans = item
+                document.chunk_count = len(chunks)
+                for chunk, length, embedding, span in zip(chunks, lengths, reused, spans):
+                    pending.append((document, chunk, length, embedding, span))
+                    to_encode += embedding is None
+                    if to_encode == window_size or len(pending) == max_window:
+                        await encode_window(pending)
+                        pending, to_encode = [], 0
+            if pending:
+                await encode_window(pending)
+            while in_flight:
+                await write_oldest()
+            await write_queue.put(None)
+
+        async def write_stage():
+            nonlocal processed, chunks_written
+            while True:
+                item = await write_queue.get()
+                if item is None:
+                    break
+                with self.metrics.timer('ingest_write_seconds'):
+                    completed = await loop.run_in_executor(writer, self._write_batch, *item)
+                self.metrics.inc('ingest_chunks_total', len(item[0]))
+                chunks_written += len(item[0])
+                for document in completed:
+                    self.metrics.inc('ingest_documents_total')
+                    self.processed_files[document.filename] = document.mtime
+                    processed += 1
+                    if self.config.checkpoint_interval and processed % self.config.checkpoint_interval == 0:
+                        self._checkpoint()
+                report()
+
+        report()
+        stages = [asyncio.ensure_future(stage()) for stage in (read_stage, encode_stage, write_stage)]
+        try:
+            await asyncio.gather(*stages)
+        except BaseException:
+            for stage in stages:
+                stage.cancel()
+            for _, encoding in in_flight:
+                encoding.cancel()
+            raise
+        finally:
+            readers.shutdown(wait=False)
+            writer.shutdown(wait=True)
+
+        elapsed = time.perf_counter() - start
+        chunk_total = sum(document.chunk_count for document in documents)
+        self.metrics.set_gauge('ingest_chunks_per_second', chunk_total / elapsed)
+        print(f"Ingested {processed} documents ({chunk_total} chunks) in {elapsed:.2f}s, {chunk_total / elapsed:.0f} chunks/s")
+        return processed
+
+    def _read_and_split(self, file_path: str, known_hash: str = None):
+        """
+        Read a document and split it, with the length, content hash and (when
+        text is stored compressed) span in the document of every chunk. Returns
+        (content, None, None, None, None) when the content hash equals known_hash.
+        """
+        with self.metrics.timer('ingest_read_seconds'):
+            with open(file_path, 'r', encoding='utf-8') as file:
+                content = file.read()
+            if known_hash is not None and content_hash(content) == known_hash:
+                return content, None, None, None, None
+            chunks, lengths = self._chunker().split(content)
+            spans = chunk_spans(content, chunks) if self.config.compress_text else [None] * len(chunks)
+            return content, chunks, lengths, [content_hash(chunk) for chunk in chunks], spans
+
+    def _write_batch(self, batch: List[tuple], embeddings: np.ndarray) -> List['_PendingDocument']:
+        """
+        Persist one encoded batch, which may span several documents, in a single
+        transaction and add its vectors to the index.
+
+        Returns:
+        List[_PendingDocument]: Documents whose last chunk was in this batch.
+        """
+        chunk_ids = []
+        completed = []
+        offset = 0
+        for document, group in itertools.groupby(batch, key=lambda item: item[0]):
+            group = list(group)
+            texts = [item[1] for item in group]
+            if document.doc_id is None:
+                # The hash is only stored with the last chunk: until then a rerun re-reads the file
+                document.text_hash = content_hash(document.content)
+                document.doc_id = self._replace_document(document.filename, document.content, complete=False)
+                document.content = None
+            batch_embeddings = embeddings[offset:offset + len(texts)]
+            offset += len(texts)
+            chunk_ids.extend(self.db.add_chunks(
+                document.doc_id, texts, encode_embeddings(batch_embeddings, self.config.embedding_precision), commit=False,
+                spans=[item[4] for item in group]
+            ))
+            if self.vector_store is not None:
+                self.vector_store.append(chunk_ids[-len(texts):], batch_embeddings)
+            document.written += len(texts)
+            if document.written == document.chunk_count:
+                self.db.mark_complete(document.doc_id, document.text_hash, commit=False)
+                completed.append(document)
+        self.db.commit()
+        if self.index.is_trained:
+            self._index_chunks(np.asarray(chunk_ids, dtype=np.int64), embeddings)
+        return completed
+
+    def _write_empty_document(self, document: '_PendingDocument'):
+        self._replace_document(document.filename, document.content)
+        document.content = None
+        self.db.commit()
+
+    def _index_chunks(self, chunk_ids: np.ndarray, embeddings: np.ndarray):
+        # With dedup_index only the first chunk of each distinct text is indexed,
+        # so copies of a passage do not crowd the top-k
+        if self.config.dedup_index:
+            keep = np.isin(chunk_ids, self.db.representative_ids(chunk_ids.tolist()))
+            chunk_ids, embeddings = chunk_ids[keep], embeddings[keep]
+        if len(chunk_ids):
+            with self._index_lock.write():
+                self.index.add(embeddings, chunk_ids)
+
+    def _replace_document(self, filename: str, content: str, complete: bool = True) -> int:
+        # Any earlier version of the file is removed from both stores in the
+        # caller's transaction before the new document row is inserted.
+        self._delete_document(filename)
+        return self.db.add_document(filename, content, commit=False, complete=complete)
+
+    def _delete_document(self, filename: str):
+        deleted_first = {}
+        if self.config.dedup_index and self.db.document_exists(filename):
+            deleted_first = self.db.get_chunk_hashes(filename)
+        stale_ids = self.db.delete_document(filename, commit=False)
+        if stale_ids:
+            with self._index_lock.write():
+                self.index.remove(stale_ids)
+            self._promote_duplicates(deleted_first)
+
+    def _promote_duplicates(self, deleted_first: Dict[str, int]):
+        # A deleted chunk that stood in the index for identical chunks of other
+        # documents hands over to the next one with the same text
+        if not deleted_first or not self.index.is_trained:
+            return
+        remaining = self.db.first_chunk_ids(list(deleted_first))
+        promoted = [chunk_id for chunk_hash, chunk_id in remaining.items() if chunk_id > deleted_first[chunk_hash]]
+        if promoted:
+            ids, embeddings = self.db.get_embeddings(promoted)
+            with self._index_lock.write():
+                self.index.add(embeddings, ids)
+
+    def _checkpoint(self):
+        # Index and processed-file state are persisted together so a crash
+        # between checkpoints only replays the documents ingested since the last one.
+        self._save_index()
         self._save_processed_files()
 
+    def _save_index(self, index_path: str = None):
+        # Every committed chunk write has reached the index by the time it is
+        # saved, so the saved index reflects at least this many changes
+        changes = self.db.chunk_changes()[0]
+        # Saving a segment or compacting may rewrite the mapped index in place
+        with self.metrics.timer('index_save_seconds'), self._index_lock.write():
+            self.index.save(index_path)
+            # Anything beyond the live chunks is vectors the index could not remove
+            stale = 0 if self.index.supports_remove else max(self.index.ntotal - self._expected_index_count(), 0)
+        self.db.mark_indexed(changes, stale)
+
+    def compact_index(self):
+        """
+        Fold the index's delta segments into its base file, so the next start
+        can memory-map it without replaying them. Read-only systems serving
+        from the same file switch to it on their next reload check.
+        """
+        self._check_writable()
+        with self.metrics.timer('index_save_seconds'), self._index_lock.write():
+            self.index.compact()
+
     def _load_processed_files(self):
         processed_files_path = os.path.join(os.path.dirname(self.config.processed_files_path), "processed_files.json")
         if os.path.exists(processed_files_path):
@@ -49,65 +535,288 @@ class EmbeddingRetrievalSystem:
             json.dump(self.processed_files, f)
 
     async def _process_document(self, filename: str, content: str):
-        doc_id = self.db.add_document(filename, content)
+        # The document and all of its chunks are written in one transaction;
+        # the index is persisted by add_documents, not per document.
+        doc_id = self._replace_document(filename, content)
         chunks = self._split_into_chunks(content)
+        spans = chunk_spans(content, chunks) if self.config.compress_text else None
         
         for i in range(0, len(chunks), self.config.batch_size):
             batch = chunks[i:i+self.config.batch_size]
-            embeddings = await self._generate_embeddings(batch)
-            
-            for chunk, embedding in zip(batch, embeddings):
-                self.db.add_chunk(doc_id, chunk, embedding.tobytes())
-                self.index.add(embedding.reshape(1, -1))
-        self.index.save()
+            embeddings = await self.ingest_encoder.encode(batch)
+
+            chunk_ids = self.db.add_chunks(
+                doc_id, batch, encode_embeddings(embeddings, self.config.embedding_precision), commit=False,
+                spans=spans and spans[i:i+self.config.batch_size]
+            )
+            if self.vector_store is not None:
+                self.vector_store.append(chunk_ids, embeddings)
+            # Untrained indexes pick these chunks up from the DB when rebuild_index trains them
+            if self.index.is_trained:
+                self._index_chunks(np.asarray(chunk_ids, dtype=np.int64), embeddings)
+        self.db.commit()
+
+    def _chunker(self):
+        if not self.config.chunk_tokens:
+            return SentenceChunker(self.config.chunk_size)
+        max_tokens = self.config.chunk_tokens
+        model_max = self.embedder.max_seq_length
+        if model_max:
+            # Leave room for the special tokens the model adds around each text
+            max_tokens = min(max_tokens, model_max - 2)
+        return TokenChunker(self.embedder.count_tokens, max_tokens, self.config.chunk_overlap)
 
     def _split_into_chunks(self, text: str) -> List[str]:
-        # Implementation of text splitting logic
-        # This could be a simple split by sentences or a more complex method
-        # For simplicity, split by sentences:
-        sentences = text.split('. ')
-        chunks = ['. '.join(sentences[i:i+self.config.chunk_size]) for i in range(0, len(sentences), self.config.chunk_size)]
-        return chunks
-
-    async def _generate_embeddings(self, texts: List[str]) -> List[np.ndarray]:
-        return self.embedder.encode(texts)
+        return self._chunker().split(text)[0]
+
+    async def _generate_embeddings(self, texts: List[str]) -> np.ndarray:
+        return await self.query_encoder.encode(texts)
     
-    async def rebuild_index(self):
-        self.index = FAISSIndex(self.embedder.model.get_sentence_embedding_dimension(), self.config.index_path)
-        chunks_with_embeddings = self.db.get_all_chunks_with_embeddings()
+    async def rebuild_index(self, progress: Callable[['Progress'], None] = None):
+        """
+        Retrain the index and re-add every stored embedding. progress, if given,
+        is called with a Progress after every batch. Cancelling the call keeps
+        the current index.
+        """
+        self._check_writable()
+        with self.metrics.timer('rebuild_seconds'):
+            await self._rebuild_index(progress)
 
-        # Process embeddings in batches
-        batch_size = self.config.batch_size
-        for i in range(0, len(chunks_with_embeddings), batch_size):
-            batch = chunks_with_embeddings[i:i+batch_size]
-            embeddings = [np.frombuffer(chunk['embedding'], dtype=np.float32) for chunk in batch]
-            embeddings_array = np.vstack(embeddings)
-            self.index.add(embeddings_array)
-
-        self.index.save()
-        print(f"Index rebuilt with {len(chunks_with_embeddings)} embeddings.")
-
-    async def search(self, query: str, top_k: int = 3) -> List[Dict[str, float]]:
-        query = self._preprocess_query(query)
-        query_embedding = await self._generate_embeddings([query])
-        scores, indices = self.index.search(query_embedding, top_k)
-
-        results = []
-        for i in range(top_k):
-            chunk = self.db.get_chunk(int(indices[0][i]) + 1)
-            if chunk:
-                results.append({
-                    "score": float(scores[0][i]),
-                    "chunk": chunk['content']
-                })
+    async def _rebuild_index(self, progress: Callable[['Progress'], None] = None):
+        self._sync_vector_store()
+        # Start from an empty index rather than reloading the file being replaced;
+        # searches keep using the old one until the new one is complete
+        index = open_index(self.dim, params=self._index_params())
+        if not index.is_trained:
+            index.train(self._training_sample(self.dim, index.params['train_sample_size']))
+
+        # Stream (id, embedding) batches so peak memory follows the batch size, not the corpus
+        total = 0
+        expected = self._expected_index_count()
+        start = time.perf_counter()
+        for chunk_ids, embeddings in self._embedding_batches():
+            index.add(embeddings, chunk_ids)
+            total += len(chunk_ids)
+            if progress is not None:
+                progress(Progress('rebuild', total, time.perf_counter() - start, chunks_total=expected))
+            # Lets searches on the same loop run, and a cancel land, between batches
+            await asyncio.sleep(0)
+
+        with self._index_lock.write():
+            self.index = index
+        self._save_index(self.config.index_path)
+        print(f"Index rebuilt with {total} embeddings.")
+
+        # Reclaim superseded rows once they outnumber the live ones
+        if self.vector_store is not None and len(self.vector_store) > 2 * self.db.count_chunks():
+            self.vector_store.compact(self.db.get_chunk_ids())
+
+    def _indexed_chunk_ids(self) -> np.ndarray:
+        return self.db.representative_ids() if self.config.dedup_index else self.db.get_chunk_ids()
+
+    def _embedding_batches(self):
+        # The memory-mapped store avoids pulling every BLOB through sqlite3
+        if self.vector_store is None:
+            batches = self.db.iter_embedding_batches(self.config.rebuild_batch_size)
+            if not self.config.dedup_index:
+                return batches
+            indexed = self._indexed_chunk_ids()
+            return ((ids[keep], embeddings[keep]) for ids, embeddings in batches for keep in [np.isin(ids, indexed)])
+        positions = self.vector_store.live_positions(self._indexed_chunk_ids())
+        return self.vector_store.iter_batches(positions, self.config.rebuild_batch_size)
+
+    def _training_sample(self, dim: int, sample_size: int) -> np.ndarray:
+        if self.vector_store is None:
+            sample = self.db.sample_embeddings(sample_size)
+            return decode_embeddings(sample, dim)
+        positions = self.vector_store.live_positions(self._indexed_chunk_ids())
+        if len(positions) > sample_size:
+            positions = np.sort(np.random.default_rng().choice(positions, size=sample_size, replace=False))
+        return self.vector_store.rows(positions)
+
+    async def search(self, query: str, top_k: int = 3, filters: Dict = None) -> List[Dict[str, float]]:
+        return (await self.search_many([query], top_k, filters))[0]
+
+    async def search_many(self, queries: List[str], top_k: int = 3, filters: Dict = None) -> List[List[Dict[str, float]]]:
+        """
+        Search for several queries at once: one encode over all queries, one
+        index search over the query matrix and one SQL lookup for every hit.
+
+        Args:
+        filters (Dict, optional): Restrict results to chunks of matching documents:
+            document_ids (list of document row ids), filename (glob pattern),
+            ingested_after / ingested_before (datetime, ISO-8601 string or Unix time).
+
+        Returns:
+        List[List[Dict[str, float]]]: Per-query results, in the same order as queries.
+        """
+        if not queries:
+            return []
+        # SQLite and index work runs on the search pool, so concurrent searches
+        # proceed in parallel and an ingest on the loop is not held up by them
+        loop = asyncio.get_running_loop()
+        with self.metrics.timer('search_seconds'):
+            allowed_ids = owners = None
+            if filters:
+                with self.metrics.timer('filter_seconds'):
+                    allowed_ids, owners = await loop.run_in_executor(self._search_executor, self._resolve_filters, filters)
+                if len(allowed_ids) == 0:
+                    return [[] for _ in queries]
+            with self.metrics.timer('query_preprocess_seconds'):
+                queries = [self._preprocess_query(query) for query in queries]
+            query_embeddings = await self._embed_queries(queries)
+            results = await loop.run_in_executor(
+                self._search_executor, self._search_embedded, query_embeddings, top_k, allowed_ids, owners
+            )
+        self.metrics.inc('queries_total', len(queries))
         return results
-    
+
+    def _search_embedded(self, query_embeddings: np.ndarray, top_k: int, allowed_ids: np.ndarray = None,
+                         owners: np.ndarray = None):
+        if self.config.read_only:
+            self._reload_index_if_compacted()
+        with self.metrics.timer('index_search_seconds'):
+            scores, indices = self._index_search(query_embeddings, top_k, allowed_ids)
+        if owners is not None:
+            # Hits are on allowed_ids, sorted; report each as its allowed chunk
+            indices = np.asarray(indices)
+            positions = np.searchsorted(allowed_ids, indices).clip(max=len(allowed_ids) - 1)
+            indices = np.where(indices >= 0, owners[positions], -1)
+        with self.metrics.timer('hydrate_seconds'):
+            return self._hydrate(np.asarray(scores), np.asarray(indices))
+
+    def _reload_index_if_compacted(self):
+        """
+        Read-only mode: reopen the index once its generation shows the writer
+        compacted it, checking at most every index_reload_interval seconds.
+        The new file is mapped on the side, so searches only wait for the swap.
+        """
+        now = time.monotonic()
+        # One search checks while the others go ahead on the current index
+        if now < self._next_reload_check or not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_reload_check = now + self.config.index_reload_interval
+            generation = read_generation(self.config.index_path)
+            if generation == self.index_generation:
+                return
+            with self.metrics.timer('index_reload_seconds'):
+                index = self._open_index()
+                with self._index_lock.write():
+                    index, self.index = self.index, index
+                    index.close()
+            self.index_generation = generation
+            print(f"Reloaded index generation {generation} from {self.config.index_path}")
+        finally:
+            self._reload_lock.release()
+
+    def _resolve_filters(self, filters: Dict) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        The chunk ids to search for the filters, and, when they differ from
+        the chunks the filters matched, the matched chunk each one stands for.
+        """
+        unknown = set(filters) - set(SEARCH_FILTERS)
+        if unknown:
+            raise ValueError(f"Unknown search filters: {sorted(unknown)}; expected some of {list(SEARCH_FILTERS)}")
+        # Malformed values (e.g. from a JSON request) are the caller's error
+        # too, rather than a TypeError from deep in the lookup
+        try:
+            document_ids = filters.get('document_ids')
+            if document_ids is not None:
+                document_ids = [operator.index(document_id) for document_id in document_ids]
+            filename = filters.get('filename')
+            if filename is not None and not isinstance(filename, str):
+                raise TypeError("filename must be a string")
+            ingested_after = _to_timestamp(filters.get('ingested_after'))
+            ingested_before = _to_timestamp(filters.get('ingested_before'))
+        except TypeError as e:
+            raise ValueError(f"Invalid search filter value: {e}") from e
+        db = self.db.reader()
+        chunk_ids = db.filter_chunk_ids(
+            document_ids=document_ids, filename=filename,
+            ingested_after=ingested_after, ingested_before=ingested_before,
+        )
+        # The index only holds the first chunk of a repeated passage, which may
+        # belong to a document the filters exclude: search for it, and report
+        # its hits as the matched chunk (the lowest id when several share it)
+        if self.config.dedup_index and len(chunk_ids):
+            representatives = db.representatives_of(chunk_ids.tolist())
+            order = np.lexsort((chunk_ids, representatives))
+            allowed_ids, first = np.unique(representatives[order], return_index=True)
+            return allowed_ids, chunk_ids[order][first]
+        return chunk_ids, None
+
+    def _index_search(self, query_embeddings: np.ndarray, top_k: int, allowed_ids: np.ndarray = None):
+        if allowed_ids is None:
+            with self._index_lock.read():
+                return self.index.search(query_embeddings, top_k)
+        # A small ID set is scored exactly from its own vectors, costing about as
+        # much as a search over an index of that size; HNSW graph walks can also
+        # miss sparse allowed ids. Larger sets filter inside the index scan.
+        if len(allowed_ids) <= self.config.filter_exact_max or not self.index.supports_id_filter:
+            return self._exact_search(query_embeddings, top_k, allowed_ids)
+        with self._index_lock.read():
+            return self.index.search(query_embeddings, top_k, allowed_ids)
+
+    def _exact_search(self, query_embeddings: np.ndarray, top_k: int, allowed_ids: np.ndarray):
+        ids, vectors = self.db.reader().get_embeddings(allowed_ids.tolist())
+        nq = len(query_embeddings)
+        scores = np.full((nq, top_k), -np.inf, dtype=np.float32)
+        indices = np.full((nq, top_k), -1, dtype=np.int64)
+        if len(ids) == 0:
+            return scores, indices
+        all_scores = query_embeddings @ vectors.T
+        k = min(top_k, len(ids))
+        top = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(all_scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        scores[:, :k] = np.take_along_axis(top_scores, order, axis=1)
+        indices[:, :k] = ids[np.take_along_axis(top, order, axis=1)]
+        return scores, indices
+
+    async def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        # Cached embeddings are reused; the misses are encoded together in one batch
+        cached = [self.query_cache.get(self.config.model_name, query) for query in queries]
+        missing = list(dict.fromkeys(query for query, embedding in zip(queries, cached) if embedding is None))
+        if missing:
+            with self.metrics.timer('query_encode_seconds'):
+                encoded = dict(zip(missing, await self._generate_embeddings(missing)))
+            for query, embedding in encoded.items():
+                self.query_cache.put(self.config.model_name, query, embedding)
+            cached = [encoded[query] if embedding is None else embedding for query, embedding in zip(queries, cached)]
+        return np.vstack(cached)
+
+    def _hydrate(self, scores: np.ndarray, indices: np.ndarray) -> List[List[Dict[str, float]]]:
+        # FAISS pads with -1 when fewer than k vectors match
+        hit_ids = list(dict.fromkeys(int(chunk_id) for chunk_id in indices.ravel() if chunk_id >= 0))
+        chunks = {chunk['id']: chunk for chunk in self.db.reader().get_chunks(hit_ids)}
+
+        all_results = []
+        for query_scores, query_indices in zip(scores, indices):
+            all_results.append([
+                {
+                    "score": float(score),
+                    "chunk": chunks[int(chunk_id)]['content'],
+                    "filename": chunks[int(chunk_id)]['filename']
+                }
+                for score, chunk_id in zip(query_scores, query_indices)
+                if int(chunk_id) in chunks
+            ])
+        return all_results
+
     def _preprocess_query(self, query: str) -> str:
         # Remove punctuation, lowercase, etc.
         return query.lower().strip()
     
-    async def generate_response(self, query: str, k: int = 3) -> str:
-        results = await self.search(query, k)
+    async def generate_response(self, query: str, k: int = 3, filters: Dict = None) -> str:
+        results = await self.search(query, k, filters)
+        return self._format_response(query, k, results)
+
+    async def generate_responses(self, queries: List[str], k: int = 3, filters: Dict = None) -> List[str]:
+        all_results = await self.search_many(queries, k, filters)
+        return [self._format_response(query, k, results) for query, results in zip(queries, all_results)]
+
+    def _format_response(self, query: str, k: int, results: List[Dict[str, float]]) -> str:
         if not results:
             return "I couldn't find any relevant information for your query."
         
@@ -118,6 +827,111 @@ class EmbeddingRetrievalSystem:
         return response
 
     def close(self):
-        self.index.save()
+        self.ingest_encoder.shutdown()
+        self.query_encoder.shutdown()
+        self._search_executor.shutdown(wait=True)
+        if not self.config.read_only:
+            self.query_cache.save()
+            self._save_index()
+        if self.config.metrics_path:
+            self.metrics.stop_periodic_dump()
+            self.metrics.dump_json(self.config.metrics_path)
         self.db.close()
-        self._save_processed_files()
\ No newline at end of file
+        if not self.config.read_only:
+            self._save_processed_files()
+
+SEARCH_FILTERS = ('document_ids', 'filename', 'ingested_after', 'ingested_before')
+
+def _to_timestamp(value):
+    # Filter dates may be given as datetime/date, ISO-8601 strings or Unix time
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    return value.timestamp()
+
+class Progress:
+    """
+    State of a running add_documents ('ingest') or rebuild_index ('rebuild')
+    call, as passed to its progress callback. An ingest counts changed files
+    and the chunks written so far; a rebuild counts chunks against the total.
+    """
+    def __init__(self, operation: str, chunks_done: int, elapsed: float, files_done: int = None,
+                 files_total: int = None, chunks_total: int = None):
+        self.operation = operation
+        self.chunks_done = chunks_done
+        self.elapsed = elapsed
+        self.files_done = files_done
+        self.files_total = files_total
+        self.chunks_total = chunks_total
+
+    @property
+    def rate(self) -> float:
+        """Chunks per second so far."""
+        return self.chunks_done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def fraction(self) -> Optional[float]:
+        """Share of the work done, or None when the total is unknown."""
+        if self.files_total:
+            return self.files_done / self.files_total
+        if self.chunks_total:
+            return self.chunks_done / self.chunks_total
+        return None
+
+class _ReadWriteLock:
+    """
+    Any number of readers or one writer. A waiting writer holds off new
+    readers, so index updates are not starved by a steady stream of searches.
+    Not reentrant.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+class _PendingDocument:
+    """
+    A changed file moving through the ingest pipeline.
+    """
+    def __init__(self, filename: str, path: str, mtime: float):
+        self.filename = filename
+        self.path = path
+        self.mtime = mtime
+        self.content = None
+        self.text_hash = None
+        self.doc_id = None
+        self.chunk_count = 0
+        self.written = 0
@@ -0,0 +1,315 @@
+"""
+HTTP/JSON query service around EmbeddingRetrievalSystem.
+
+Run from the repository root:
+    python -m src.server --config config/config.yaml
+
+Endpoints:
+    POST /search  {"query": "...", "top_k": 3, "filters": {...}}  -> {"results": [...]}
+    GET  /health                                -> {"status": "ok"}
+    GET  /metrics                               -> Prometheus text format
+
+Concurrent /search requests are collected by a MicroBatcher and answered with
+one search_many call per batch (per distinct filters within a batch), so one
+encode and one index search serve the whole batch. filters is optional; see
+EmbeddingRetrievalSystem.search_many for its keys.
+
+With --workers N, N forked processes accept connections on one shared
+socket, each serving read-only from the same memory-mapped index and
+database (see serve_workers) while a separate process ingests.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import traceback
+from typing import Dict, List, Tuple, Union
+
+from .config import Config
+from .metrics import Metrics
+
+# Largest top_k a request may ask for
+MAX_TOP_K = 1000
+
+class MicroBatcher:
+    """
+    Groups concurrent searches into batches of at most max_batch_size, waiting
+    at most max_wait_ms after the first request of a batch for more to arrive.
+    """
+    def __init__(self, retrieval_system, max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        self.retrieval_system = retrieval_system
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.requests = 0
+        self._queue = asyncio.Queue()
+        self._worker = None
+
+    def start(self):
+        if self._worker is None:
+            self._worker = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def search(self, query: str, top_k: int = 3, filters: Dict = None) -> List[Dict[str, float]]:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, top_k, filters or None, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[str, int, Dict, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Requests with different filters cannot share an index search
+            groups = {}
+            for request in batch:
+                groups.setdefault(json.dumps(request[2], sort_keys=True, default=str), []).append(request)
+            for group in groups.values():
+                await self._search_group(group)
+
+    async def _search_group(self, group: List[Tuple[str, int, Dict, asyncio.Future]]):
+        # One search at the largest k in the group; each caller gets its own prefix
+        top_k = max(top_k for _, top_k, _, _ in group)
+        queries = [query for query, _, _, _ in group]
+        filters = group[0][2]
+        try:
+            if filters:
+                all_results = await self.retrieval_system.search_many(queries, top_k, filters)
+            else:
+                all_results = await self.retrieval_system.search_many(queries, top_k)
+        except Exception as e:
+            for _, _, _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.requests += len(group)
+        for (_, k, _, future), results in zip(group, all_results):
+            if not future.done():
+                future.set_result(results[:k])
+
+class QueryServer:
+    """
+    Minimal HTTP/1.1 server (keep-alive, JSON bodies) on asyncio streams.
+    With metrics, GET /metrics serves them along with the batcher's counters.
+    Given a listening sock, it accepts on that instead of binding host:port.
+    Requests are validated before they join a batch, so a malformed one is
+    answered 400 without failing the others.
+    """
+    def __init__(self, batcher: MicroBatcher, host: str = '127.0.0.1', port: int = 8000, metrics: Metrics = None,
+                 sock: socket.socket = None, max_top_k: int = MAX_TOP_K):
+        self.batcher = batcher
+        self.max_top_k = max_top_k
+        self.host = host
+        self.port = port
+        self.sock = sock
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.add_collector(lambda: {'server_batches': batcher.batches, 'server_requests': batcher.requests})
+        self._server = None
+
+    async def start(self):
+        self.batcher.start()
+        if self.sock is not None:
+            self._server = await asyncio.start_server(self._handle_connection, sock=self.sock)
+        else:
+            self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f"Query server listening on http://{self.host}:{self.port}")
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await self.batcher.stop()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, payload = await self._route(method, path, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if isinstance(payload, str):
+                    content_type, data = 'text/plain; version=0.0.4', payload.encode('utf-8')
+                else:
+                    content_type, data = 'application/json', json.dumps(payload).encode('utf-8')
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[str, Union[Dict, str]]:
+        if method == 'GET' and path == '/health':
+            return '200 OK', {'status': 'ok'}
+        if method == 'GET' and path == '/metrics' and self.metrics is not None:
+            return '200 OK', self.metrics.to_prometheus()
+        if method == 'POST' and path == '/search':
+            try:
+                request = json.loads(body or b'{}')
+                query = request['query']
+                top_k = int(request.get('top_k', 3))
+                filters = request.get('filters')
+                if not isinstance(query, str):
+                    raise TypeError("query must be a string")
+                if not 1 <= top_k <= self.max_top_k:
+                    raise ValueError("top_k out of range")
+                if filters is not None and not isinstance(filters, dict):
+                    raise TypeError("filters must be an object")
+            except (ValueError, KeyError, TypeError):
+                return '400 Bad Request', {
+                    'error': f'expected JSON body {{"query": str, "top_k": int from 1 to {self.max_top_k}, "filters": object}}'
+                }
+            try:
+                return '200 OK', {'results': await self.batcher.search(query, top_k, filters)}
+            except ValueError as e:
+                return '400 Bad Request', {'error': str(e)}
+            except Exception as e:
+                return '500 Internal Server Error', {'error': str(e)}
+        return '404 Not Found', {'error': f"no route for {method} {path}"}
+
+async def serve(config: Config, host: str, port: int, watch: bool = False, sock: socket.socket = None,
+                embedder=None):
+    from .retrieval_system import EmbeddingRetrievalSystem
+
+    retrieval_system = EmbeddingRetrievalSystem(config, embedder)
+    batcher = MicroBatcher(retrieval_system, config.max_batch_size, config.max_batch_wait_ms)
+    server = QueryServer(batcher, host, port, retrieval_system.metrics, sock)
+    # Watch mode ingests documents_path changes on the serving loop; its
+    # SQLite writes run on the ingest writer thread
+    watcher = asyncio.ensure_future(retrieval_system.watch()) if watch else None
+    try:
+        await server.serve_forever()
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+            await asyncio.gather(watcher, return_exceptions=True)
+        await server.stop()
+        retrieval_system.close()
+
+def serve_workers(config: Config, host: str, port: int, workers: int):
+    """
+    Serve read-only from `workers` forked processes accepting on one listening
+    socket. The model is loaded before forking, so the workers start with its
+    memory shared copy-on-write; each then maps the same index file, whose
+    pages the OS page cache shares between them, and opens the database
+    read-only. Memory therefore grows by little more than each worker's
+    caches and connections, and every worker picks up a newly compacted
+    index through its generation file (see Config.index_reload_interval).
+    """
+    from .embedding import Embedder
+
+    config.read_only = True
+    sock = socket.create_server((host, port))
+    embedder = Embedder(config.model_name, config.embedding_dim)
+    if config.preload_model:
+        embedder.model
+    print(f"Starting {workers} read-only query workers on http://{host}:{sock.getsockname()[1]}")
+    pids = []
+    for i in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                if config.metrics_path:
+                    root, ext = os.path.splitext(config.metrics_path)
+                    config.metrics_path = f"{root}.worker{i}{ext}"
+                asyncio.run(serve(config, host, port, sock=sock, embedder=embedder))
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        pids.append(pid)
+    sock.close()
+
+    def stop_workers(signum, frame):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    # Ctrl-C reaches the workers too; a SIGTERM to the parent is passed on
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, stop_workers)
+    for pid in pids:
+        os.waitpid(pid, 0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve retrieval queries over HTTP/JSON")
+    parser.add_argument('--config', default='config/config.yaml')
+    parser.add_argument('--host', default=None)
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--watch', action='store_true', help="keep documents_path ingested while serving")
+    parser.add_argument('--read-only', action='store_true',
+                        help="serve from the index and database another process writes")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="read-only worker processes sharing the memory-mapped index (implies --read-only)")
+    args = parser.parse_args()
+    if args.watch and (args.read_only or args.workers > 1):
+        parser.error("--watch writes the index; run it in a separate process from read-only workers")
+    if args.workers > 1 and not hasattr(os, 'fork'):
+        parser.error("--workers needs os.fork, which this platform does not have")
+
+    config = Config(args.config)
+    host, port = args.host or config.server_host, args.port or config.server_port
+    if args.workers > 1:
+        serve_workers(config, host, port, args.workers)
+        return
+    if args.read_only:
+        config.read_only = True
+    try:
+        asyncio.run(serve(config, host, port, args.watch))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import json
+import os
+from typing import Dict, Iterator, Tuple
+
+import numpy as np
+
+from .quantization import PRECISION_DTYPES, dequantize_embeddings, quantize_embeddings
+
+class VectorStore:
+    """
+    Append-only embedding matrix on disk, read back as memory-mapped NumPy views.
+
+    Three files share the base path: `<path>.vectors` holds the rows back to back,
+    `<path>.ids` holds the parallel int64 chunk ids and `<path>.meta.json` records
+    the dimension and dtype. Rows are stored as float32, float16 or int8 (see
+    quantization.py) and always read back as float32. Rows are never rewritten in place; a chunk that is
+    deleted or re-inserted leaves its old row behind until compact(), so readers
+    resolve the live rows against the `chunks` table.
+    """
+    def __init__(self, path: str, dim: int = None, dtype: str = 'float32'):
+        self.path = path
+        self.vectors_path = path + '.vectors'
+        self.ids_path = path + '.ids'
+        self.meta_path = path + '.meta.json'
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r') as f:
+                meta = json.load(f)
+            self.dim = meta['dim']
+            self.dtype = np.dtype(meta['dtype'])
+        else:
+            if dim is None:
+                raise ValueError(f"No vector store at {path}; a dimension is required to create one")
+            self.dim = dim
+            self.dtype = np.dtype(PRECISION_DTYPES[dtype])
+            with open(self.meta_path, 'w') as f:
+                json.dump({'dim': self.dim, 'dtype': self.dtype.name}, f)
+        self._row_bytes = self.dim * self.dtype.itemsize
+        self.count = self._recover()
+
+    def _recover(self) -> int:
+        # An append interrupted between the two files leaves them uneven;
+        # only rows present in both are kept.
+        vector_rows = os.path.getsize(self.vectors_path) // self._row_bytes if os.path.exists(self.vectors_path) else 0
+        id_rows = os.path.getsize(self.ids_path) // 8 if os.path.exists(self.ids_path) else 0
+        count = min(vector_rows, id_rows)
+        for file_path, row_bytes in ((self.vectors_path, self._row_bytes), (self.ids_path, 8)):
+            with open(file_path, 'ab') as f:
+                f.truncate(count * row_bytes)
+        return count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, ids, vectors):
+        vectors = np.asarray(vectors).reshape(-1, self.dim)
+        if vectors.dtype != self.dtype:
+            vectors = quantize_embeddings(vectors, self.dtype.name)
+        vectors = np.ascontiguousarray(vectors)
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        if len(ids) != len(vectors):
+            raise ValueError(f"Got {len(ids)} ids for {len(vectors)} vectors")
+        with open(self.vectors_path, 'ab') as f:
+            f.write(vectors.tobytes())
+        with open(self.ids_path, 'ab') as f:
+            f.write(ids.tobytes())
+        self.count += len(ids)
+
+    def vectors(self) -> np.ndarray:
+        """
+        Read-only (count, dim) view of every stored row, including superseded ones.
+        """
+        if self.count == 0:
+            return np.empty((0, self.dim), dtype=self.dtype)
+        return np.memmap(self.vectors_path, dtype=self.dtype, mode='r', shape=(self.count, self.dim))
+
+    def ids(self) -> np.ndarray:
+        if self.count == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.memmap(self.ids_path, dtype=np.int64, mode='r', shape=(self.count,))
+
+    def live_positions(self, live_ids: np.ndarray) -> np.ndarray:
+        """
+        Row positions holding the current embedding of each id in live_ids.
+        SQLite may reuse a deleted rowid, so the last row written for an id wins.
+        """
+        ids = np.asarray(self.ids())
+        if len(ids) == 0:
+            return np.empty(0, dtype=np.int64)
+        unique_ids, reversed_index = np.unique(ids[::-1], return_index=True)
+        last_positions = len(ids) - 1 - reversed_index
+        return np.sort(last_positions[np.isin(unique_ids, live_ids)])
+
+    def rows(self, positions: np.ndarray) -> np.ndarray:
+        """
+        Copy the given row positions out of the mapping as float32.
+        """
+        return dequantize_embeddings(np.asarray(self.vectors()[positions]))
+
+    def iter_batches(self, positions: np.ndarray, batch_size: int) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Yield (ids, float32 vectors) for the given row positions, batch by batch.
+        Only the rows of the current batch are copied out of the mapping.
+        """
+        ids = self.ids()
+        vectors = self.vectors()
+        for start in range(0, len(positions), batch_size):
+            batch = positions[start:start + batch_size]
+            yield np.asarray(ids[batch]), dequantize_embeddings(np.asarray(vectors[batch]))
+
+    def check_consistency(self, live_ids: np.ndarray) -> Dict[str, int]:
+        """
+        Compare the store with the chunk ids in the database.
+
+        Returns:
+        Dict[str, int]: live rows, chunks missing from the store and stale
+            rows that compact() would drop.
+        """
+        live_ids = np.asarray(live_ids, dtype=np.int64)
+        positions = self.live_positions(live_ids)
+        return {
+            'live': len(positions),
+            'missing': len(live_ids) - len(positions),
+            'stale': self.count - len(positions),
+        }
+
+    def compact(self, live_ids: np.ndarray, batch_size: int = 65536):
+        """
+        Rewrite the store with only the current row of each live id.
+        """
+        positions = self.live_positions(np.asarray(live_ids, dtype=np.int64))
+        ids = self.ids()
+        vectors = self.vectors()
+        tmp_vectors, tmp_ids = self.vectors_path + '.tmp', self.ids_path + '.tmp'
+        with open(tmp_vectors, 'wb') as vector_file, open(tmp_ids, 'wb') as id_file:
+            for start in range(0, len(positions), batch_size):
+                batch = positions[start:start + batch_size]
+                vector_file.write(np.ascontiguousarray(vectors[batch]).tobytes())
+                id_file.write(np.ascontiguousarray(ids[batch]).tobytes())
+        del ids, vectors
+        os.replace(tmp_vectors, self.vectors_path)
+        os.replace(tmp_ids, self.ids_path)
+        self.count = len(positions)
+        print(f"Compacted vector store to {self.count} rows")
+
+    def migrate_from_database(self, db, batch_size: int = 4096):
+        """
+        Fill the store from the embedding BLOBs of an existing database.
+        """
+        for chunk_ids, embeddings in db.iter_embedding_batches(batch_size):
+            self.append(chunk_ids, embeddings)
+        print(f"Migrated {self.count} embeddings from the database into {self.vectors_path}")
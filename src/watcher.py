@@ -0,0 +1,257 @@
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import threading
+from typing import Callable, Dict, Iterator, List, Tuple
+
+DOCUMENT_SUFFIX = '.txt'
+
+def scan_documents(root: str, subdir: str = '') -> Iterator[Tuple[str, float]]:
+    """
+    Walk root (or root/subdir) with os.scandir and yield (name, mtime) for every
+    document, where name is its path relative to root with '/' separators.
+    """
+    stack = [subdir]
+    while stack:
+        relative = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(root, relative) if relative else root)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        with entries:
+            for entry in entries:
+                name = f"{relative}/{entry.name}" if relative else entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(name)
+                    elif entry.name.endswith(DOCUMENT_SUFFIX) and entry.is_file():
+                        yield name, entry.stat().st_mtime
+                except FileNotFoundError:
+                    # Removed between listing and stat; its delete event follows
+                    continue
+
+class Changes:
+    """
+    One debounced batch of changes under a watched directory. changed holds the
+    documents that exist now (new, edited or renamed to); removed holds paths
+    that no longer exist, and every document under a removed directory is gone too.
+    """
+    def __init__(self, changed: Dict[str, float], removed: List[str]):
+        self.changed = changed
+        self.removed = removed
+
+    def __bool__(self):
+        return bool(self.changed or self.removed)
+
+class DirectoryWatcher:
+    """
+    Recursively watches root and groups changes into batches: next_batch()
+    returns once no path has changed for debounce seconds, or max_delay seconds
+    after the first change of a steady stream.
+
+    Uses inotify on Linux, so only changed paths are looked at; elsewhere, or
+    with backend='poll', it rescans the tree every poll_interval seconds.
+    """
+    def __init__(self, root: str, debounce: float = 1.0, poll_interval: float = 2.0,
+                 backend: str = 'auto', max_delay: float = None):
+        if backend not in ('auto', 'inotify', 'poll'):
+            raise ValueError(f"Unknown watch backend: {backend}")
+        if backend == 'auto':
+            backend = 'inotify' if _Inotify.available() else 'poll'
+        self.root = root
+        self.debounce = debounce
+        self.max_delay = max_delay if max_delay is not None else 10 * debounce
+        self.poll_interval = poll_interval
+        self.backend = backend
+        self._touched = None
+        self._loop = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Start watching; call from the event loop that will call next_batch().
+        Changes from this point on are reported.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._touched = asyncio.Queue()
+        if self.backend == 'inotify':
+            source = _Inotify(self.root)
+            target = lambda: source.run(self._report, self._stop)
+        else:
+            snapshot = dict(scan_documents(self.root))
+            target = lambda: self._poll(snapshot)
+        self._thread = threading.Thread(target=target, name='directory-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _report(self, path: str):
+        # Called on the backend thread
+        self._loop.call_soon_threadsafe(self._touched.put_nowait, path)
+
+    def _poll(self, snapshot: Dict[str, float]):
+        while not self._stop.wait(self.poll_interval):
+            current = dict(scan_documents(self.root))
+            for name in current.keys() | snapshot.keys():
+                if current.get(name) != snapshot.get(name):
+                    self._report(name)
+            snapshot = current
+
+    async def next_batch(self) -> Changes:
+        """
+        Wait for changes and return them once they settle.
+        """
+        loop = asyncio.get_running_loop()
+        touched = {await self._touched.get()}
+        deadline = loop.time() + self.max_delay
+        while True:
+            timeout = min(self.debounce, deadline - loop.time())
+            if timeout <= 0:
+                break
+            try:
+                touched.add(await asyncio.wait_for(self._touched.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return self._resolve(touched)
+
+    def _resolve(self, touched) -> Changes:
+        # What happened in between does not matter, only what is there now:
+        # a file created and deleted within one batch is neither changed nor
+        # removed, a rename is the old path removed and the new one changed
+        changed, removed = {}, []
+        for path in sorted(touched):
+            full_path = os.path.join(self.root, path) if path else self.root
+            if os.path.isdir(full_path):
+                # A directory moved in (or a queue overflow, reported as the root)
+                changed.update(scan_documents(self.root, path))
+                removed.append(path)
+            elif os.path.isfile(full_path):
+                if path.endswith(DOCUMENT_SUFFIX):
+                    changed[path] = os.stat(full_path).st_mtime
+            else:
+                removed.append(path)
+        return Changes(changed, removed)
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+_EVENT = struct.Struct('iIII')
+
+class _Inotify:
+    """
+    inotify through ctypes: one watch per directory, added for the whole tree at
+    start and for directories as they are created or moved in.
+    """
+    _libc = None
+
+    @classmethod
+    def available(cls) -> bool:
+        if not sys.platform.startswith('linux'):
+            return False
+        if cls._libc is None:
+            try:
+                cls._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+                cls._libc.inotify_init1
+            except (OSError, AttributeError):
+                cls._libc = False
+        return bool(cls._libc)
+
+    def __init__(self, root: str):
+        if not self.available():
+            raise OSError("inotify is not available")
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.root = root
+        self.paths: Dict[int, str] = {}
+        self._add_tree('')
+
+    def _add_tree(self, relative: str):
+        stack = [relative]
+        while stack:
+            relative = stack.pop()
+            full_path = os.path.join(self.root, relative) if relative else self.root
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(full_path), _WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                if error in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                raise OSError(error, f"Cannot watch {full_path}: {os.strerror(error)}")
+            self.paths[wd] = relative
+            try:
+                with os.scandir(full_path) as entries:
+                    stack.extend(
+                        f"{relative}/{entry.name}" if relative else entry.name
+                        for entry in entries if entry.is_dir(follow_symlinks=False)
+                    )
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
+    def _remove_tree(self, relative: str):
+        # Watches follow the inode, so a directory moved away keeps reporting
+        # under its old name until its watches are dropped
+        prefix = relative + '/'
+        for wd, path in list(self.paths.items()):
+            if path == relative or path.startswith(prefix):
+                self._libc.inotify_rm_watch(self.fd, wd)
+                del self.paths[wd]
+
+    def run(self, report: Callable[[str], None], stop: threading.Event):
+        try:
+            while not stop.is_set():
+                ready, _, _ = select.select([self.fd], [], [], 0.2)
+                if ready:
+                    for path in self._read_events():
+                        report(path)
+        finally:
+            os.close(self.fd)
+
+    def _read_events(self) -> Iterator[str]:
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0').decode(errors='surrogateescape')
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost: have the whole tree compared
+                yield ''
+                continue
+            directory = self.paths.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.paths[wd]
+                continue
+            if mask & IN_DELETE_SELF:
+                continue
+            path = f"{directory}/{name}" if directory else name
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(path)
+                elif mask & IN_MOVED_FROM:
+                    self._remove_tree(path)
+            yield path
@@ -0,0 +1,85 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Coroutine
+
+class BackgroundWorker:
+    """
+    An event loop running on a daemon thread, for callers that must not block
+    on async work, such as a GUI's main thread. Coroutines submitted from any
+    thread share the loop, so the retrieval system's executors, caches and
+    locks persist between calls.
+    """
+    def __init__(self, name: str = 'background-worker'):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """
+        Run coro on the loop. The returned future's request_cancel() cancels
+        the task, and the future only completes once the task has finished
+        unwinding.
+        """
+        future = _TaskFuture(self.loop)
+
+        def start():
+            future.task = self.loop.create_task(coro)
+            future.task.add_done_callback(future.copy_result)
+
+        self.loop.call_soon_threadsafe(start)
+        return future
+
+    async def _cancel_tasks(self):
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        """
+        Cancel the tasks still running, wait for them to unwind, and stop the loop.
+        """
+        if self.loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self._cancel_tasks(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+class _TaskFuture(concurrent.futures.Future):
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        super().__init__()
+        self._loop = loop
+        self.task = None
+
+    def request_cancel(self) -> bool:
+        """
+        Ask the task to cancel, without waiting for it. Returns False if the
+        future is already done. The request is not a promise: the future ends
+        cancelled only if the task lets CancelledError through, and may still
+        hold a result or an exception.
+        """
+        if self.done():
+            return False
+        # Scheduled after the task is created, since the loop runs callbacks in order
+        self._loop.call_soon_threadsafe(lambda: self.task.cancel())
+        return True
+
+    def cancel(self) -> bool:
+        # As with any Future, True only if the future is cancelled on return;
+        # the task is still running, so this is usually False after a request
+        self.request_cancel()
+        return self.cancelled()
+
+    def copy_result(self, task: asyncio.Task):
+        if task.cancelled():
+            super().cancel()
+        elif task.exception() is not None:
+            self.set_exception(task.exception())
+        else:
+            self.set_result(task.result())
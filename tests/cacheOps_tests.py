@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+from src.cache import DocumentTextCache, QueryEmbeddingCache
+
+class TestQueryEmbeddingCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = QueryEmbeddingCache(max_size=2)
+        cache.put("model", "a", np.array([1.0]))
+        cache.put("model", "b", np.array([2.0]))
+        cache.get("model", "a")
+        cache.put("model", "c", np.array([3.0]))
+
+        self.assertIsNone(cache.get("model", "b"))
+        self.assertEqual(cache.get("model", "a").tolist(), [1.0])
+        self.assertEqual(cache.get("model", "c").tolist(), [3.0])
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def test_key_includes_model(self):
+        cache = QueryEmbeddingCache()
+        cache.put("model-a", "query", np.array([1.0]))
+
+        self.assertIsNone(cache.get("model-b", "query"))
+
+    def test_ttl_expiry(self):
+        cache = QueryEmbeddingCache(ttl=10)
+        with patch('src.cache.time.time', return_value=100.0):
+            cache.put("model", "query", np.array([1.0]))
+        with patch('src.cache.time.time', return_value=105.0):
+            self.assertIsNotNone(cache.get("model", "query"))
+        with patch('src.cache.time.time', return_value=111.0):
+            self.assertIsNone(cache.get("model", "query"))
+        self.assertEqual(len(cache), 0)
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "cache.npz")
+            cache = QueryEmbeddingCache(path=path)
+            cache.put("model", "first", np.array([1.0, 2.0]))
+            cache.put("model", "second", np.array([3.0, 4.0]))
+            cache.save()
+
+            reloaded = QueryEmbeddingCache(max_size=1, path=path)
+            self.assertEqual(len(reloaded), 1)
+            self.assertEqual(reloaded.get("model", "second").tolist(), [3.0, 4.0])
+
+class TestDocumentTextCache(unittest.TestCase):
+    def test_lru_eviction_and_stats(self):
+        cache = DocumentTextCache(max_size=2)
+        cache.put((1, 'h1'), "one")
+        cache.put((2, 'h2'), "two")
+        self.assertEqual(cache.get((1, 'h1')), "one")
+        cache.put((3, 'h3'), "three")
+
+        self.assertIsNone(cache.get((2, 'h2')))
+        # A reused row id with different content is a different document
+        self.assertIsNone(cache.get((1, 'other')))
+        self.assertEqual(cache.get((3, 'h3')), "three")
+        self.assertEqual(cache.stats(), {'size': 2, 'hits': 2, 'misses': 2, 'hit_rate': 0.5})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from src.chunking import SentenceChunker, TokenChunker, chunk_spans, count_words, split_sentences
+
+class TestSentenceChunker(unittest.TestCase):
+    def test_split_sentences_keeps_punctuation(self):
+        self.assertEqual(split_sentences(" One. Two!  Three?\nFour"), ["One.", "Two!", "Three?", "Four"])
+        self.assertEqual(split_sentences("   "), [])
+
+    def test_groups_sentences(self):
+        chunks, lengths = SentenceChunker(2).split("A b. C d. E f.")
+        self.assertEqual(chunks, ["A b. C d.", "E f."])
+        self.assertEqual(lengths, [9, 4])
+
+class TestTokenChunker(unittest.TestCase):
+    def test_packs_sentences_within_budget(self):
+        chunker = TokenChunker(count_words, max_tokens=5)
+        chunks, lengths = chunker.split("One two three. Four five. Six seven eight nine.")
+        self.assertEqual(chunks, ["One two three. Four five.", "Six seven eight nine."])
+        self.assertEqual(lengths, [5, 4])
+
+    def test_splits_long_sentence_at_words(self):
+        chunker = TokenChunker(count_words, max_tokens=3)
+        chunks, lengths = chunker.split("a b c d e f g. Short.")
+        self.assertEqual(chunks, ["a b c", "d e f", "g. Short."])
+        self.assertTrue(all(length <= 3 for length in lengths))
+
+    def test_overlap_repeats_trailing_sentences(self):
+        chunker = TokenChunker(count_words, max_tokens=4, overlap=2)
+        chunks, _ = chunker.split("A b. C d. E f. G h.")
+        self.assertEqual(chunks, ["A b. C d.", "C d. E f.", "E f. G h."])
+        # A carried sentence never pushes the next chunk over the budget
+        chunks, _ = TokenChunker(count_words, max_tokens=4, overlap=2).split("A b. C d e f.")
+        self.assertEqual(chunks, ["A b.", "C d e f."])
+
+    def test_rejects_overlap_not_below_budget(self):
+        with self.assertRaises(ValueError):
+            TokenChunker(count_words, max_tokens=4, overlap=4)
+
+class TestChunkSpans(unittest.TestCase):
+    def test_spans_slice_chunks_from_text(self):
+        text = "A b. C d. E f. A b."
+        chunks, _ = TokenChunker(count_words, max_tokens=4, overlap=2).split(text + " A b.")
+        spans = chunk_spans(text + " A b.", chunks)
+        self.assertEqual([(text + " A b.")[start:end] for start, end in spans], chunks)
+
+    def test_normalized_whitespace_has_no_span(self):
+        text = "One.\n\nTwo. Three."
+        chunks, _ = SentenceChunker(2).split(text)
+        self.assertEqual(chunk_spans(text, chunks), [None, (11, 17)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,302 @@
+import sqlite3
+import tempfile
+import os
+import unittest
+from unittest.mock import patch
+import numpy as np
+from src.database import Database, content_hash
+
+class TestDatabase(unittest.TestCase):
+    def setUp(self):
+        self.db = Database(':memory:')
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_add_document(self):
+        doc_id = self.db.add_document("test.txt", "Test content")
+
+        self.assertTrue(self.db.document_exists("test.txt"))
+        self.assertEqual(self.db.get_document(doc_id), {'filename': "test.txt", 'content': "Test content"})
+
+    def test_add_chunks(self):
+        doc_id = self.db.add_document("test.txt", "Chunk 1. Chunk 2", commit=False)
+        self.db.add_chunks(doc_id, ["Chunk 1", "Chunk 2"], [b'emb1', b'emb2'], commit=False)
+        self.db.commit()
+
+        chunks = self.db.get_all_chunks_with_embeddings()
+        self.assertEqual([c['content'] for c in chunks], ["Chunk 1", "Chunk 2"])
+        self.assertEqual([c['embedding'] for c in chunks], [b'emb1', b'emb2'])
+
+    def test_add_chunks_returns_ids(self):
+        doc_id = self.db.add_document("test.txt", "Chunk 1. Chunk 2")
+        ids = self.db.add_chunks(doc_id, ["Chunk 1", "Chunk 2"], [b'emb1', b'emb2'])
+
+        self.assertEqual([self.db.get_chunk(i)['content'] for i in ids], ["Chunk 1", "Chunk 2"])
+
+    def test_get_chunks(self):
+        doc_id = self.db.add_document("test.txt", "Chunk 1. Chunk 2")
+        ids = self.db.add_chunks(doc_id, ["Chunk 1", "Chunk 2"], [b'emb1', b'emb2'])
+
+        chunks = self.db.get_chunks([ids[1], -1, ids[0]])
+        self.assertEqual(chunks, [
+            {'id': ids[1], 'content': "Chunk 2", 'filename': "test.txt"},
+            {'id': ids[0], 'content': "Chunk 1", 'filename': "test.txt"},
+        ])
+
+    def test_iter_embedding_batches(self):
+        vectors = np.arange(10, dtype=np.float32).reshape(5, 2)
+        doc_id = self.db.add_document("test.txt", "content")
+        ids = self.db.add_chunks(doc_id, [f"Chunk {i}" for i in range(5)], [v.tobytes() for v in vectors])
+
+        batches = list(self.db.iter_embedding_batches(2))
+
+        self.assertEqual([len(batch_ids) for batch_ids, _ in batches], [2, 2, 1])
+        self.assertEqual(np.concatenate([batch_ids for batch_ids, _ in batches]).tolist(), ids)
+        np.testing.assert_array_equal(np.vstack([embeddings for _, embeddings in batches]), vectors)
+
+    def test_delete_document(self):
+        doc_id = self.db.add_document("test.txt", "Chunk 1. Chunk 2")
+        ids = self.db.add_chunks(doc_id, ["Chunk 1", "Chunk 2"], [b'emb1', b'emb2'])
+        other_id = self.db.add_document("other.txt", "Chunk 3")
+        self.db.add_chunks(other_id, ["Chunk 3"], [b'emb3'])
+
+        self.assertEqual(self.db.delete_document("test.txt"), ids)
+        self.assertFalse(self.db.document_exists("test.txt"))
+        self.assertEqual([c['content'] for c in self.db.get_all_chunks()], ["Chunk 3"])
+
+    def test_chunk_changes_track_writes_since_index_save(self):
+        doc_id = self.db.add_document("test.txt", "Chunk 1")
+        self.db.add_chunks(doc_id, ["Chunk 1"], [b'emb1'])
+        self.assertEqual(self.db.chunk_changes(), (1, 0))
+        self.db.mark_indexed(1, stale_vectors=3)
+        self.assertEqual(self.db.stale_vectors(), 3)
+        self.db.delete_document("missing.txt")
+        self.assertEqual(self.db.chunk_changes(), (1, 1))
+        self.db.delete_document("test.txt")
+        self.assertEqual(self.db.chunk_changes(), (2, 1))
+
+    def test_uncommitted_chunks_roll_back(self):
+        doc_id = self.db.add_document("test.txt", "Chunk 1", commit=False)
+        self.db.add_chunks(doc_id, ["Chunk 1"], [b'emb1'], commit=False)
+        self.db.conn.rollback()
+
+        self.assertFalse(self.db.document_exists("test.txt"))
+        self.assertEqual(self.db.get_all_chunks(), [])
+
+    def test_filter_chunk_ids(self):
+        with patch('src.database.time.time', return_value=100.0):
+            notes_id = self.db.add_document("notes/a.txt", "A")
+        with patch('src.database.time.time', return_value=200.0):
+            report_id = self.db.add_document("report.txt", "B")
+        notes_chunks = self.db.add_chunks(notes_id, ["A1", "A2"], [b'e', b'e'])
+        report_chunks = self.db.add_chunks(report_id, ["B1"], [b'e'])
+
+        self.assertEqual(self.db.filter_chunk_ids(document_ids=[report_id]).tolist(), report_chunks)
+        self.assertEqual(self.db.filter_chunk_ids(filename="notes/*").tolist(), notes_chunks)
+        self.assertEqual(self.db.filter_chunk_ids(ingested_after=150).tolist(), report_chunks)
+        self.assertEqual(self.db.filter_chunk_ids(ingested_before=150).tolist(), notes_chunks)
+        self.assertEqual(self.db.filter_chunk_ids(filename="*.txt", ingested_after=150, document_ids=[notes_id]).tolist(), [])
+        self.assertEqual(self.db.filter_chunk_ids().tolist(), notes_chunks + report_chunks)
+
+    def test_content_hashes(self):
+        embedding = np.ones(4, dtype=np.float32)
+        first_id = self.db.add_document("a.txt", "Shared. A")
+        second_id = self.db.add_document("b.txt", "Shared. B")
+        first_chunks = self.db.add_chunks(first_id, ["Shared", "A"], [embedding.tobytes()] * 2)
+        second_chunks = self.db.add_chunks(second_id, ["Shared", "B"], [embedding.tobytes()] * 2)
+        shared, only_b = content_hash("Shared"), content_hash("B")
+
+        self.assertEqual(self.db.get_document_hash("a.txt"), content_hash("Shared. A"))
+        self.assertIsNone(self.db.get_document_hash("missing.txt"))
+        reused = self.db.get_embeddings_by_hash([shared, content_hash("new")])
+        self.assertEqual(list(reused), [shared])
+        np.testing.assert_array_equal(reused[shared], embedding)
+        self.assertEqual(self.db.get_chunk_hashes("b.txt"), {shared: second_chunks[0], only_b: second_chunks[1]})
+        self.assertEqual(self.db.first_chunk_ids([shared, only_b]), {shared: first_chunks[0], only_b: second_chunks[1]})
+        # The second "Shared" chunk is a duplicate of the first
+        self.assertEqual(self.db.representative_ids().tolist(), first_chunks + second_chunks[1:])
+        self.assertEqual(self.db.representative_ids(second_chunks).tolist(), second_chunks[1:])
+
+    def test_adds_created_at_to_existing_database(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'old.db')
+            conn = sqlite3.connect(path)
+            conn.execute('CREATE TABLE documents (id INTEGER PRIMARY KEY, filename TEXT, content TEXT)')
+            conn.execute("INSERT INTO documents (filename, content) VALUES ('old.txt', 'x')")
+            conn.commit()
+            conn.close()
+
+            db = Database(path)
+            db.add_document("new.txt", "y")
+            rows = db.cursor.execute('SELECT filename, created_at IS NULL FROM documents ORDER BY id').fetchall()
+            db.close()
+        self.assertEqual(rows, [('old.txt', 1), ('new.txt', 0)])
+
+    def test_chunk_ids_are_never_reused(self):
+        first_id = self.db.add_document("a.txt", "A")
+        self.db.add_chunks(first_id, ["A"], [b'emb'])
+        second_id = self.db.add_document("b.txt", "B")
+        last = self.db.add_chunks(second_id, ["B"], [b'emb'])[0]
+        self.db.delete_document("b.txt")
+        doc_id = self.db.add_document("b.txt", "C")
+        self.assertGreater(self.db.add_chunks(doc_id, ["C"], [b'emb'])[0], last)
+
+    def test_migrates_chunks_to_ids_that_are_never_reused(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'old.db')
+            conn = sqlite3.connect(path)
+            conn.execute('CREATE TABLE chunks (id INTEGER PRIMARY KEY, document_id INTEGER, content TEXT, embedding BLOB)')
+            conn.executemany('INSERT INTO chunks (id, document_id, content) VALUES (?, 1, ?)', [(1, 'a'), (7, 'b')])
+            conn.commit()
+            conn.close()
+
+            db = Database(path)
+            db.cursor.execute("DELETE FROM chunks WHERE id = 7")
+            doc_id = db.add_document("new.txt", "c")
+            new_id = db.add_chunks(doc_id, ["c"], [b'emb'])[0]
+            contents = [c['content'] for c in db.get_all_chunks()]
+            db.close()
+        self.assertEqual(new_id, 8)
+        self.assertEqual(contents, ['a', 'c'])
+
+    def test_migrates_documents_to_ids_that_are_never_reused(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'old.db')
+            conn = sqlite3.connect(path)
+            conn.execute('CREATE TABLE documents (id INTEGER PRIMARY KEY, filename TEXT, content TEXT)')
+            conn.executemany('INSERT INTO documents (id, filename, content) VALUES (?, ?, ?)', [(1, 'a.txt', 'a'), (7, 'b.txt', 'b')])
+            conn.commit()
+            conn.close()
+
+            db = Database(path)
+            db.delete_document('b.txt')
+            new_id = db.add_document("c.txt", "c")
+            self.assertTrue(db.document_exists('a.txt'))
+            db.close()
+        self.assertEqual(new_id, 8)
+
+    def test_lookups_use_indexes(self):
+        plans = [
+            self.db.cursor.execute(f'EXPLAIN QUERY PLAN {query}', ('x',)).fetchall()
+            for query in ('SELECT 1 FROM documents WHERE filename = ?', 'SELECT id FROM chunks WHERE document_id = ?')
+        ]
+        self.assertIn('idx_documents_filename', str(plans[0]))
+        self.assertIn('idx_chunks_document_id', str(plans[1]))
+
+class TestCompressedText(unittest.TestCase):
+    TEXT = "First sentence.\n\nSecond one. Third here."
+    CHUNKS = ["First sentence. Second one.", "Third here."]
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'db.sqlite')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def add(self, db):
+        doc_id = db.add_document("doc.txt", self.TEXT)
+        ids = db.add_chunks(doc_id, self.CHUNKS, [b'e1', b'e2'], spans=[None, (29, 40)])
+        return doc_id, ids
+
+    def assert_reads_back(self, db, doc_id, ids):
+        self.assertEqual(db.get_document(doc_id), {'filename': "doc.txt", 'content': self.TEXT})
+        self.assertEqual([db.get_chunk(i)['content'] for i in ids], self.CHUNKS)
+        self.assertEqual([c['content'] for c in db.get_chunks(ids[::-1])], self.CHUNKS[::-1])
+        self.assertEqual([c['content'] for c in db.reader().get_chunks(ids)], self.CHUNKS)
+        self.assertEqual([c['content'] for c in db.get_all_chunks_with_embeddings()], self.CHUNKS)
+
+    def test_stores_one_compressed_copy(self):
+        db = Database(self.path, compress_text=True)
+        doc_id, ids = self.add(db)
+        self.assertEqual(db.cursor.execute('SELECT content FROM documents').fetchall(), [(None,)])
+        # The first chunk is not a substring of the text, so it keeps its own copy
+        self.assertEqual(
+            db.cursor.execute('SELECT content, span_start, span_end FROM chunks ORDER BY id').fetchall(),
+            [("First sentence. Second one.", None, None), (None, 29, 40)]
+        )
+        self.assert_reads_back(db, doc_id, ids)
+        self.assertGreater(db.document_cache_stats()['hits'], 0)
+        db.close()
+
+    def test_converts_plain_rows(self):
+        db = Database(self.path)
+        doc_id, ids = self.add(db)
+        self.assertEqual(db.cursor.execute('SELECT COUNT(*) FROM chunks WHERE content IS NULL').fetchone()[0], 0)
+
+        self.assertEqual(db.compress_stored_text(), 1)
+        self.assertEqual(db.cursor.execute('SELECT COUNT(*) FROM documents WHERE content IS NULL').fetchone()[0], 1)
+        self.assertEqual(db.cursor.execute('SELECT COUNT(*) FROM chunks WHERE content IS NULL').fetchone()[0], 1)
+        self.assert_reads_back(db, doc_id, ids)
+        db.close()
+
+    def test_incomplete_document_does_not_read_deleted_documents_text(self):
+        db = Database(self.path, compress_text=True)
+        old_id = db.add_document("a.txt", "Alpha one. Alpha two.", complete=False)
+        db.add_chunks(old_id, ["Alpha one.", "Alpha two."], [b'e1', b'e2'], spans=[(0, 10), (11, 21)])
+        self.assertEqual([c['content'] for c in db.get_all_chunks()], ["Alpha one.", "Alpha two."])
+        db.delete_document("a.txt")
+
+        # Written a batch at a time, and read back before mark_complete()
+        doc_id = db.add_document("b.txt", "Bravo three. Bravo four.", complete=False)
+        ids = db.add_chunks(doc_id, ["Bravo three."], [b'e3'], spans=[(0, 12)])
+        ids += db.add_chunks(doc_id, ["Bravo four."], [b'e4'], spans=[(13, 24)])
+        self.assertNotEqual(doc_id, old_id)
+        self.assertEqual([c['content'] for c in db.get_chunks(ids)], ["Bravo three.", "Bravo four."])
+        db.close()
+
+class TestDatabaseReader(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.temp_dir.name, 'db.sqlite'), read_pool_size=2)
+
+    def tearDown(self):
+        self.db.close()
+        self.temp_dir.cleanup()
+
+    def test_file_database_uses_wal(self):
+        self.assertEqual(self.db.cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+
+    def test_reader_sees_only_committed_rows(self):
+        reader = self.db.reader()
+        self.assertIsNot(reader, self.db)
+        doc_id = self.db.add_document("a.txt", "A")
+        self.db.add_chunks(doc_id, ["A"], [b'emb'], commit=False)
+        # The writer's open transaction does not block the reader or leak into it
+        self.assertTrue(reader.document_exists("a.txt"))
+        self.assertEqual(reader.count_chunks(), 0)
+        self.db.commit()
+        self.assertEqual(reader.count_chunks(), 1)
+
+    def test_reader_rejects_writes(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            self.db.reader().add_document("a.txt", "A")
+
+    def test_reader_connections_are_pooled(self):
+        reader = self.db.reader()
+        for _ in range(5):
+            reader.count_chunks()
+        self.assertEqual(len(self.db._readers), 1)
+
+    def test_read_only_database(self):
+        self.db.add_document("a.txt", "A")
+        read_only = Database(self.db.db_path, read_only=True)
+        try:
+            self.assertTrue(read_only.document_exists("a.txt"))
+            with self.assertRaises(sqlite3.OperationalError):
+                read_only.add_document("b.txt", "B")
+            self.db.add_document("c.txt", "C")
+            self.assertTrue(read_only.reader().document_exists("c.txt"))
+        finally:
+            read_only.close()
+        with self.assertRaises(FileNotFoundError):
+            Database(os.path.join(self.temp_dir.name, 'missing.sqlite'), read_only=True)
+
+    def test_memory_database_reads_through_writer(self):
+        db = Database(':memory:')
+        self.assertIs(db.reader(), db)
+        db.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,260 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+import numpy as np
+from src.indexing import FAISSIndex, ShardedFAISSIndex, open_index, read_generation
+
+def random_vectors(n, dim=16, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+class TestShardedFAISSIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self.temp_dir.name, 'faiss_index.bin')
+        self.vectors = random_vectors(200)
+        self.ids = np.arange(1, 201, dtype=np.int64)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_search_matches_single_index(self):
+        single = FAISSIndex(16)
+        sharded = open_index(16, params={'shards': 4})
+        self.assertIsInstance(sharded, ShardedFAISSIndex)
+        for index in (single, sharded):
+            index.add(self.vectors, self.ids)
+            index.remove([3, 4, 5])
+
+        queries = random_vectors(5, seed=1)
+        expected_scores, expected_ids = single.search(queries, 10)
+        scores, ids = sharded.search(queries, 10)
+        np.testing.assert_array_equal(ids, expected_ids)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+        self.assertEqual(sharded.ntotal, 197)
+
+        # Fewer vectors than k leaves -1 padding at the end, as FAISS does
+        small = open_index(16, params={'shards': 4})
+        small.add(self.vectors[:2], self.ids[:2])
+        _, ids = small.search(queries[:1], 5)
+        self.assertEqual(sorted(ids[0][:2]), [1, 2])
+        self.assertEqual(ids[0][2:].tolist(), [-1, -1, -1])
+
+    def test_save_writes_only_dirty_shards(self):
+        index = open_index(16, params={'shards': 4})
+        index.add(self.vectors, self.ids)
+        index.save(self.index_path)
+
+        reopened = open_index(index_path=self.index_path, params={'shards': 4}, mmap=True)
+        self.assertEqual(reopened.ntotal, 200)
+        self.assertEqual(reopened._shards, [None] * 4)
+
+        with patch.object(FAISSIndex, '_write_segment', autospec=True) as write_segment:
+            reopened.add(random_vectors(1, seed=2), [204])
+            reopened.save()
+        self.assertEqual([call.args[0].index_path for call in write_segment.call_args_list], [self.index_path + '.0'])
+        self.assertEqual([shard is None for shard in reopened._shards], [False, True, True, True])
+
+    def test_concurrent_searches_load_each_shard_once(self):
+        index = open_index(16, params={'shards': 4})
+        index.add(self.vectors, self.ids)
+        index.save(self.index_path)
+        reopened = open_index(index_path=self.index_path, params={'shards': 4}, mmap=True)
+
+        deserialize = FAISSIndex._deserialize_faiss_index
+        def slow_deserialize(shard, *args):
+            # Widens the window between checking for a shard and storing it
+            time.sleep(0.05)
+            return deserialize(shard, *args)
+
+        barrier = threading.Barrier(8)
+        def search():
+            barrier.wait()
+            reopened.search(self.vectors[:1], 5)
+
+        with patch.object(FAISSIndex, '_deserialize_faiss_index', autospec=True, side_effect=slow_deserialize) as load, \
+                patch('src.indexing.ThreadPoolExecutor', wraps=ThreadPoolExecutor) as executor:
+            threads = [threading.Thread(target=search) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(load.call_count, 4)
+        self.assertEqual(executor.call_count, 1)
+        reopened.close()
+
+    def test_generation_counts_shard_compactions(self):
+        index = ShardedFAISSIndex(16, self.index_path, {'shards': 4})
+        index.add(self.vectors, self.ids)
+        index.save()
+        self.assertEqual(read_generation(self.index_path), 1)
+        self.assertFalse(os.path.exists(self.index_path + '.0.generation'))
+
+        index.add(random_vectors(1, seed=2), [101])
+        index.save()
+        self.assertEqual(read_generation(self.index_path), 1)
+        index.compact()
+        self.assertEqual(read_generation(self.index_path), 2)
+
+        read_only = open_index(index_path=self.index_path, read_only=True)
+        self.assertEqual(read_only.ntotal, 201)
+        with self.assertRaises(RuntimeError):
+            read_only.remove([1])
+
+    def test_trains_every_shard(self):
+        index = open_index(16, params={'type': 'ivf', 'nlist': 4, 'nprobe': 4, 'shards': 3})
+        self.assertFalse(index.is_trained)
+        index.train(self.vectors)
+        index.add(self.vectors, self.ids)
+
+        self.assertTrue(all(index._shard(i).is_trained for i in range(3)))
+        _, ids = index.search(self.vectors[:1], 1)
+        self.assertEqual(ids[0][0], 1)
+
+class TestIndexSegments(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.index_path = os.path.join(self.temp_dir.name, 'faiss_index.bin')
+        self.vectors = random_vectors(100)
+        self.ids = np.arange(1, 101, dtype=np.int64)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def saved_index(self, params=None):
+        index = FAISSIndex(16, self.index_path, params)
+        if not index.is_trained:
+            index.train(self.vectors)
+        index.add(self.vectors, self.ids)
+        index.save()
+        return index
+
+    def test_small_changes_append_segments(self):
+        index = self.saved_index()
+        base_mtime = os.stat(self.index_path).st_mtime_ns
+        index.remove([1, 2])
+        index.add(random_vectors(1, seed=2), [2])
+        index.add(random_vectors(3, seed=3), [101, 102, 103])
+        index.remove([103])
+        index.save()
+
+        self.assertEqual(os.stat(self.index_path).st_mtime_ns, base_mtime)
+        self.assertTrue(os.path.exists(self.index_path + '.seg0.npz'))
+        reopened = FAISSIndex(index_path=self.index_path, mmap=True)
+        self.assertEqual(reopened.num_segments, 1)
+        self.assertEqual(sorted(reopened.ids().tolist()), sorted(index.ids().tolist()))
+        queries = random_vectors(4, seed=4)
+        np.testing.assert_array_equal(reopened.search(queries, 5)[1], index.search(queries, 5)[1])
+
+    def test_compacts_past_max_segments_or_ratio(self):
+        index = self.saved_index({'max_segments': 2})
+        for i in range(3):
+            index.add(random_vectors(1, seed=i), [200 + i])
+            index.save()
+        # The third save found two segments and rewrote the file instead
+        self.assertEqual(index.num_segments, 0)
+        self.assertFalse(os.path.exists(self.index_path + '.segments.json'))
+        reopened = FAISSIndex(index_path=self.index_path, mmap=True)
+        self.assertTrue(reopened.mapped)
+        self.assertEqual(reopened.ntotal, 103)
+
+        reopened.add(random_vectors(30, seed=5), np.arange(300, 330))
+        reopened.save()
+        self.assertEqual(reopened.num_segments, 0)
+
+    def test_interrupted_compaction_is_not_replayed_twice(self):
+        index = self.saved_index({'type': 'hnsw'})
+        index.add(random_vectors(2, seed=2), [101, 102])
+        index.save()
+        leftovers = {}
+        for name in ('.segments.json', '.seg0.npz'):
+            with open(self.index_path + name, 'rb') as f:
+                leftovers[name] = f.read()
+        index.compact()
+        # As if the process died between renaming the new base and removing the segments
+        for name, data in leftovers.items():
+            with open(self.index_path + name, 'wb') as f:
+                f.write(data)
+
+        reopened = FAISSIndex(index_path=self.index_path)
+        self.assertEqual(reopened.ntotal, 102)
+        reopened.save()
+        self.assertFalse(os.path.exists(self.index_path + '.seg0.npz'))
+
+    def test_read_only_index_stays_mapped(self):
+        index = self.saved_index()
+        self.assertEqual(read_generation(self.index_path), 1)
+        index.add(random_vectors(1, seed=2), [101])
+        index.save()
+
+        read_only = FAISSIndex(index_path=self.index_path, read_only=True)
+        # Segments are left to the writer's next compaction
+        self.assertTrue(read_only.mapped)
+        self.assertEqual(read_only.ntotal, 100)
+        with self.assertRaises(RuntimeError):
+            read_only.add(random_vectors(1, seed=3), [102])
+        with self.assertRaises(RuntimeError):
+            read_only.save()
+        self.assertTrue(read_only.mapped)
+
+        index.compact()
+        self.assertEqual(read_generation(self.index_path), 2)
+        self.assertEqual(FAISSIndex(index_path=self.index_path, read_only=True).ntotal, 101)
+
+    def test_ids_per_index_type(self):
+        for params in ({'type': 'flat'}, {'type': 'ivf', 'nlist': 4}, {'type': 'hnsw'}):
+            index = FAISSIndex(16, params=params)
+            if not index.is_trained:
+                index.train(self.vectors)
+            index.add(self.vectors, self.ids)
+            self.assertEqual(sorted(index.ids().tolist()), self.ids.tolist(), params)
+
+class TestInt8Index(unittest.TestCase):
+    def test_int8_codes_cover_fixed_range(self):
+        vectors = random_vectors(200)
+        queries = random_vectors(5, seed=1)
+        exact = FAISSIndex(16)
+        exact.add(vectors, np.arange(200))
+        expected_scores, _ = exact.search(queries, 1)
+        for index_type in ('flat', 'hnsw'):
+            index = FAISSIndex(16, params={'type': index_type, 'precision': 'int8'})
+            # No first-batch training: codes span [-1, 1] however few vectors come first
+            self.assertTrue(index.is_trained)
+            self.assertEqual(index.min_train_size, 0)
+            index.add(vectors[:2], [0, 1])
+            index.add(vectors[2:], np.arange(2, 200))
+            scores, _ = index.search(queries, 1)
+            np.testing.assert_allclose(scores, expected_scores, atol=0.02)
+
+class TestFilteredSearch(unittest.TestCase):
+    def setUp(self):
+        self.vectors = random_vectors(500)
+        self.ids = np.arange(1, 501, dtype=np.int64)
+        self.allowed = np.array([7, 123, 250, 499], dtype=np.int64)
+
+    def test_id_selector_per_index_type(self):
+        queries = random_vectors(3, seed=1)
+        for params in ({'type': 'flat'}, {'type': 'ivf', 'nlist': 8, 'nprobe': 8}, {'type': 'flat', 'shards': 3}):
+            index = open_index(16, params=params)
+            if not index.is_trained:
+                index.train(self.vectors)
+            index.add(self.vectors, self.ids)
+
+            _, ids = index.search(queries, 6, self.allowed)
+            for row in ids:
+                self.assertEqual(sorted(row[:4]), self.allowed.tolist(), params)
+                self.assertEqual(row[4:].tolist(), [-1, -1], params)
+
+    def test_pq_index_rejects_filter(self):
+        index = FAISSIndex(16, params={'type': 'pq', 'pq_m': 4, 'pq_nbits': 4})
+        self.assertFalse(index.supports_id_filter)
+        index.train(self.vectors)
+        with self.assertRaises(ValueError):
+            index.search(self.vectors[:1], 3, self.allowed)
+
+if __name__ == '__main__':
+    unittest.main()
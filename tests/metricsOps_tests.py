@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+import unittest
+from src.metrics import Histogram, Metrics
+
+class TestHistogram(unittest.TestCase):
+    def test_percentiles_interpolate_within_buckets(self):
+        histogram = Histogram(buckets=(1.0, 2.0, 4.0))
+        for value in (0.5, 1.5, 1.5, 3.0):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.counts, [1, 3, 4, 4])
+        self.assertEqual(histogram.percentile(50), 1.5)
+        # Interpolation would give the bucket bound 4.0; the largest value seen is 3.0
+        self.assertEqual(histogram.percentile(100), 3.0)
+        self.assertEqual(histogram.summary()['mean'], 1.625)
+
+    def test_values_past_last_bucket(self):
+        histogram = Histogram(buckets=(1.0,))
+        histogram.observe(10.0)
+
+        self.assertEqual(histogram.counts, [0, 1])
+        self.assertEqual(histogram.percentile(99), 10.0)
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+
+    def test_prometheus_text(self):
+        self.metrics.inc('queries_total', 3)
+        self.metrics.observe('search_seconds', 0.002)
+        self.metrics.add_collector(lambda: {'index_vectors': 7})
+
+        text = self.metrics.to_prometheus()
+        self.assertIn("# TYPE retrieval_queries_total counter\nretrieval_queries_total 3\n", text)
+        self.assertIn("retrieval_index_vectors 7\n", text)
+        self.assertIn('retrieval_search_seconds_bucket{le="0.001"} 0\n', text)
+        self.assertIn('retrieval_search_seconds_bucket{le="0.0025"} 1\n', text)
+        self.assertIn("retrieval_search_seconds_count 1\n", text)
+
+    def test_timer_and_json_dump(self):
+        with self.metrics.timer('rebuild_seconds'):
+            pass
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'metrics.json')
+            self.metrics.dump_json(path)
+            with open(path, 'r') as f:
+                snapshot = json.load(f)
+
+        self.assertEqual(snapshot['histograms']['rebuild_seconds']['count'], 1)
+        self.assertEqual(snapshot['counters'], {})
+
+if __name__ == '__main__':
+    unittest.main()
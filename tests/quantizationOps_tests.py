@@ -0,0 +1,38 @@
+import unittest
+import numpy as np
+from src.quantization import decode_embeddings, encode_embeddings, quantize_embeddings
+
+class TestQuantization(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((4, 8)).astype(np.float32)
+        self.vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def test_float32_roundtrip(self):
+        blobs = encode_embeddings(self.vectors)
+        np.testing.assert_array_equal(decode_embeddings(blobs, 8), self.vectors)
+        np.testing.assert_array_equal(decode_embeddings(blobs), self.vectors)
+
+    def test_reduced_precision_roundtrip(self):
+        for precision, bytes_per_value, tolerance in (('float16', 2, 1e-3), ('int8', 1, 1 / 127)):
+            blobs = encode_embeddings(self.vectors, precision)
+            self.assertEqual(len(blobs[0]), 8 * bytes_per_value)
+            decoded = decode_embeddings(blobs, 8)
+            self.assertEqual(decoded.dtype, np.float32)
+            np.testing.assert_allclose(decoded, self.vectors, atol=tolerance)
+
+    def test_mixed_precision_blobs(self):
+        blobs = encode_embeddings(self.vectors[:2], 'int8') + encode_embeddings(self.vectors[2:], 'float32')
+
+        decoded = decode_embeddings(blobs, 8)
+        np.testing.assert_array_equal(decoded[2:], self.vectors[2:])
+        np.testing.assert_allclose(decoded[:2], self.vectors[:2], atol=1 / 127)
+
+    def test_int8_saturates(self):
+        self.assertEqual(quantize_embeddings(np.array([[2.0, -2.0]]), 'int8').tolist(), [[127, -127]])
+
+    def test_empty(self):
+        self.assertEqual(decode_embeddings([], 8).shape, (0, 8))
+
+if __name__ == '__main__':
+    unittest.main()
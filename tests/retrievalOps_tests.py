@@ -1,23 +1,68 @@
 import unittest
 import asyncio
+import copy
 import tempfile
+import threading
+import time
+import json
 import os
+import subprocess
+import sys
+import numpy as np
 from unittest.mock import Mock, patch
 from src.config import Config
 from src.retrieval_system import EmbeddingRetrievalSystem
+from src.indexing import FAISSIndex
 
 class TestEmbeddingRetrievalSystem(unittest.TestCase):
     def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
         self.config = Mock(spec=Config)
         self.config.db_path = ':memory:'
         self.config.model_name = 'test-model'
         self.config.batch_size = 2
         self.config.chunk_size = 2
+        self.config.chunk_tokens = None
+        self.config.chunk_overlap = 0
+        self.config.index_path = os.path.join(self.temp_dir.name, 'faiss_index.bin')
+        self.config.processed_files_path = self.temp_dir.name + os.sep
+        self.config.checkpoint_interval = 0
+        self.config.index_params = {'type': 'flat'}
+        self.config.query_cache_size = 16
+        self.config.query_cache_ttl = None
+        self.config.query_cache_path = None
+        self.config.ingest_workers = 2
+        self.config.ingest_queue_size = 4
+        self.config.rebuild_batch_size = 3
+        self.config.vector_store_path = None
+        self.config.vector_store_dtype = 'float32'
+        self.config.embedding_precision = 'float32'
+        self.config.encode_executor = 'thread'
+        self.config.encode_workers = 2
+        self.config.torch_threads = None
+        self.config.embedding_dim = None
+        self.config.preload_model = False
+        self.config.index_mmap = True
+        self.config.metrics_path = None
+        self.config.metrics_interval = 60
+        self.config.filter_exact_max = 256
+        self.config.dedup_index = True
+        self.config.encode_sort_batches = 8
+        self.config.search_workers = 2
+        self.config.sqlite_pragmas = {}
+        self.config.watch_debounce = 0.1
+        self.config.watch_poll_interval = 0.1
+        self.config.watch_backend = 'auto'
+        self.config.compress_text = False
+        self.config.document_cache_size = 16
+        self.config.read_only = False
+        self.config.index_reload_interval = 1.0
 
         self.retrieval_system = EmbeddingRetrievalSystem(self.config)
 
     def tearDown(self):
         self.retrieval_system.close()
+        self.temp_dir.cleanup()
 
     @patch('src.embedding.Embedder.encode')
     def test_generate_embeddings(self, mock_encode):
@@ -30,6 +75,26 @@ class TestEmbeddingRetrievalSystem(unittest.TestCase):
         self.assertEqual(result[0].tolist(), [1.0, 2.0])
         self.assertEqual(result[1].tolist(), [3.0, 4.0])
 
+    def test_generate_embeddings_does_not_block_event_loop(self):
+        release = threading.Event()
+        def slow_encode(texts):
+            release.wait(5)
+            return [[1.0, 2.0]]
+
+        async def run():
+            ticks = 0
+            with patch.object(self.retrieval_system.embedder, 'encode', side_effect=slow_encode):
+                encoding = asyncio.ensure_future(self.retrieval_system._generate_embeddings(["query"]))
+                while ticks < 3:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+                release.set()
+                return ticks, await encoding
+
+        ticks, embeddings = asyncio.run(run())
+        self.assertEqual(ticks, 3)
+        self.assertEqual(embeddings.tolist(), [[1.0, 2.0]])
+
     def test_split_into_chunks(self):
         text = "This is a test. It has multiple sentences. We want to split it."
         chunks = self.retrieval_system._split_into_chunks(text)
@@ -51,14 +116,15 @@ class TestEmbeddingRetrievalSystem(unittest.TestCase):
         # Check if document was added to the database
         self.assertTrue(self.retrieval_system.db.document_exists(filename))
         
-        # Check if chunks were added to the database and index
-        self.assertEqual(mock_index_add.call_count, 2)
+        # Both chunks fit in one embedding batch, so the index is extended once
+        self.assertEqual(mock_index_add.call_count, 1)
+        self.assertEqual(len(self.retrieval_system.db.get_all_chunks()), 2)
 
     @patch('src.embedding.Embedder.encode')
     @patch('src.indexing.FAISSIndex.search')
     def test_search(self, mock_search, mock_encode):
         mock_encode.return_value = [[1.0, 2.0]]
-        mock_search.return_value = ([0.9, 0.8], [[0, 1]])
+        mock_search.return_value = ([[0.9, 0.8]], [[1, 2]])
         
         # Add some test chunks to the database
         self.retrieval_system.db.add_document("test.txt", "Test content")
@@ -73,6 +139,22 @@ class TestEmbeddingRetrievalSystem(unittest.TestCase):
         self.assertEqual(results[0]['chunk'], "Chunk 1")
         self.assertEqual(results[1]['score'], 0.8)
         self.assertEqual(results[1]['chunk'], "Chunk 2")
+        self.assertEqual(results[1]['filename'], "test.txt")
+
+    @patch('src.embedding.Embedder.encode')
+    @patch('src.indexing.FAISSIndex.search')
+    def test_search_skips_padding(self, mock_search, mock_encode):
+        mock_encode.return_value = [[1.0, 2.0]]
+        mock_search.return_value = ([[0.9, -3.4e38, -3.4e38]], [[1, -1, -1]])
+
+        self.retrieval_system.db.add_document("test.txt", "Test content")
+        self.retrieval_system.db.add_chunk(1, "Chunk 1", b'test_embedding')
+
+        with patch.object(self.retrieval_system.db, 'get_chunk') as mock_get_chunk:
+            results = asyncio.run(self.retrieval_system.search("Test query", top_k=3))
+            mock_get_chunk.assert_not_called()
+
+        self.assertEqual([r['chunk'] for r in results], ["Chunk 1"])
 
     @patch('src.retrieval_system.EmbeddingRetrievalSystem.search')
     def test_generate_response(self, mock_search):
@@ -87,6 +169,50 @@ class TestEmbeddingRetrievalSystem(unittest.TestCase):
         self.assertIn("This is a relevant chunk.", response)
         self.assertIn("0.90", response)
 
+    def test_search_many_matches_search(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(3):
+                with open(os.path.join(temp_dir, f"doc{i}.txt"), "w") as f:
+                    f.write(f"Document {i}. Has some text. About topic {i}.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+
+        queries = ["topic 1", "Document 2", "has some text"]
+        batched = asyncio.run(self.retrieval_system.search_many(queries, top_k=4))
+        snapshot = self.retrieval_system.metrics.snapshot()
+        self.assertEqual(snapshot['counters']['queries_total'], 3)
+        for stage in ('query_preprocess_seconds', 'query_encode_seconds', 'index_search_seconds', 'hydrate_seconds'):
+            self.assertEqual(snapshot['histograms'][stage]['count'], 1)
+        self.assertEqual(snapshot['counters']['ingest_chunks_total'], 6)
+
+        self.assertEqual(len(batched), len(queries))
+        for query, results in zip(queries, batched):
+            self.assertEqual(results, asyncio.run(self.retrieval_system.search(query, top_k=4)))
+
+    @patch('src.embedding.Embedder.encode')
+    @patch('src.indexing.FAISSIndex.search')
+    def test_search_reuses_cached_query_embedding(self, mock_search, mock_encode):
+        mock_encode.return_value = [[1.0, 2.0]]
+        mock_search.return_value = ([[0.9]], [[1]])
+
+        asyncio.run(self.retrieval_system.search("Test query"))
+        asyncio.run(self.retrieval_system.search("  test QUERY "))
+
+        self.assertEqual(mock_encode.call_count, 1)
+        self.assertEqual(self.retrieval_system.query_cache.hits, 1)
+
+    @patch('src.retrieval_system.EmbeddingRetrievalSystem.search_many')
+    def test_generate_responses(self, mock_search_many):
+        mock_search_many.return_value = [
+            [{"score": 0.9, "chunk": "This is a relevant chunk."}],
+            []
+        ]
+
+        responses = asyncio.run(self.retrieval_system.generate_responses(["First query", "Second query"]))
+
+        self.assertEqual(mock_search_many.call_count, 1)
+        self.assertIn("This is a relevant chunk.", responses[0])
+        self.assertIn("couldn't find", responses[1])
+
     def test_add_documents(self):
         with tempfile.TemporaryDirectory() as temp_dir:
             # Create some test documents
@@ -102,8 +228,666 @@ class TestEmbeddingRetrievalSystem(unittest.TestCase):
             self.assertTrue(self.retrieval_system.db.document_exists("doc1.txt"))
             self.assertTrue(self.retrieval_system.db.document_exists("doc2.txt"))
 
+    def test_add_documents_batches_across_documents(self):
+        encode = self.retrieval_system.embedder.encode
+        batch_sizes = []
+        def recording_encode(texts):
+            batch_sizes.append(len(texts))
+            return encode(texts)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(5):
+                with open(os.path.join(temp_dir, f"doc{i}.txt"), "w") as f:
+                    f.write(f"Document {i}. Second sentence {i}. Third sentence {i}.")
+            with patch.object(self.retrieval_system.embedder, 'encode', side_effect=recording_encode):
+                asyncio.run(self.retrieval_system.add_documents(temp_dir))
+
+        # 5 documents x 2 chunks, batch_size 2: every batch is full
+        self.assertEqual(batch_sizes, [2] * 5)
+        self.assertEqual(self.retrieval_system.db.count_chunks(), 10)
+        self.assertEqual(self.retrieval_system.index.ntotal, 10)
+        self.assertEqual(len(self.retrieval_system.processed_files), 5)
+        chunk_ids = [c['id'] for c in self.retrieval_system.db.get_all_chunks()]
+        for chunk in self.retrieval_system.db.get_chunks(chunk_ids):
+            if chunk['content'].startswith("Document"):
+                self.assertEqual(chunk['filename'], f"doc{chunk['content'][9]}.txt")
+
+    def test_add_documents_reads_ahead_only_as_far_as_the_queues(self):
+        self.config.ingest_queue_size = 2
+        self.config.encode_sort_batches = 1
+        encode = self.retrieval_system.embedder.encode
+        read_and_split = self.retrieval_system._read_and_split
+        write_batch = self.retrieval_system._write_batch
+        reads, reads_at_first_write = [], []
+
+        def slow_encode(texts):
+            time.sleep(0.01)
+            return encode(texts)
+
+        def counting_read(*args):
+            reads.append(args[0])
+            return read_and_split(*args)
+
+        def recording_write(*args):
+            reads_at_first_write.append(len(reads))
+            return write_batch(*args)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(100):
+                with open(os.path.join(temp_dir, f"doc{i}.txt"), "w") as f:
+                    f.write(f"Document {i}. Of text.")
+            with patch.object(self.retrieval_system.embedder, 'encode', side_effect=slow_encode), \
+                    patch.object(self.retrieval_system, '_read_and_split', side_effect=counting_read), \
+                    patch.object(self.retrieval_system, '_write_batch', side_effect=recording_write):
+                asyncio.run(self.retrieval_system.add_documents(temp_dir))
+
+        self.assertEqual(len(reads), 100)
+        self.assertLess(reads_at_first_write[0], 20)
+        self.assertEqual(self.retrieval_system.db.count_chunks(), 100)
+
+    def test_add_documents_defers_index_save(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(3):
+                with open(os.path.join(temp_dir, f"doc{i}.txt"), "w") as f:
+                    f.write(f"This is document {i}.")
+
+            with patch.object(self.retrieval_system.index, 'save') as mock_save:
+                asyncio.run(self.retrieval_system.add_documents(temp_dir))
+                self.assertEqual(mock_save.call_count, 1)
+
+            self.config.checkpoint_interval = 1
+            for i in range(3):
+                with open(os.path.join(temp_dir, f"new{i}.txt"), "w") as f:
+                    f.write(f"This is new document {i}.")
+
+            with patch.object(self.retrieval_system.index, 'save') as mock_save:
+                asyncio.run(self.retrieval_system.add_documents(temp_dir))
+                # One checkpoint per document plus the final save
+                self.assertEqual(mock_save.call_count, 4)
+
+    def test_add_documents_replaces_modified_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "doc1.txt")
+            with open(path, "w") as f:
+                f.write("First version. Still the first version.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+
+            with open(path, "w") as f:
+                f.write("Second version. Now edited. And longer. Than before.")
+            os.utime(path, (0, 12345))
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+
+            chunks = self.retrieval_system.db.get_all_chunks()
+            self.assertEqual(len(chunks), 2)
+            self.assertEqual(self.retrieval_system.index.ntotal, 2)
+            self.assertEqual(len(self.retrieval_system.db.get_all_documents()), 1)
+
+            results = asyncio.run(self.retrieval_system.search("second version", top_k=2))
+            self.assertEqual({r['chunk'] for r in results}, {c['content'] for c in chunks})
+
+    def test_add_documents_handles_emptied_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "doc.txt")
+            with open(path, "w") as f:
+                f.write("Some text. To be removed.")
+            with open(os.path.join(temp_dir, "empty.txt"), "w") as f:
+                f.write("  \n")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+            self.assertEqual(set(self.retrieval_system.processed_files), {"doc.txt", "empty.txt"})
+
+            with open(path, "w") as f:
+                f.write("")
+            os.utime(path, (0, 0))
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+
+        self.assertEqual(self.retrieval_system.db.count_chunks(), 0)
+        self.assertEqual(self.retrieval_system.index.ntotal, 0)
+        self.assertEqual(self.retrieval_system.processed_files["doc.txt"], 0)
+
+    def test_add_documents_sorts_encode_batches_by_length(self):
+        self.config.chunk_tokens = 4
+        encode = self.retrieval_system.embedder.encode
+        batches = []
+        def recording_encode(texts):
+            batches.append(list(texts))
+            return encode(texts)
+
+        texts = {
+            "doc0.txt": "One two three four. Five. Six seven. Eight nine ten.",
+            "doc1.txt": "Alpha. Beta gamma delta epsilon zeta.",
+        }
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for name, text in texts.items():
+                with open(os.path.join(temp_dir, name), "w") as f:
+                    f.write(text)
+            with patch.object(self.retrieval_system.embedder, 'encode', side_effect=recording_encode):
+                asyncio.run(self.retrieval_system.add_documents(temp_dir))
+
+        lengths = [len(text.split()) for batch in batches for text in batch]
+        self.assertEqual(lengths, sorted(lengths))
+        self.assertTrue(all(len(batch) <= 2 for batch in batches))
+        # Chunks are stored in document order, each with its own embedding
+        chunks = self.retrieval_system.db.get_chunks(sorted(c['id'] for c in self.retrieval_system.db.get_all_chunks()))
+        for name, text in texts.items():
+            self.assertEqual([c['content'] for c in chunks if c['filename'] == name], self.retrieval_system._split_into_chunks(text))
+        ids, embeddings = self.retrieval_system.db.get_embeddings([c['id'] for c in chunks])
+        np.testing.assert_allclose(embeddings, encode([c['content'] for c in chunks]), rtol=1e-6)
+
+    def test_add_documents_deduplicates_by_content_hash(self):
+        encode = self.retrieval_system.embedder.encode
+        encoded = []
+        def recording_encode(texts):
+            encoded.extend(texts)
+            return encode(texts)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with open(os.path.join(temp_dir, "a.txt"), "w") as f:
+                f.write("Only in a. First. Shared passage. Here.")
+            with patch.object(self.retrieval_system.embedder, 'encode', side_effect=recording_encode):
+                asyncio.run(self.retrieval_system.add_documents(temp_dir))
+
+                # A copy of a's passage is not encoded again, nor indexed twice
+                with open(os.path.join(temp_dir, "b.txt"), "w") as f:
+                    f.write("Only in b. Second. Shared passage. Here.")
+                asyncio.run(self.retrieval_system.add_documents(temp_dir))
+                self.assertEqual(encoded.count("Shared passage. Here."), 1)
+                self.assertEqual(self.retrieval_system.db.count_chunks(), 4)
+                self.assertEqual(self.retrieval_system.index.ntotal, 3)
+
+                # Touched but unchanged: nothing is read into the DB or encoded
+                encoded.clear()
+                os.utime(os.path.join(temp_dir, "b.txt"), (0, 12345))
+                asyncio.run(self.retrieval_system.add_documents(temp_dir))
+                self.assertEqual(encoded, [])
+                self.assertEqual(len(self.retrieval_system.db.get_all_documents()), 2)
+
+                # Replacing a hands the shared passage over to b's copy
+                with open(os.path.join(temp_dir, "a.txt"), "w") as f:
+                    f.write("Only in a. Rewritten.")
+                os.utime(os.path.join(temp_dir, "a.txt"), (0, 12345))
+                asyncio.run(self.retrieval_system.add_documents(temp_dir))
+
+        self.assertEqual(self.retrieval_system.index.ntotal, 3)
+        results = asyncio.run(self.retrieval_system.search("Shared passage. Here.", top_k=3))
+        self.assertEqual([r['filename'] for r in results if r['chunk'] == "Shared passage. Here."], ["b.txt"])
+        self.assertEqual(self.retrieval_system.metrics.counters['ingest_reused_chunks_total'], 1)
+
+    def test_add_documents_trains_ivf_index(self):
+        self.config.index_params = {'type': 'ivf', 'nlist': 2, 'nprobe': 2}
+        self.retrieval_system.index = FAISSIndex(8, self.config.index_path, self.config.index_params)
+        self.assertFalse(self.retrieval_system.index.is_trained)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(4):
+                with open(os.path.join(temp_dir, f"doc{i}.txt"), "w") as f:
+                    f.write(f"Document {i}. Has two chunks. Of text.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+
+        self.assertTrue(self.retrieval_system.index.is_trained)
+        # "Of text." is shared by all four documents and indexed once
+        self.assertEqual(self.retrieval_system.db.count_chunks(), 8)
+        self.assertEqual(self.retrieval_system.index.ntotal, 5)
+        results = asyncio.run(self.retrieval_system.search("document 1", top_k=3))
+        self.assertEqual(len(results), 3)
+
     def test_rebuild_index(self):
-        self.retrieval_system.rebuild_index()
+        asyncio.run(self.retrieval_system.rebuild_index())
+
+    def test_reduced_precision_storage(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(3):
+                with open(os.path.join(temp_dir, f"doc{i}.txt"), "w") as f:
+                    f.write(f"Document {i}. Has two chunks. Of text.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+            exact = asyncio.run(self.retrieval_system.search("document 1", top_k=3))
+
+            for precision in ('float16', 'int8'):
+                self.config.embedding_precision = precision
+                # Unchanged content would be skipped, so drop the stored rows first
+                for name in os.listdir(temp_dir):
+                    self.retrieval_system.db.delete_document(name)
+                    os.utime(os.path.join(temp_dir, name), (0, 1 + len(precision)))
+                asyncio.run(self.retrieval_system.add_documents(temp_dir))
+                asyncio.run(self.retrieval_system.rebuild_index())
+
+                blob = self.retrieval_system.db.get_all_chunks_with_embeddings()[0]['embedding']
+                self.assertEqual(len(blob), 8 * (2 if precision == 'float16' else 1))
+                results = asyncio.run(self.retrieval_system.search("document 1", top_k=3))
+                self.assertEqual([r['chunk'] for r in results], [r['chunk'] for r in exact])
+                for result, expected in zip(results, exact):
+                    self.assertAlmostEqual(result['score'], expected['score'], delta=0.05)
+
+    def test_rebuild_index_from_vector_store(self):
+        self.config.vector_store_path = os.path.join(self.temp_dir.name, 'embeddings')
+        self.retrieval_system.vector_store = self.retrieval_system._open_vector_store()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "doc0.txt")
+            with open(path, "w") as f:
+                f.write("Document zero. Has two chunks. Of text.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+            for version in range(2):
+                with open(path, "w") as f:
+                    f.write(f"Document zero edit {version}. Still two chunks. Of text.")
+                os.utime(path, (0, 12345 + version))
+                asyncio.run(self.retrieval_system.add_documents(temp_dir))
+
+        before = asyncio.run(self.retrieval_system.search("document zero", top_k=5))
+        with patch.object(self.retrieval_system.db, 'iter_embedding_batches') as mock_db_batches:
+            asyncio.run(self.retrieval_system.rebuild_index())
+            mock_db_batches.assert_not_called()
+
+        self.assertEqual(self.retrieval_system.index.ntotal, 2)
+        self.assertEqual(asyncio.run(self.retrieval_system.search("document zero", top_k=5)), before)
+        # The replaced versions' rows outnumbered the live ones and were compacted away
+        self.assertEqual(len(self.retrieval_system.vector_store), 2)
+
+    def test_rebuild_index_matches_ingested_index(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(4):
+                with open(os.path.join(temp_dir, f"doc{i}.txt"), "w") as f:
+                    f.write(f"Document {i}. Has two chunks. Of text.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+
+        before = asyncio.run(self.retrieval_system.search("document 2", top_k=5))
+        asyncio.run(self.retrieval_system.rebuild_index())
+
+        self.assertEqual(self.retrieval_system.index.ntotal, 5)
+        results = asyncio.run(self.retrieval_system.search("document 2", top_k=5))
+        # Equal-scoring chunks may come back in either order
+        key = lambda r: (-r['score'], r['filename'], r['chunk'])
+        self.assertEqual(sorted(results, key=key), sorted(before, key=key))
+
+    def test_filtered_search(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for name in ("notes_a.txt", "notes_b.txt", "report.txt"):
+                with open(os.path.join(temp_dir, name), "w") as f:
+                    f.write(f"Text of {name}. Shared sentence. Of {name}.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+        report_id = [d['id'] for d in self.retrieval_system.db.get_all_documents() if d['filename'] == "report.txt"][0]
+
+        # Exact scoring of the small ID set, then the in-index IDSelector path
+        for exact_max in (256, 0):
+            self.config.filter_exact_max = exact_max
+            results = asyncio.run(self.retrieval_system.search("shared sentence", top_k=10, filters={'filename': "notes_*"}))
+            self.assertEqual(len(results), 4)
+            self.assertEqual({r['filename'] for r in results}, {"notes_a.txt", "notes_b.txt"})
+            self.assertEqual(results, sorted(results, key=lambda r: -r['score']))
+
+            results = asyncio.run(self.retrieval_system.search("shared sentence", top_k=2, filters={'document_ids': [report_id]}))
+            self.assertEqual([r['filename'] for r in results], ["report.txt", "report.txt"])
+
+        unfiltered = asyncio.run(self.retrieval_system.search("shared sentence", top_k=9))
+        results = asyncio.run(self.retrieval_system.search("shared sentence", top_k=9, filters={'ingested_after': '2000-01-01'}))
+        self.assertEqual([r['score'] for r in results], [r['score'] for r in unfiltered])
+        self.assertEqual(asyncio.run(self.retrieval_system.search("x", filters={'ingested_before': 0})), [])
+        with self.assertRaises(ValueError):
+            asyncio.run(self.retrieval_system.search("x", filters={'author': "me"}))
+        for filters in ({'document_ids': ["a"]}, {'document_ids': 3}, {'filename': 5}, {'ingested_after': [1]}):
+            with self.assertRaises(ValueError):
+                asyncio.run(self.retrieval_system.search("x", filters=filters))
+
+    def test_filtered_search_finds_passages_first_stored_elsewhere(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # b.txt is ingested first, so its copy of the shared passage is the indexed one
+            for name in ("b.txt", "a.txt"):
+                with open(os.path.join(temp_dir, name), "w") as f:
+                    f.write(f"Own text of {name}. More of {name}. Shared boilerplate disclaimer text.")
+                asyncio.run(self.retrieval_system.add_documents(temp_dir))
+
+        for exact_max in (256, 0):
+            self.config.filter_exact_max = exact_max
+            results = asyncio.run(self.retrieval_system.search("shared boilerplate", top_k=5, filters={'filename': "a.txt"}))
+            self.assertEqual(
+                sorted((r['filename'], r['chunk']) for r in results),
+                [("a.txt", "Own text of a.txt. More of a.txt."), ("a.txt", "Shared boilerplate disclaimer text.")]
+            )
+
+    def test_sharded_index_matches_single_index(self):
+        self.config.db_path = os.path.join(self.temp_dir.name, 'db.sqlite')
+        self.retrieval_system.close()
+        self.retrieval_system = EmbeddingRetrievalSystem(self.config)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(4):
+                with open(os.path.join(temp_dir, f"doc{i}.txt"), "w") as f:
+                    f.write(f"Document {i}. Has two chunks. Of text.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+        before = asyncio.run(self.retrieval_system.search("document 2", top_k=5))
+
+        self.config.index_params = {'type': 'flat', 'shards': 3}
+        asyncio.run(self.retrieval_system.rebuild_index())
+        self.retrieval_system.close()
+        self.retrieval_system = EmbeddingRetrievalSystem(self.config)
+
+        self.assertEqual(self.retrieval_system.index.num_shards, 3)
+        self.assertEqual(self.retrieval_system.index.ntotal, 5)
+        results = asyncio.run(self.retrieval_system.search("document 2", top_k=5))
+        # Equal-scoring chunks may come back in either order
+        key = lambda r: (-r['score'], r['filename'], r['chunk'])
+        self.assertEqual(sorted(results, key=key), sorted(before, key=key))
+
+    def test_restart_maps_index_without_loading_model(self):
+        self.config.db_path = os.path.join(self.temp_dir.name, 'db.sqlite')
+        self.retrieval_system.close()
+        self.retrieval_system = EmbeddingRetrievalSystem(self.config)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(2):
+                with open(os.path.join(temp_dir, f"doc{i}.txt"), "w") as f:
+                    f.write(f"Document {i}. Has two chunks. Of text.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+            before = asyncio.run(self.retrieval_system.search("document 1", top_k=3))
+            self.retrieval_system.close()
+
+            self.retrieval_system = EmbeddingRetrievalSystem(self.config)
+            self.assertFalse(self.retrieval_system.embedder.is_loaded)
+            self.assertTrue(self.retrieval_system.index.mapped)
+            self.assertEqual(self.retrieval_system.index.ntotal, 3)
+            self.assertEqual(asyncio.run(self.retrieval_system.search("document 1", top_k=3)), before)
+
+            # The first write swaps the mapping for an in-memory copy
+            with open(os.path.join(temp_dir, "doc2.txt"), "w") as f:
+                f.write("Document 2. Has two chunks. Of text.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+            self.assertFalse(self.retrieval_system.index.mapped)
+            self.assertEqual(self.retrieval_system.index.ntotal, 4)
+
+    def test_restart_repairs_index_from_chunks_table(self):
+        self.config.db_path = os.path.join(self.temp_dir.name, 'db.sqlite')
+        self.retrieval_system.close()
+        self.retrieval_system = EmbeddingRetrievalSystem(self.config)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(3):
+                with open(os.path.join(temp_dir, f"doc{i}.txt"), "w") as f:
+                    f.write(f"Document {i}. Has two chunks. Of text {i}.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+            self.retrieval_system.close()
+
+            # A crash after chunks were committed and deleted but before the index was saved
+            self.retrieval_system = EmbeddingRetrievalSystem(self.config)
+            for i in (3, 4):
+                with open(os.path.join(temp_dir, f"doc{i}.txt"), "w") as f:
+                    f.write(f"Document {i}. Has two chunks. Of text {i}.")
+            self.retrieval_system.db.delete_document(self.retrieval_system.db.get_chunks([1])[0]['filename'])
+            with patch.object(self.retrieval_system.index, 'save'):
+                asyncio.run(self.retrieval_system.add_documents(temp_dir))
+            self.retrieval_system.db.close()
+
+            self.retrieval_system = EmbeddingRetrievalSystem(self.config)
+            self.assertEqual(self.retrieval_system.index.ntotal, 8)
+            self.assertEqual(
+                sorted(self.retrieval_system.index.ids().tolist()),
+                self.retrieval_system.db.get_chunk_ids().tolist()
+            )
+
+    def test_restart_repairs_replaced_chunks_with_same_count(self):
+        self.config.db_path = os.path.join(self.temp_dir.name, 'db.sqlite')
+        self.retrieval_system.close()
+        self.retrieval_system = EmbeddingRetrievalSystem(self.config)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "a.txt")
+            with open(path, "w") as f:
+                f.write("The first version. Of this text.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+            # Written after a.txt, so replacing a.txt gives its chunk a new id
+            with open(os.path.join(temp_dir, "b.txt"), "w") as f:
+                f.write("Another document. Left alone.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+            self.retrieval_system.close()
+
+            # A crash after the new version was committed but before the index was saved
+            self.retrieval_system = EmbeddingRetrievalSystem(self.config)
+            with open(path, "w") as f:
+                f.write("The second version. Of this text.")
+            os.utime(path, (0, 0))
+            with patch.object(self.retrieval_system, '_save_index'):
+                asyncio.run(self.retrieval_system.add_documents(temp_dir))
+            self.retrieval_system.db.close()
+
+            self.retrieval_system = EmbeddingRetrievalSystem(self.config)
+            self.assertEqual(
+                sorted(self.retrieval_system.index.ids().tolist()),
+                self.retrieval_system.db.get_chunk_ids().tolist()
+            )
+            chunks = [r['chunk'] for r in asyncio.run(self.retrieval_system.search("version", top_k=2))]
+            self.assertIn("The second version. Of this text.", chunks)
+
+    def test_restart_skips_id_check_for_vectors_hnsw_cannot_remove(self):
+        self.config.db_path = os.path.join(self.temp_dir.name, 'db.sqlite')
+        self.config.index_path = os.path.join(self.temp_dir.name, 'hnsw_index.bin')
+        self.config.index_params = {'type': 'hnsw'}
+        self.retrieval_system.close()
+        self.retrieval_system = EmbeddingRetrievalSystem(self.config)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(3):
+                with open(os.path.join(temp_dir, f"doc{i}.txt"), "w") as f:
+                    f.write(f"Document {i}. Chunk two of {i}.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+        self.retrieval_system.remove_documents(["doc0.txt"])
+        self.assertEqual((self.retrieval_system.index.ntotal, self.retrieval_system.db.count_chunks()), (3, 2))
+
+        # Counted as stale at every save, so no restart diffs the ids
+        for _ in range(2):
+            self.retrieval_system.close()
+            with patch.object(FAISSIndex, 'ids') as ids:
+                self.retrieval_system = EmbeddingRetrievalSystem(self.config)
+            ids.assert_not_called()
+
+    def test_searches_run_alongside_ingest(self):
+        self.config.db_path = os.path.join(self.temp_dir.name, 'db.sqlite')
+        self.retrieval_system.close()
+        self.retrieval_system = EmbeddingRetrievalSystem(self.config)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with open(os.path.join(temp_dir, "first.txt"), "w") as f:
+                f.write("The first document. Is already indexed.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+            for i in range(20):
+                with open(os.path.join(temp_dir, f"doc{i}.txt"), "w") as f:
+                    f.write(f"Document {i}. Has two chunks. Of text {i}.")
+
+            async def ingest_and_search():
+                searches = [self.retrieval_system.search("the first document", top_k=1) for _ in range(10)]
+                return await asyncio.gather(self.retrieval_system.add_documents(temp_dir), *searches)
+
+            _, *results = asyncio.run(ingest_and_search())
+
+        # Every search found a committed chunk while the writer was busy
+        self.assertTrue(all(len(r) == 1 and r[0]['filename'] for r in results))
+        self.assertEqual(self.retrieval_system.index.ntotal, self.retrieval_system.db.count_chunks())
+
+    def test_read_only_system_follows_compactions(self):
+        self.config.db_path = os.path.join(self.temp_dir.name, 'db.sqlite')
+        self.retrieval_system.close()
+        self.retrieval_system = EmbeddingRetrievalSystem(self.config)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(8):
+                with open(os.path.join(temp_dir, f"doc{i}.txt"), "w") as f:
+                    f.write(f"Document {i}. Is already indexed.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+
+            reader_config = copy.copy(self.config)
+            reader_config.read_only = True
+            reader_config.index_reload_interval = 0
+            reader = EmbeddingRetrievalSystem(reader_config, self.retrieval_system.embedder)
+            try:
+                self.assertTrue(reader.index.mapped)
+                with self.assertRaises(RuntimeError):
+                    asyncio.run(reader.add_documents(temp_dir))
+
+                with open(os.path.join(temp_dir, "second.txt"), "w") as f:
+                    f.write("A second document. Arrives later.")
+                asyncio.run(self.retrieval_system.add_documents(temp_dir))
+                # Saved as a segment: the reader keeps its mapped base until a compaction
+                results = asyncio.run(reader.search("a second document", top_k=10))
+                self.assertEqual(len(results), 8)
+                self.assertNotIn("second.txt", {r['filename'] for r in results})
+
+                self.retrieval_system.compact_index()
+                results = asyncio.run(reader.search("a second document", top_k=10))
+                self.assertEqual(len(results), 9)
+                self.assertIn("second.txt", {r['filename'] for r in results})
+                self.assertTrue(reader.index.mapped)
+                self.assertEqual(reader.index.ntotal, self.retrieval_system.index.ntotal)
+            finally:
+                reader.close()
+        self.assertEqual(self.retrieval_system.index.ntotal, 9)
+
+    def test_add_documents_and_rebuild_report_progress(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(3):
+                with open(os.path.join(temp_dir, f"doc{i}.txt"), "w") as f:
+                    f.write(f"Document {i}. Has two chunks. Of text {i}.")
+            updates = []
+            asyncio.run(self.retrieval_system.add_documents(temp_dir, updates.append))
+
+            self.assertEqual((updates[0].files_done, updates[0].files_total, updates[0].chunks_done), (0, 3, 0))
+            last = updates[-1]
+            self.assertEqual((last.operation, last.files_done, last.chunks_done, last.fraction), ('ingest', 3, 6, 1.0))
+            self.assertEqual([u.chunks_done for u in updates], sorted(u.chunks_done for u in updates))
+
+            updates = []
+            asyncio.run(self.retrieval_system.rebuild_index(updates.append))
+            self.assertEqual([(u.chunks_done, u.chunks_total) for u in updates], [(3, 6), (6, 6)])
+            self.assertTrue(all(u.operation == 'rebuild' and u.files_total is None for u in updates))
+
+    def test_cancelled_ingest_keeps_written_documents(self):
+        # One document per write batch
+        self.config.encode_sort_batches = 1
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(4):
+                with open(os.path.join(temp_dir, f"doc{i}.txt"), "w") as f:
+                    f.write(f"Document {i}. Has two chunks. Of text {i}.")
+
+            async def cancel_after_first_document():
+                def progress(update):
+                    if update.files_done:
+                        task.cancel()
+
+                task = asyncio.ensure_future(self.retrieval_system.add_documents(temp_dir, progress))
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+
+            asyncio.run(cancel_after_first_document())
+            written = set(self.retrieval_system.processed_files)
+            self.assertTrue(written)
+            self.assertLess(len(written), 4)
+            with open(os.path.join(self.temp_dir.name, 'processed_files.json')) as f:
+                self.assertEqual(set(json.load(f)), written)
+
+            # The next run picks up the rest
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+            self.assertEqual(len(self.retrieval_system.processed_files), 4)
+            self.assertEqual(self.retrieval_system.db.count_chunks(), 8)
+
+    def test_cancelled_ingest_resumes_partly_written_document(self):
+        # Two chunks per write batch, ten chunks in the document
+        self.config.encode_sort_batches = 1
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with open(os.path.join(temp_dir, "big.txt"), "w") as f:
+                f.write(" ".join(f"Sentence {i}. Of text {i}." for i in range(10)))
+
+            async def cancel_after_first_batch():
+                def progress(update):
+                    if update.chunks_done:
+                        task.cancel()
+
+                task = asyncio.ensure_future(self.retrieval_system.add_documents(temp_dir, progress))
+                with self.assertRaises(asyncio.CancelledError):
+                    await task
+
+            asyncio.run(cancel_after_first_batch())
+            self.assertLess(self.retrieval_system.db.count_chunks(), 10)
+            self.assertIsNone(self.retrieval_system.db.get_document_hash("big.txt"))
+
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+            self.assertEqual(self.retrieval_system.db.count_chunks(), 10)
+            self.assertIsNotNone(self.retrieval_system.db.get_document_hash("big.txt"))
+            self.assertEqual(self.retrieval_system.index.ntotal, 10)
+
+    def test_add_documents_recurses_into_subdirectories(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.makedirs(os.path.join(temp_dir, 'sub'))
+            for name in ('top.txt', 'sub/nested.txt'):
+                with open(os.path.join(temp_dir, name), "w") as f:
+                    f.write(f"Text of {name}. Second sentence.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+        self.assertEqual(sorted(self.retrieval_system.processed_files), ['sub/nested.txt', 'top.txt'])
+        results = asyncio.run(self.retrieval_system.search("text", top_k=2))
+        self.assertEqual(sorted(r['filename'] for r in results), ['sub/nested.txt', 'top.txt'])
+
+    def test_watch_ingests_renames_and_removes(self):
+        def path(name):
+            return os.path.join(temp_dir, name)
+
+        def write(name, text):
+            with open(path(name), "w") as f:
+                f.write(text)
+
+        async def until(condition):
+            for _ in range(200):
+                if condition():
+                    return
+                await asyncio.sleep(0.05)
+            self.fail("watch did not catch up")
+
+        async def run():
+            watching = asyncio.ensure_future(self.retrieval_system.watch(temp_dir))
+            await until(lambda: 'a.txt' in self.retrieval_system.processed_files)
+
+            write('b.txt', "Bravo text. Second sentence.")
+            await until(lambda: 'b.txt' in self.retrieval_system.processed_files)
+            os.makedirs(path('sub'))
+            os.rename(path('a.txt'), path('sub/a.txt'))
+            await until(lambda: 'a.txt' not in self.retrieval_system.processed_files)
+            os.remove(path('b.txt'))
+            await until(lambda: 'b.txt' not in self.retrieval_system.processed_files)
+
+            watching.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await watching
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            write('a.txt', "Alpha text. Second sentence.")
+            with patch.object(self.retrieval_system.ingest_encoder, 'encode', wraps=self.retrieval_system.ingest_encoder.encode) as encode, \
+                    patch.object(self.retrieval_system, '_sync_vector_store', wraps=self.retrieval_system._sync_vector_store) as sync:
+                asyncio.run(run())
+
+        self.assertEqual(list(self.retrieval_system.processed_files), ['sub/a.txt'])
+        self.assertEqual([d['filename'] for d in self.retrieval_system.db.get_all_documents()], ['sub/a.txt'])
+        self.assertEqual(self.retrieval_system.index.ntotal, 1)
+        # a.txt and b.txt were encoded; the renamed document reused a.txt's embedding
+        self.assertEqual(sum(len(call.args[0]) for call in encode.call_args_list), 2)
+        # Only the catch-up scan scans the chunk ids for the vector store
+        self.assertEqual(sync.call_count, 1)
+
+    def test_compressed_text_returns_same_results(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for i in range(3):
+                with open(os.path.join(temp_dir, f"doc{i}.txt"), "w") as f:
+                    f.write(f"Document {i}. Has some text.\nAbout topic {i}. And more.")
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+            plain = asyncio.run(self.retrieval_system.search_many(["topic 1", "document 2"], top_k=4))
+            self.retrieval_system.close()
+
+            self.config.compress_text = True
+            self.config.db_path = os.path.join(self.temp_dir.name, 'db.sqlite')
+            self.config.index_path = os.path.join(self.temp_dir.name, 'compressed_index.bin')
+            os.remove(os.path.join(self.temp_dir.name, 'processed_files.json'))
+            self.retrieval_system = EmbeddingRetrievalSystem(self.config)
+            asyncio.run(self.retrieval_system.add_documents(temp_dir))
+
+        db = self.retrieval_system.db
+        self.assertEqual(db.cursor.execute('SELECT COUNT(*) FROM documents WHERE content IS NOT NULL').fetchone()[0], 0)
+        self.assertEqual(db.cursor.execute('SELECT COUNT(*) FROM chunks WHERE content IS NOT NULL').fetchone()[0], 0)
+        self.assertEqual(asyncio.run(self.retrieval_system.search_many(["topic 1", "document 2"], top_k=4)), plain)
+
+    def test_import_does_not_load_model_libraries(self):
+        code = (
+            "import sys, src.retrieval_system; "
+            "print(any(m in sys.modules for m in ('sentence_transformers', 'nltk', 'torch')))"
+        )
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+        self.assertEqual(output.stdout.strip(), 'False')
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import socket
+import unittest
+from unittest.mock import Mock
+from src.metrics import Metrics
+from src.server import MicroBatcher, QueryServer
+from utils.load_test import run_load
+
+class FakeRetrievalSystem:
+    def __init__(self):
+        self.calls = []
+
+    async def search_many(self, queries, top_k, filters=None):
+        self.calls.append((list(queries), top_k) + ((filters,) if filters else ()))
+        await asyncio.sleep(0.01)
+        return [[{"score": 1.0 / (rank + 1), "chunk": f"{query} {rank}"} for rank in range(top_k)] for query in queries]
+
+class TestMicroBatcher(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_requests_share_a_batch(self):
+        system = FakeRetrievalSystem()
+        batcher = MicroBatcher(system, max_batch_size=8, max_wait_ms=50)
+        batcher.start()
+
+        results = await asyncio.gather(*(batcher.search(f"q{i}", top_k=1 + i % 3) for i in range(5)))
+        await batcher.stop()
+
+        self.assertEqual(len(system.calls), 1)
+        self.assertEqual(system.calls[0], ([f"q{i}" for i in range(5)], 3))
+        self.assertEqual([len(r) for r in results], [1, 2, 3, 1, 2])
+        self.assertEqual(results[4][0]['chunk'], "q4 0")
+
+    async def test_requests_with_different_filters_search_separately(self):
+        system = FakeRetrievalSystem()
+        batcher = MicroBatcher(system, max_batch_size=8, max_wait_ms=50)
+        batcher.start()
+
+        await asyncio.gather(
+            batcher.search("a", filters={'filename': "*.md"}),
+            batcher.search("b"),
+            batcher.search("c", filters={'filename': "*.md"}),
+        )
+        await batcher.stop()
+
+        self.assertEqual(sorted(system.calls, key=len), [(["b"], 3), (["a", "c"], 3, {'filename': "*.md"})])
+
+    async def test_batch_size_limit(self):
+        system = FakeRetrievalSystem()
+        batcher = MicroBatcher(system, max_batch_size=2, max_wait_ms=50)
+        batcher.start()
+
+        await asyncio.gather(*(batcher.search(f"q{i}") for i in range(5)))
+        await batcher.stop()
+
+        self.assertEqual([len(queries) for queries, _ in system.calls], [2, 2, 1])
+
+    async def test_errors_reach_every_caller(self):
+        system = Mock()
+        async def failing_search_many(queries, top_k):
+            raise RuntimeError("index unavailable")
+        system.search_many = failing_search_many
+        batcher = MicroBatcher(system, max_wait_ms=10)
+        batcher.start()
+
+        results = await asyncio.gather(batcher.search("a"), batcher.search("b"), return_exceptions=True)
+        await batcher.stop()
+
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+
+class TestQueryServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.system = FakeRetrievalSystem()
+        self.server = QueryServer(MicroBatcher(self.system, max_batch_size=16, max_wait_ms=5), port=0)
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    async def _request(self, method, path, body=b''):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.server.port)
+        writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        response = await reader.read()
+        writer.close()
+        head, _, payload = response.partition(b'\r\n\r\n')
+        return head.split(b'\r\n')[0].decode(), json.loads(payload)
+
+    async def test_search(self):
+        status, payload = await self._request('POST', '/search', json.dumps({'query': 'hello', 'top_k': 2}).encode())
+
+        self.assertEqual(status, 'HTTP/1.1 200 OK')
+        self.assertEqual([r['chunk'] for r in payload['results']], ["hello 0", "hello 1"])
+
+    async def test_bad_request_and_unknown_route(self):
+        status, _ = await self._request('POST', '/search', b'not json')
+        self.assertEqual(status, 'HTTP/1.1 400 Bad Request')
+        status, _ = await self._request('GET', '/missing')
+        self.assertEqual(status, 'HTTP/1.1 404 Not Found')
+        status, payload = await self._request('GET', '/health')
+        self.assertEqual(payload, {'status': 'ok'})
+
+    async def test_invalid_requests_do_not_fail_their_batch(self):
+        bodies = [{'query': 5}, {'query': "a", 'top_k': 0}, {'query': "b", 'top_k': -1}, {'query': "c", 'top_k': 2}]
+        responses = await asyncio.gather(*(
+            self._request('POST', '/search', json.dumps(body).encode()) for body in bodies
+        ))
+
+        self.assertEqual([status for status, _ in responses], ['HTTP/1.1 400 Bad Request'] * 3 + ['HTTP/1.1 200 OK'])
+        self.assertEqual([r['chunk'] for r in responses[3][1]['results']], ["c 0", "c 1"])
+
+    async def test_metrics_route(self):
+        metrics = Metrics()
+        server = QueryServer(MicroBatcher(self.system, max_wait_ms=5), port=0, metrics=metrics)
+        await server.start()
+        try:
+            await server.batcher.search("hello")
+            reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nConnection: close\r\n\r\n")
+            response = await reader.read()
+            writer.close()
+        finally:
+            await server.stop()
+
+        self.assertIn(b"Content-Type: text/plain", response)
+        self.assertIn(b"retrieval_server_requests 1\n", response)
+
+    async def test_servers_share_a_listening_socket(self):
+        # As after a fork, each server holds its own descriptor of one listening socket
+        with socket.create_server(('127.0.0.1', 0)) as sock:
+            port = sock.getsockname()[1]
+            servers = [QueryServer(MicroBatcher(self.system, max_wait_ms=5), sock=sock.dup()) for _ in range(2)]
+        for server in servers:
+            await server.start()
+        try:
+            self.assertEqual({server.port for server in servers}, {port})
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b"GET /health HTTP/1.1\r\nConnection: close\r\n\r\n")
+            response = await reader.read()
+            writer.close()
+        finally:
+            for server in servers:
+                await server.stop()
+
+        self.assertTrue(response.startswith(b"HTTP/1.1 200 OK"))
+
+    async def test_load_generator(self):
+        stats = await run_load(f"http://127.0.0.1:{self.server.port}", concurrency=16, requests=64)
+
+        self.assertEqual(stats['requests'], 64)
+        # 16 concurrent clients are served by far fewer than 64 search_many calls
+        self.assertLess(len(self.system.calls), 32)
+
+if __name__ == '__main__':
+    unittest.main()
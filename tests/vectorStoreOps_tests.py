@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from src.database import Database
+from src.vector_store import VectorStore
+
+class TestVectorStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'embeddings')
+        self.store = VectorStore(self.path, dim=2)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_append_and_view(self):
+        self.store.append([1, 2], np.array([[1.0, 2.0], [3.0, 4.0]]))
+        self.store.append([3], np.array([[5.0, 6.0]]))
+
+        reopened = VectorStore(self.path)
+        self.assertEqual(len(reopened), 3)
+        self.assertEqual(reopened.ids().tolist(), [1, 2, 3])
+        self.assertIsInstance(reopened.vectors(), np.memmap)
+        np.testing.assert_array_equal(reopened.vectors()[2], [5.0, 6.0])
+
+    def test_recovers_from_partial_append(self):
+        self.store.append([1], np.array([[1.0, 2.0]]))
+        with open(self.store.vectors_path, 'ab') as f:
+            f.write(np.array([9.0], dtype=np.float32).tobytes())
+
+        reopened = VectorStore(self.path)
+        self.assertEqual(len(reopened), 1)
+        self.assertEqual(os.path.getsize(reopened.vectors_path), 8)
+
+    def test_live_positions_prefer_latest_row(self):
+        self.store.append([1, 2, 3], np.array([[1.0, 0.0], [2.0, 0.0], [3.0, 0.0]]))
+        # Chunk 3 was deleted and its rowid reused; chunk 2 was deleted
+        self.store.append([3], np.array([[4.0, 0.0]]))
+
+        positions = self.store.live_positions(np.array([1, 3]))
+        self.assertEqual(positions.tolist(), [0, 3])
+        ids, vectors = next(self.store.iter_batches(positions, 10))
+        self.assertEqual(ids.tolist(), [1, 3])
+        self.assertEqual(vectors.dtype, np.float32)
+        self.assertEqual(self.store.check_consistency(np.array([1, 3, 5])), {'live': 2, 'missing': 1, 'stale': 2})
+
+        self.store.compact(np.array([1, 3]))
+        self.assertEqual(VectorStore(self.path).ids().tolist(), [1, 3])
+        np.testing.assert_array_equal(self.store.vectors(), [[1.0, 0.0], [4.0, 0.0]])
+
+    def test_float16_storage(self):
+        store = VectorStore(os.path.join(self.temp_dir.name, 'half'), dim=2, dtype='float16')
+        store.append([1], np.array([[0.5, 0.25]]))
+
+        self.assertEqual(VectorStore(store.path).vectors().dtype, np.float16)
+        self.assertEqual(os.path.getsize(store.vectors_path), 4)
+
+    def test_migrate_from_database(self):
+        db = Database(':memory:')
+        doc_id = db.add_document("test.txt", "content")
+        vectors = np.arange(6, dtype=np.float32).reshape(3, 2)
+        ids = db.add_chunks(doc_id, ["a", "b", "c"], [v.tobytes() for v in vectors])
+
+        self.store.migrate_from_database(db, batch_size=2)
+
+        self.assertEqual(self.store.ids().tolist(), ids)
+        np.testing.assert_array_equal(self.store.vectors(), vectors)
+        self.assertEqual(self.store.check_consistency(db.get_chunk_ids()), {'live': 3, 'missing': 0, 'stale': 0})
+        db.close()
+
+if __name__ == '__main__':
+    unittest.main()
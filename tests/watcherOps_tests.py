@@ -0,0 +1,99 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from src.watcher import DirectoryWatcher, _Inotify, scan_documents
+
+class TestScanDocuments(unittest.TestCase):
+    def test_names_are_relative_paths(self):
+        with tempfile.TemporaryDirectory() as root:
+            os.makedirs(os.path.join(root, 'a', 'b'))
+            for name in ('top.txt', 'a/mid.txt', 'a/b/deep.txt', 'a/notes.md'):
+                with open(os.path.join(root, name), 'w') as f:
+                    f.write("x")
+            self.assertEqual(sorted(name for name, _ in scan_documents(root)), ['a/b/deep.txt', 'a/mid.txt', 'top.txt'])
+            self.assertEqual([name for name, _ in scan_documents(root, 'a/b')], ['a/b/deep.txt'])
+
+class WatcherTests:
+    backend = None
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        os.makedirs(os.path.join(self.root, 'old'))
+        for name in ('keep.txt', 'edit.txt', 'gone.txt', 'old/moved.txt'):
+            self.write(name, name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, name: str, text: str):
+        with open(os.path.join(self.root, name), 'w') as f:
+            f.write(text)
+
+    def watch(self, change):
+        async def run():
+            watcher = DirectoryWatcher(self.root, debounce=0.3, poll_interval=0.05, backend=self.backend)
+            watcher.start()
+            try:
+                await asyncio.sleep(0.1)
+                await asyncio.get_running_loop().run_in_executor(None, change)
+                return await asyncio.wait_for(watcher.next_batch(), 10)
+            finally:
+                watcher.stop()
+
+        return asyncio.run(run())
+
+    def test_burst_of_changes_is_one_batch(self):
+        def change():
+            self.write('edit.txt', "edited, and longer")
+            self.write('new.txt', "new")
+            os.makedirs(os.path.join(self.root, 'sub'))
+            self.write('sub/nested.txt', "nested")
+            os.remove(os.path.join(self.root, 'gone.txt'))
+
+        changes = self.watch(change)
+        self.assertEqual(sorted(changes.changed), ['edit.txt', 'new.txt', 'sub/nested.txt'])
+        self.assertIn('gone.txt', changes.removed)
+
+    def test_renames(self):
+        def change():
+            os.rename(os.path.join(self.root, 'keep.txt'), os.path.join(self.root, 'renamed.txt'))
+            os.rename(os.path.join(self.root, 'old'), os.path.join(self.root, 'new'))
+
+        changes = self.watch(change)
+        self.assertEqual(sorted(changes.changed), ['new/moved.txt', 'renamed.txt'])
+        self.assertIn('keep.txt', changes.removed)
+        self.assertTrue({'old', 'old/moved.txt'} & set(changes.removed))
+
+    def test_created_and_deleted_within_a_batch_is_dropped(self):
+        def change():
+            self.write('brief.txt', "brief")
+            os.remove(os.path.join(self.root, 'brief.txt'))
+            self.write('edit.txt', "edited, and longer")
+
+        changes = self.watch(change)
+        self.assertEqual(list(changes.changed), ['edit.txt'])
+
+class TestPollingWatcher(WatcherTests, unittest.TestCase):
+    backend = 'poll'
+
+@unittest.skipUnless(_Inotify.available(), "inotify is not available")
+class TestInotifyWatcher(WatcherTests, unittest.TestCase):
+    backend = 'inotify'
+
+    def test_moved_away_directory_stops_reporting(self):
+        with tempfile.TemporaryDirectory() as outside:
+            def change():
+                os.rename(os.path.join(self.root, 'old'), os.path.join(outside, 'old'))
+
+            changes = self.watch(change)
+            self.assertEqual(changes.removed, ['old'])
+
+class TestDirectoryWatcher(unittest.TestCase):
+    def test_rejects_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            DirectoryWatcher('.', backend='fsevents')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import asyncio
+import concurrent.futures
+import unittest
+from src.worker import BackgroundWorker
+
+class TestBackgroundWorker(unittest.TestCase):
+    def setUp(self):
+        self.worker = BackgroundWorker()
+
+    def tearDown(self):
+        self.worker.stop()
+
+    def test_returns_results_and_exceptions(self):
+        async def fail():
+            raise ValueError("boom")
+
+        self.assertEqual(self.worker.submit(asyncio.sleep(0, 'done')).result(timeout=5), 'done')
+        with self.assertRaises(ValueError):
+            self.worker.submit(fail()).result(timeout=5)
+
+    def test_calls_share_one_loop(self):
+        async def current_loop():
+            return asyncio.get_running_loop()
+
+        first = self.worker.submit(current_loop()).result(timeout=5)
+        self.assertIs(self.worker.submit(current_loop()).result(timeout=5), first)
+
+    def test_cancel_completes_after_task_unwinds(self):
+        started = concurrent.futures.Future()
+        unwound = []
+
+        async def long_operation():
+            started.set_result(None)
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                await asyncio.sleep(0.05)
+                unwound.append(True)
+                raise
+
+        future = self.worker.submit(long_operation())
+        started.result(timeout=5)
+        self.assertTrue(future.request_cancel())
+        with self.assertRaises(concurrent.futures.CancelledError):
+            future.result(timeout=5)
+        self.assertEqual(unwound, [True])
+        self.assertFalse(future.request_cancel())
+        self.assertTrue(future.cancel())
+
+    def test_cancel_reports_a_task_that_finishes_anyway(self):
+        started = concurrent.futures.Future()
+
+        async def ignores_cancellation():
+            started.set_result(None)
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                return 'finished'
+
+        future = self.worker.submit(ignores_cancellation())
+        started.result(timeout=5)
+        self.assertFalse(future.cancel())
+        self.assertEqual(future.result(timeout=5), 'finished')
+        self.assertFalse(future.cancelled())
+
+    def test_stop_cancels_running_tasks(self):
+        future = self.worker.submit(asyncio.sleep(60))
+        self.worker.stop()
+        self.assertTrue(future.cancelled())
+
+if __name__ == '__main__':
+    unittest.main()
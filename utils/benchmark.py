@@ -0,0 +1,304 @@
+"""
+Offline benchmark of ingest, search, rebuild, index load and startup.
+
+Run from the repository root:
+    python -m utils.benchmark --config config/config.yaml --sizes 1000 10000 --k 1 10 100 --output bench.json
+
+Each corpus size gets a fresh synthetic document directory, database and
+index in a temporary directory; every other setting comes from --config. A
+deterministic hashing StubEmbedder stands in for the model, so no model
+download is needed and runs are comparable across commits. The JSON output
+records the git commit alongside the results.
+
+Startup is timed as a cold import of src.retrieval_system in a fresh
+interpreter plus constructing EmbeddingRetrievalSystem over the finished
+corpus with the real (lazily loaded) model. --max-startup-seconds makes the
+run exit non-zero when either corpus exceeds the budget, so it can guard
+against startup regressions.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from typing import Dict, List
+
+import numpy as np
+import yaml
+
+from src.chunking import count_words
+from src.config import Config
+from src.indexing import open_index
+from src.retrieval_system import EmbeddingRetrievalSystem
+
+WORDS = (
+    "index vector query chunk document embedding search model batch cache disk memory "
+    "thread process latency throughput score recall shard segment token sentence corpus "
+    "file store rebuild train cluster graph quantize float record table row column"
+).split()
+
+class StubEmbedder:
+    """
+    Drop-in for Embedder: each word hashes to a fixed random direction and a
+    text embeds as the normalized sum of its words, so texts that share words
+    score higher, as with a real model.
+    """
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+        self.model_name = 'stub'
+        self.is_loaded = True
+        self.max_seq_length = None
+        self._word_vectors = {}
+
+    def _word_vector(self, word: str) -> np.ndarray:
+        vector = self._word_vectors.get(word)
+        if vector is None:
+            vector = np.random.default_rng(zlib.crc32(word.encode('utf-8'))).standard_normal(self.dimension).astype(np.float32)
+            self._word_vectors[word] = vector
+        return vector
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                embeddings[row] += self._word_vector(word.strip('.,'))
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        return count_words(texts)
+
+    def warmup(self):
+        return None
+
+def generate_corpus(directory: str, num_documents: int, sentences_per_document: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    for i in range(num_documents):
+        sentences = [
+            ' '.join(rng.choice(WORDS, size=rng.integers(6, 16))).capitalize()
+            for _ in range(sentences_per_document)
+        ]
+        with open(os.path.join(directory, f"doc{i:07d}.txt"), 'w', encoding='utf-8') as f:
+            f.write('. '.join(sentences) + '.')
+
+def generate_queries(num_queries: int, seed: int = 1) -> List[str]:
+    rng = np.random.default_rng(seed)
+    return [' '.join(rng.choice(WORDS, size=rng.integers(2, 6))) for _ in range(num_queries)]
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'mean_ms': float(latencies.mean()),
+    }
+
+def current_rss() -> int:
+    """
+    Resident set size in bytes; falls back to the lifetime peak off Linux.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        scale = 1 if platform.system() == 'Darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+class PeakRSS:
+    """
+    Samples RSS on a background thread; peak_delta is the growth over the
+    RSS at entry.
+    """
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.baseline = self.peak = current_rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+    @property
+    def peak_delta(self) -> int:
+        return self.peak - self.baseline
+
+def _make_config(base: Dict, work_dir: str, overrides: Dict) -> Config:
+    settings = {
+        **base,
+        'documents_path': os.path.join(work_dir, 'docs'),
+        'db_path': os.path.join(work_dir, 'benchmark.db'),
+        'index_path': os.path.join(work_dir, 'faiss_index.bin'),
+        'processed_files_path': work_dir + os.sep,
+        'vector_store_path': os.path.join(work_dir, 'embeddings') if base.get('vector_store_path') else None,
+        'query_cache_size': 0,
+        'query_cache_path': None,
+        'metrics_path': None,
+        'encode_executor': 'thread',
+        'preload_model': False,
+        **overrides,
+    }
+    config_path = os.path.join(work_dir, 'config.yaml')
+    with open(config_path, 'w') as f:
+        yaml.safe_dump(settings, f)
+    return Config(config_path)
+
+async def _measure_search(system: EmbeddingRetrievalSystem, queries: List[str], ks: List[int]) -> Dict:
+    results = {}
+    for k in ks:
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            await system.search(query, top_k=k)
+            latencies.append(time.perf_counter() - start)
+        results[str(k)] = percentiles(latencies)
+    return results
+
+def _measure_import() -> float:
+    # A fresh interpreter, so modules imported by this process don't hide the cost
+    code = (
+        "import time; start = time.perf_counter(); import src.retrieval_system; "
+        "print(time.perf_counter() - start)"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+def _measure_startup(config: Config) -> Dict:
+    import_seconds = _measure_import()
+    start = time.perf_counter()
+    system = EmbeddingRetrievalSystem(config)
+    construct_seconds = time.perf_counter() - start
+    system.close()
+    return {
+        'import_seconds': import_seconds,
+        'construct_seconds': construct_seconds,
+        'seconds': import_seconds + construct_seconds,
+    }
+
+def benchmark_corpus(base: Dict, num_documents: int, ks: List[int], num_queries: int, dim: int,
+                     sentences_per_document: int) -> Dict:
+    with tempfile.TemporaryDirectory() as work_dir:
+        config = _make_config(base, work_dir, {'embedding_dim': dim})
+        os.makedirs(config.documents_path)
+        generate_corpus(config.documents_path, num_documents, sentences_per_document)
+        queries = generate_queries(num_queries)
+        result = {'documents': num_documents}
+
+        # The system prints per-file progress; keep it out of the timings' output
+        with contextlib.redirect_stdout(io.StringIO()):
+            system = EmbeddingRetrievalSystem(config, StubEmbedder(dim))
+            start = time.perf_counter()
+            asyncio.run(system.add_documents(config.documents_path))
+            elapsed = time.perf_counter() - start
+            chunks = system.db.count_chunks()
+            result['chunks'] = chunks
+            result['ingest'] = {'seconds': elapsed, 'chunks_per_second': chunks / elapsed}
+
+            result['search'] = asyncio.run(_measure_search(system, queries, ks))
+
+            with PeakRSS() as rss:
+                start = time.perf_counter()
+                asyncio.run(system.rebuild_index())
+                elapsed = time.perf_counter() - start
+            result['rebuild'] = {'seconds': elapsed, 'peak_rss_delta_bytes': rss.peak_delta}
+            system.close()
+
+            result['startup'] = _measure_startup(config)
+
+            result['index_load'] = {}
+            for mode, mmap in (('read', False), ('mmap', True)):
+                start = time.perf_counter()
+                open_index(None, config.index_path, system._index_params(), mmap=mmap)
+                result['index_load'][f"{mode}_seconds"] = time.perf_counter() - start
+            result['index_bytes'] = os.path.getsize(config.index_path)
+        return result
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(config_path: str, sizes: List[int], ks: List[int], num_queries: int, dim: int,
+                  sentences_per_document: int) -> Dict:
+    with open(config_path, 'r') as f:
+        base = yaml.safe_load(f)
+    return {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'settings': {
+            'index': base.get('index', {'type': 'flat'}),
+            'embedding_precision': base.get('embedding_precision', 'float32'),
+            'chunk_size': base['chunk_size'],
+            'chunk_tokens': base.get('chunk_tokens'),
+            'encode_sort_batches': base.get('encode_sort_batches', 8),
+            'batch_size': base['batch_size'],
+            'dim': dim,
+            'queries': num_queries,
+            'sentences_per_document': sentences_per_document,
+        },
+        'results': [
+            benchmark_corpus(base, size, ks, num_queries, dim, sentences_per_document)
+            for size in sizes
+        ],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingest, search, rebuild and index load with a stub embedder")
+    parser.add_argument('--config', default='config/config.yaml')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help="documents per corpus")
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--sentences', type=int, default=20, help="sentences per document")
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--max-startup-seconds', type=float, default=None,
+                        help="exit with status 1 if import plus construction takes longer than this")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.config, args.sizes, args.k, args.queries, args.dim, args.sentences)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for result in report['results']:
+        search = ', '.join(f"k={k} p50 {s['p50_ms']:.2f}/p99 {s['p99_ms']:.2f} ms" for k, s in result['search'].items())
+        print(
+            f"{result['documents']} docs / {result['chunks']} chunks: ingest {result['ingest']['chunks_per_second']:.0f} chunks/s; "
+            f"{search}; rebuild {result['rebuild']['seconds']:.2f}s (+{result['rebuild']['peak_rss_delta_bytes'] / 2**20:.0f} MB); "
+            f"index load {result['index_load']['read_seconds'] * 1000:.1f} ms read, {result['index_load']['mmap_seconds'] * 1000:.1f} ms mmap; "
+            f"startup {result['startup']['import_seconds'] * 1000:.0f} ms import + {result['startup']['construct_seconds'] * 1000:.0f} ms construct"
+        )
+    print(f"Wrote {args.output}")
+    if args.max_startup_seconds is not None:
+        slow = [r for r in report['results'] if r['startup']['seconds'] > args.max_startup_seconds]
+        for result in slow:
+            print(f"Startup over budget for {result['documents']} docs: {result['startup']['seconds']:.2f}s > {args.max_startup_seconds:.2f}s")
+        if slow:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
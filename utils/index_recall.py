@@ -0,0 +1,104 @@
+"""
+Recall@k report for the configured approximate index against exact search.
+
+Run from the repository root:
+    python -m utils.index_recall --config config/config.yaml --k 10 --queries 1000
+
+Queries are a random sample of stored chunk embeddings. The approximate index
+is built the same way rebuild_index builds it, then swept over nprobe (IVF
+types) or efSearch (HNSW) so a latency/recall operating point can be chosen.
+"""
+import argparse
+import sqlite3
+import time
+from typing import Dict, List
+
+import faiss
+import numpy as np
+
+from src.config import Config
+from src.indexing import FAISSIndex
+from src.quantization import decode_embeddings
+from src.vector_store import VectorStore
+
+SWEEP_VALUES = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+
+def load_embeddings(db_path: str, vector_store_path: str = None, dim: int = None):
+    conn = sqlite3.connect(db_path)
+    if vector_store_path:
+        # Read the memory-mapped store instead of every BLOB
+        live_ids = np.array([row[0] for row in conn.execute('SELECT id FROM chunks')], dtype=np.int64)
+        conn.close()
+        store = VectorStore(vector_store_path)
+        positions = store.live_positions(live_ids)
+        return np.asarray(store.ids()[positions]), store.rows(positions)
+    rows = conn.execute('SELECT id, embedding FROM chunks').fetchall()
+    conn.close()
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    vectors = decode_embeddings([row[1] for row in rows], dim)
+    return ids, vectors
+
+def recall_at_k(approx_ids: np.ndarray, exact_ids: np.ndarray) -> float:
+    """
+    Mean fraction of the exact top-k ids that the approximate search also returned.
+    """
+    k = exact_ids.shape[1]
+    hits = sum(len(set(a[a >= 0]) & set(e[e >= 0])) for a, e in zip(approx_ids, exact_ids))
+    return hits / (len(exact_ids) * k)
+
+def recall_report(params: Dict, ids: np.ndarray, vectors: np.ndarray, num_queries: int, k: int) -> List[Dict]:
+    dim = vectors.shape[1]
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)]
+
+    exact = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    exact.add_with_ids(vectors, ids)
+    start = time.perf_counter()
+    _, exact_ids = exact.search(queries, k)
+    flat_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    index = FAISSIndex(dim, params=params)
+    if not index.is_trained:
+        sample = vectors[rng.choice(len(vectors), size=min(index.params['train_sample_size'], len(vectors)), replace=False)]
+        index.train(sample)
+    index.add(vectors, ids)
+
+    index_type = index.params['type']
+    if index_type == 'hnsw':
+        knob, values = 'efSearch', [v for v in SWEEP_VALUES if v >= k]
+    elif index_type in ('ivf', 'ivfpq', 'opq'):
+        knob, values = 'nprobe', [v for v in SWEEP_VALUES if v <= index.params['nlist']]
+    else:
+        knob, values = None, [None]
+
+    report = [{'setting': 'flat', 'recall': 1.0, 'ms_per_query': flat_ms}]
+    for value in values:
+        if knob:
+            index.set_search_params(**{knob: value})
+        start = time.perf_counter()
+        _, approx_ids = index.search(queries, k)
+        elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        report.append({
+            'setting': f"{index_type} {knob}={value}" if knob else index_type,
+            'recall': recall_at_k(approx_ids, exact_ids),
+            'ms_per_query': elapsed_ms,
+        })
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k of the configured index versus exact search")
+    parser.add_argument('--config', default='config/config.yaml')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--dim', type=int, default=None, help="embedding dimension; required for float16/int8 BLOBs")
+    args = parser.parse_args()
+
+    config = Config(args.config)
+    ids, vectors = load_embeddings(config.db_path, config.vector_store_path, args.dim)
+    params = {**config.index_params, 'precision': config.embedding_precision}
+    print(f"{len(ids)} vectors, {min(args.queries, len(ids))} queries, k={args.k}")
+    for row in recall_report(params, ids, vectors, args.queries, args.k):
+        print(f"{row['setting']:<28} recall@{args.k}={row['recall']:.4f}  {row['ms_per_query']:.3f} ms/query")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Load generator for the query service in src/server.py.
+
+Run from the repository root against a running server:
+    python -m utils.load_test --url http://127.0.0.1:8000 --concurrency 64 --requests 5000
+
+Each client keeps one HTTP/1.1 connection open and sends /search requests
+back to back. Throughput and latency percentiles are printed at the end.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List
+from urllib.parse import urlparse
+
+DEFAULT_QUERIES = [
+    "how is the index rebuilt",
+    "what is stored in the database",
+    "inner product similarity",
+    "document chunking strategy",
+    "embedding model",
+    "batch size configuration",
+]
+
+async def _client(host: str, port: int, queries: List[str], top_k: int, count: int, latencies: List[float]):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(count):
+            body = json.dumps({'query': random.choice(queries), 'top_k': top_k}).encode('utf-8')
+            start = time.perf_counter()
+            writer.write(
+                f"POST /search HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+            status = await reader.readline()
+            content_length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    content_length = int(value)
+            await reader.readexactly(content_length)
+            if b' 200 ' not in status:
+                raise RuntimeError(f"Request failed: {status.decode('latin-1').strip()}")
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+async def run_load(url: str, concurrency: int, requests: int, top_k: int = 3, queries: List[str] = None) -> Dict[str, float]:
+    parsed = urlparse(url)
+    queries = queries or DEFAULT_QUERIES
+    latencies = []
+    per_client = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _client(parsed.hostname, parsed.port or 80, queries, top_k, count, latencies)
+        for count in per_client if count
+    ))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+
+    return {
+        'requests': len(latencies),
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent /search load against the query service")
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--queries-file', default=None, help="one query per line; defaults to a built-in set")
+    args = parser.parse_args()
+
+    queries = None
+    if args.queries_file:
+        with open(args.queries_file, 'r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+    stats = asyncio.run(run_load(args.url, args.concurrency, args.requests, args.top_k, queries))
+    print(
+        f"{stats['requests']} requests in {stats['seconds']:.2f}s: {stats['requests_per_second']:.0f} req/s, "
+        f"p50 {stats['p50_ms']:.1f} ms, p95 {stats['p95_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms"
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Recall and score drift of reduced-precision embeddings against float32.
+
+Run from the repository root on a database whose embeddings were stored as float32:
+    python -m utils.precision_report --config config/config.yaml --k 10 --queries 1000
+
+For each precision the stored vectors are round-tripped through the BLOB
+encoding and indexed with the matching scalar-quantized flat index. The report
+gives bytes per vector on disk and in the index, recall@k against exact float32
+search, and the mean absolute error of the returned scores.
+"""
+import argparse
+from typing import Dict, List
+
+import faiss
+import numpy as np
+
+from src.config import Config
+from src.indexing import FAISSIndex
+from src.quantization import PRECISION_DTYPES, decode_embeddings, encode_embeddings
+from utils.index_recall import load_embeddings, recall_at_k
+
+def precision_report(ids: np.ndarray, vectors: np.ndarray, num_queries: int, k: int) -> List[Dict]:
+    dim = vectors.shape[1]
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)]
+
+    exact = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    exact.add_with_ids(vectors, ids)
+    _, exact_ids = exact.search(queries, k)
+    order = np.argsort(ids)
+
+    report = []
+    for precision in PRECISION_DTYPES:
+        stored = decode_embeddings(encode_embeddings(vectors, precision), dim)
+        index = FAISSIndex(dim, params={'type': 'flat', 'precision': precision})
+        if not index.is_trained:
+            index.train(stored)
+        index.add(stored, ids)
+        scores, approx_ids = index.search(queries, k)
+
+        valid = approx_ids >= 0
+        rows = order[np.searchsorted(ids, np.where(valid, approx_ids, ids[order[0]]), sorter=order)]
+        true_scores = np.einsum('qd,qkd->qk', queries, vectors[rows])
+        report.append({
+            'precision': precision,
+            'blob_bytes': dim * np.dtype(PRECISION_DTYPES[precision]).itemsize,
+            'index_bytes': len(faiss.serialize_index(index.index)) / max(len(ids), 1),
+            'recall': recall_at_k(approx_ids, exact_ids),
+            'score_mae': float(np.abs(scores - true_scores)[valid].mean()),
+            'max_roundtrip_error': float(np.abs(stored - vectors).max()),
+        })
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall and score drift of float16/int8 storage versus float32")
+    parser.add_argument('--config', default='config/config.yaml')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=1000)
+    args = parser.parse_args()
+
+    config = Config(args.config)
+    ids, vectors = load_embeddings(config.db_path)
+    print(f"{len(ids)} vectors of dimension {vectors.shape[1]}, {min(args.queries, len(ids))} queries, k={args.k}")
+    for row in precision_report(ids, vectors, args.queries, args.k):
+        print(
+            f"{row['precision']:<8} {row['blob_bytes']:>5} B/blob  {row['index_bytes']:>8.1f} B/vector in index  "
+            f"recall@{args.k}={row['recall']:.4f}  score MAE={row['score_mae']:.5f}  "
+            f"max round-trip error={row['max_roundtrip_error']:.5f}"
+        )
+
+if __name__ == '__main__':
+    main()
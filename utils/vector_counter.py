@@ -1,5 +1,20 @@
+"""
+Corpus, storage and runtime statistics.
+
+Run from the repository root:
+    python -m utils.vector_counter --config config/config.yaml [--json]
+
+Reports document and chunk counts, the sizes of the database, index and vector
+store, and the latest metrics snapshot written to metrics_path (stage latency
+percentiles, counters and gauges).
+"""
+import argparse
+import json
+import os
 import sqlite3
-from typing import Tuple
+from typing import Dict, Tuple
+
+from src.config import Config
 
 class VectorCounter:
     def __init__(self, db_path: str):
@@ -46,4 +61,67 @@ class VectorCounter:
         return estimated_total_chunks
 
     def close(self):
-        self.conn.close()
\ No newline at end of file
+        self.conn.close()
+
+def _file_size(path: str) -> int:
+    return os.path.getsize(path) if path and os.path.exists(path) else 0
+
+def collect_stats(config: Config) -> Dict:
+    counter = VectorCounter(config.db_path)
+    doc_count, chunk_count = counter.count_vectors()
+    counter.close()
+    stats = {
+        'documents': doc_count,
+        'chunks': chunk_count,
+        'db_bytes': _file_size(config.db_path),
+        'index_bytes': _file_size(config.index_path),
+    }
+    if config.index_path and os.path.exists(config.index_path):
+        from src.indexing import open_index
+        index = open_index(index_path=config.index_path, params=config.index_params, mmap=True)
+        stats['index_vectors'] = index.ntotal
+        stats['index_segments'] = index.num_segments
+    if config.vector_store_path and os.path.exists(config.vector_store_path + '.meta.json'):
+        from src.vector_store import VectorStore
+        store = VectorStore(config.vector_store_path)
+        stats['vector_store_rows'] = len(store)
+        stats['vector_store_bytes'] = _file_size(store.vectors_path) + _file_size(store.ids_path)
+    if config.metrics_path and os.path.exists(config.metrics_path):
+        with open(config.metrics_path, 'r') as f:
+            stats['metrics'] = json.load(f)
+    return stats
+
+def format_stats(stats: Dict) -> str:
+    lines = [
+        f"Documents: {stats['documents']}",
+        f"Chunks: {stats['chunks']}",
+        f"Database: {stats['db_bytes'] / 2**20:.1f} MB",
+        f"Index: {stats.get('index_vectors', 0)} vectors, {stats['index_bytes'] / 2**20:.1f} MB, {stats.get('index_segments', 0)} delta segments",
+    ]
+    if 'vector_store_rows' in stats:
+        lines.append(f"Vector store: {stats['vector_store_rows']} rows, {stats['vector_store_bytes'] / 2**20:.1f} MB")
+    metrics = stats.get('metrics')
+    if metrics:
+        lines.append("Counters:")
+        lines.extend(f"  {name}: {value:g}" for name, value in sorted(metrics['counters'].items()))
+        lines.append("Gauges:")
+        lines.extend(f"  {name}: {value:g}" for name, value in sorted(metrics['gauges'].items()))
+        lines.append("Latency (ms):")
+        for name, summary in sorted(metrics['histograms'].items()):
+            lines.append(
+                f"  {name}: n={summary['count']} mean {summary['mean'] * 1000:.2f} "
+                f"p50 {summary['p50'] * 1000:.2f} p95 {summary['p95'] * 1000:.2f} p99 {summary['p99'] * 1000:.2f}"
+            )
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Report corpus, storage and metrics statistics")
+    parser.add_argument('--config', default='config/config.yaml')
+    parser.add_argument('--json', action='store_true', help="print the raw statistics as JSON")
+    args = parser.parse_args()
+
+    stats = collect_stats(Config(args.config))
+    print(json.dumps(stats, indent=2) if args.json else format_stats(stats))
+
+if __name__ == '__main__':
+    main()